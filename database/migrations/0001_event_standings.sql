@@ -0,0 +1,135 @@
+-- Migration 0001: materialized event standings
+--
+-- Adds the eventStandings table maintained by triggers, fills it from the
+-- stored matches and makes standings() read it.
+-- Run it once on an existing tournament database:
+--   psql tournament -f database/migrations/0001_event_standings.sql
+
+BEGIN;
+
+-- Table Event Standings keeps the points and number of matches of every
+-- player in an event, so standings are read instead of being computed.
+-- It is maintained by triggers on playersInEvent and matches
+CREATE TABLE eventStandings (
+	event INTEGER REFERENCES events(id),
+	player INTEGER REFERENCES players(id),
+	points DOUBLE PRECISION NOT NULL DEFAULT 0,
+	matches BIGINT NOT NULL DEFAULT 0,
+	PRIMARY KEY(event, player)
+);
+
+
+INSERT INTO eventStandings (event, player, points, matches)
+SELECT playersInEvent.event, playersInEvent.player,
+	COALESCE(SUM(CASE WHEN matches.player_one = playersInEvent.player
+			THEN matches.player_one_score
+			ELSE matches.player_two_score END), 0),
+	COUNT(matches.id)
+FROM playersInEvent LEFT JOIN matches
+	ON matches.event = playersInEvent.event AND
+		(matches.player_one = playersInEvent.player OR
+		 matches.player_two = playersInEvent.player)
+GROUP BY playersInEvent.event, playersInEvent.player;
+
+
+-- Function: Computed Standings
+-- It has aggregation functions to determine:
+-- number of matches and total points earned in that matches
+-- It is the former standings() computation, kept to check eventStandings
+CREATE OR REPLACE FUNCTION computedStandings(currentEvent INTEGER)
+RETURNS TABLE(
+	id INTEGER,
+	name TEXT,
+	points DOUBLE PRECISION,
+	matches BIGINT 
+) AS $func$
+SELECT id, name, SUM(matchesByPlayers.score) AS points,
+		COUNT(matchesByPlayers.match) AS matches
+        FROM matchesByPlayersInEvent(currentEvent) as matchesByPlayers
+        GROUP BY id, name 
+        ORDER BY points DESC, name ASC;
+$func$  LANGUAGE sql;
+
+
+-- Function: Standings
+-- It reads the points and number of matches maintained in eventStandings
+CREATE OR REPLACE FUNCTION standings(currentEvent INTEGER)
+RETURNS TABLE(
+	id INTEGER,
+	name TEXT,
+	points DOUBLE PRECISION,
+	matches BIGINT 
+) AS $func$
+SELECT players.id, (firstname || ' ' || lastname) as name,
+		eventStandings.points, eventStandings.matches
+        FROM eventStandings JOIN players
+        ON players.id = eventStandings.player
+        WHERE eventStandings.event = currentEvent
+        ORDER BY points DESC, name ASC;
+$func$  LANGUAGE sql;
+        
+        
+-- Trigger: Players In Event Standings
+-- Adds a row in eventStandings when a player joins an event, with the
+-- matches already stored for that player, and removes it when he or she
+-- leaves the event
+CREATE OR REPLACE FUNCTION playersInEventStandings()
+RETURNS trigger AS $func$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		INSERT INTO eventStandings (event, player, points, matches)
+		SELECT NEW.event, NEW.player,
+			COALESCE(SUM(CASE WHEN player_one = NEW.player
+					THEN player_one_score
+					ELSE player_two_score END), 0),
+			COUNT(id)
+		FROM matches WHERE event = NEW.event AND
+			(player_one = NEW.player OR player_two = NEW.player);
+		RETURN NEW;
+	END IF;
+	DELETE FROM eventStandings
+		WHERE event = OLD.event AND player = OLD.player;
+	RETURN OLD;
+END;
+$func$  LANGUAGE plpgsql;
+
+CREATE TRIGGER playersInEventStandings
+	AFTER INSERT OR DELETE ON playersInEvent
+	FOR EACH ROW EXECUTE PROCEDURE playersInEventStandings();
+
+
+-- Trigger: Matches Standings
+-- Keeps eventStandings up to date in the same transaction that inserts,
+-- updates or deletes a match
+CREATE OR REPLACE FUNCTION matchesStandings()
+RETURNS trigger AS $func$
+BEGIN
+	IF TG_OP IN ('UPDATE', 'DELETE') THEN
+		UPDATE eventStandings
+			SET points = points - COALESCE(OLD.player_one_score, 0),
+				matches = matches - 1
+			WHERE event = OLD.event AND player = OLD.player_one;
+		UPDATE eventStandings
+			SET points = points - COALESCE(OLD.player_two_score, 0),
+				matches = matches - 1
+			WHERE event = OLD.event AND player = OLD.player_two;
+	END IF;
+	IF TG_OP IN ('INSERT', 'UPDATE') THEN
+		UPDATE eventStandings
+			SET points = points + COALESCE(NEW.player_one_score, 0),
+				matches = matches + 1
+			WHERE event = NEW.event AND player = NEW.player_one;
+		UPDATE eventStandings
+			SET points = points + COALESCE(NEW.player_two_score, 0),
+				matches = matches + 1
+			WHERE event = NEW.event AND player = NEW.player_two;
+	END IF;
+	RETURN NULL;
+END;
+$func$  LANGUAGE plpgsql;
+
+CREATE TRIGGER matchesStandings
+	AFTER INSERT OR UPDATE OR DELETE ON matches
+	FOR EACH ROW EXECUTE PROCEDURE matchesStandings();
+
+COMMIT;
@@ -0,0 +1,121 @@
+-- Migration 0002: event-scoped indexes and functions
+--
+-- Adds composite indexes for the hot queries on matches, pairings and
+-- playersInEvent, and makes matchesByPlayersInEvent and opponents only
+-- look at the matches of the requested event.
+-- The indexes are built without locking writes, so it can run on a live
+-- database (outside of a transaction block):
+--   psql tournament -f database/migrations/0002_event_indexes.sql
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS matchesEventPlayerOne
+	ON matches (event, player_one, player_two);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS matchesEventPlayerTwo
+	ON matches (event, player_two, player_one);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS pairingsEventRound
+	ON pairings (event, round_number);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS playersInEventPlayer
+	ON playersInEvent (player);
+
+BEGIN;
+
+-- Function: Active Players In Event
+-- determines which players are in the current event
+-- and puts togther the full name
+CREATE OR REPLACE FUNCTION activePlayersInEvent(currentEvent INTEGER)
+RETURNS TABLE(
+	id INTEGER,
+	name TEXT
+) AS $func$
+SELECT players.id, (firstname || ' ' || lastname) as name 
+        FROM players, playersInEvent WHERE event=currentEvent 
+        AND players.id=playersInEvent.player;
+$func$  LANGUAGE sql STABLE;
+
+
+-- Function: Matches by players in the current event
+-- It performs a left join between the active players in the curren event
+-- and their matches in that event, taken once as player one and once as
+-- player two so each side can use its index
+-- For every match we select the right score deppending of the player order
+-- in that match, if None we set it to zero
+CREATE OR REPLACE FUNCTION matchesByPlayersInEvent(currentEvent INTEGER)
+RETURNS TABLE(
+	id INTEGER,
+	name TEXT,
+	score DOUBLE PRECISION,
+	match INTEGER
+) AS $func$
+SELECT activePlayers.id, activePlayers.name, 
+	COALESCE(eventMatches.score, 0.0) as score,
+	eventMatches.match
+	FROM activePlayersInEvent(currentEvent) as activePlayers
+	LEFT JOIN (
+		SELECT player_one AS player, player_one_score AS score, id AS match
+			FROM matches WHERE event = currentEvent
+		UNION ALL
+		SELECT player_two AS player, player_two_score AS score, id AS match
+			FROM matches WHERE event = currentEvent
+	) AS eventMatches ON activePlayers.id = eventMatches.player
+$func$  LANGUAGE sql STABLE;
+
+
+-- Function: Computed Standings
+-- It has aggregation functions to determine:
+-- number of matches and total points earned in that matches
+-- It is the former standings() computation, kept to check eventStandings
+CREATE OR REPLACE FUNCTION computedStandings(currentEvent INTEGER)
+RETURNS TABLE(
+	id INTEGER,
+	name TEXT,
+	points DOUBLE PRECISION,
+	matches BIGINT 
+) AS $func$
+SELECT id, name, SUM(matchesByPlayers.score) AS points,
+		COUNT(matchesByPlayers.match) AS matches
+        FROM matchesByPlayersInEvent(currentEvent) as matchesByPlayers
+        GROUP BY id, name 
+        ORDER BY points DESC, name ASC;
+$func$  LANGUAGE sql STABLE;
+
+
+-- Function: Standings
+-- It reads the points and number of matches maintained in eventStandings
+CREATE OR REPLACE FUNCTION standings(currentEvent INTEGER)
+RETURNS TABLE(
+	id INTEGER,
+	name TEXT,
+	points DOUBLE PRECISION,
+	matches BIGINT 
+) AS $func$
+SELECT players.id, (firstname || ' ' || lastname) as name,
+		eventStandings.points, eventStandings.matches
+        FROM eventStandings JOIN players
+        ON players.id = eventStandings.player
+        WHERE eventStandings.event = currentEvent
+        ORDER BY points DESC, name ASC;
+$func$  LANGUAGE sql STABLE;
+        
+        
+-- Function: Opponents
+-- Opponents from a specific player in the current event
+CREATE OR REPLACE FUNCTION opponents(currentEvent INTEGER, playerId INTEGER)
+RETURNS TABLE(
+	id INTEGER,
+	name TEXT
+) AS $func$
+SELECT opps.opponent_id as id, ap.name
+FROM activePlayersInEvent(currentEvent) as ap JOIN (
+	SELECT player_two AS opponent_id FROM matches
+		WHERE event = currentEvent AND player_one = playerId
+	UNION ALL
+	SELECT player_one AS opponent_id FROM matches
+		WHERE event = currentEvent AND player_two = playerId
+) AS opps ON ap.id = opps.opponent_id;
+$func$  LANGUAGE sql STABLE;
+
+
+COMMIT;
+
+ANALYZE matches;
+ANALYZE pairings;
+ANALYZE playersInEvent;
@@ -0,0 +1,69 @@
+-- Migration 0003: per-round standings snapshots
+--
+-- Adds the standingsSnapshots table and the functions that fill and read
+-- it. Snapshots of the rounds already played are taken afterwards with:
+--   python tournament_admin.py backfill-snapshots
+-- Run it once on an existing tournament database:
+--   psql tournament -f database/migrations/0003_standings_snapshots.sql
+
+BEGIN;
+
+-- Table Standings Snapshots keeps the points and number of matches of every
+-- player at the end of each finalized round, so the standings of a past
+-- round are read instead of being replayed from the matches
+CREATE TABLE standingsSnapshots (
+	event INTEGER REFERENCES events(id),
+	round_number INTEGER,
+	player INTEGER REFERENCES players(id),
+	points DOUBLE PRECISION NOT NULL,
+	matches BIGINT NOT NULL,
+	PRIMARY KEY(event, round_number, player)
+);
+
+
+-- Function: Computed Round Standings
+-- Points and number of matches of every player in the event counting only
+-- the matches played up to a round, used to take the snapshots
+CREATE OR REPLACE FUNCTION computedRoundStandings(currentEvent INTEGER,
+		currentRound INTEGER)
+RETURNS TABLE(
+	player INTEGER,
+	points DOUBLE PRECISION,
+	matches BIGINT
+) AS $func$
+SELECT playersInEvent.player, COALESCE(SUM(roundMatches.score), 0.0),
+		COUNT(roundMatches.score)
+	FROM playersInEvent LEFT JOIN (
+		SELECT player_one AS player, player_one_score AS score
+			FROM matches
+			WHERE event = currentEvent AND round_number <= currentRound
+		UNION ALL
+		SELECT player_two AS player, player_two_score AS score
+			FROM matches
+			WHERE event = currentEvent AND round_number <= currentRound
+	) AS roundMatches ON roundMatches.player = playersInEvent.player
+	WHERE playersInEvent.event = currentEvent
+	GROUP BY playersInEvent.player;
+$func$  LANGUAGE sql STABLE;
+
+
+-- Function: Round Standings
+-- It reads the standings snapshot taken at the end of a round
+CREATE OR REPLACE FUNCTION roundStandings(currentEvent INTEGER,
+		currentRound INTEGER)
+RETURNS TABLE(
+	id INTEGER,
+	name TEXT,
+	points DOUBLE PRECISION,
+	matches BIGINT
+) AS $func$
+SELECT players.id, (firstname || ' ' || lastname) as name,
+		standingsSnapshots.points, standingsSnapshots.matches
+        FROM standingsSnapshots JOIN players
+        ON players.id = standingsSnapshots.player
+        WHERE standingsSnapshots.event = currentEvent AND
+        	standingsSnapshots.round_number = currentRound
+        ORDER BY points DESC, name ASC;
+$func$  LANGUAGE sql STABLE;
+
+COMMIT;
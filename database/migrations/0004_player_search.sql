@@ -0,0 +1,20 @@
+-- Migration 0004: indexed player search
+--
+-- Adds the pg_trgm extension and the indexes used by find_player,
+-- lookup_player and search_players. The indexes are built without locking
+-- writes, so it can run on a live database (outside of a transaction
+-- block):
+--   psql tournament -f database/migrations/0004_player_search.sql
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS playersFirstnameLastname
+	ON players (firstname, lastname);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS playersLowerName
+	ON players (lower(firstname || ' ' || lastname) text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS playersLowerLastname
+	ON players (lower(lastname) text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS playersNameTrigram
+	ON players USING gin (lower(firstname || ' ' || lastname) gin_trgm_ops);
+
+ANALYZE players;
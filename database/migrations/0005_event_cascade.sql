@@ -0,0 +1,45 @@
+-- Migration 0005: cascading event deletes and archive tables
+--
+-- Every table referencing events deletes its rows with the event, and the
+-- archive schema receives the events moved by
+-- purge_events(..., archive=True). The new foreign keys are added NOT
+-- VALID and validated afterwards, so existing rows are checked without
+-- blocking writes.
+-- Run it once on an existing tournament database:
+--   psql tournament -f database/migrations/0005_event_cascade.sql
+
+BEGIN;
+
+ALTER TABLE playersInEvent DROP CONSTRAINT playersinevent_event_fkey,
+	ADD CONSTRAINT playersinevent_event_fkey FOREIGN KEY (event)
+	REFERENCES events(id) ON DELETE CASCADE NOT VALID;
+ALTER TABLE matches DROP CONSTRAINT matches_event_fkey,
+	ADD CONSTRAINT matches_event_fkey FOREIGN KEY (event)
+	REFERENCES events(id) ON DELETE CASCADE NOT VALID;
+ALTER TABLE pairings DROP CONSTRAINT pairings_event_fkey,
+	ADD CONSTRAINT pairings_event_fkey FOREIGN KEY (event)
+	REFERENCES events(id) ON DELETE CASCADE NOT VALID;
+ALTER TABLE eventStandings DROP CONSTRAINT eventstandings_event_fkey,
+	ADD CONSTRAINT eventstandings_event_fkey FOREIGN KEY (event)
+	REFERENCES events(id) ON DELETE CASCADE NOT VALID;
+ALTER TABLE standingsSnapshots DROP CONSTRAINT standingssnapshots_event_fkey,
+	ADD CONSTRAINT standingssnapshots_event_fkey FOREIGN KEY (event)
+	REFERENCES events(id) ON DELETE CASCADE NOT VALID;
+
+CREATE SCHEMA archive;
+CREATE TABLE archive.events (LIKE events);
+CREATE TABLE archive.playersInEvent (LIKE playersInEvent);
+CREATE TABLE archive.matches (LIKE matches);
+CREATE TABLE archive.pairings (LIKE pairings);
+CREATE TABLE archive.eventStandings (LIKE eventStandings);
+CREATE TABLE archive.standingsSnapshots (LIKE standingsSnapshots);
+CREATE INDEX archiveMatchesEvent ON archive.matches (event);
+CREATE INDEX archivePairingsEvent ON archive.pairings (event);
+
+COMMIT;
+
+ALTER TABLE playersInEvent VALIDATE CONSTRAINT playersinevent_event_fkey;
+ALTER TABLE matches VALIDATE CONSTRAINT matches_event_fkey;
+ALTER TABLE pairings VALIDATE CONSTRAINT pairings_event_fkey;
+ALTER TABLE eventStandings VALIDATE CONSTRAINT eventstandings_event_fkey;
+ALTER TABLE standingsSnapshots VALIDATE CONSTRAINT standingssnapshots_event_fkey;
@@ -0,0 +1,121 @@
+-- Migration 0006: matches and pairings partitioned by event
+--
+-- matches and pairings become partitioned tables, split in ranges of
+-- eventPartitionSize() consecutive events, so the queries of an event only
+-- read its partition whatever the size of the history. The partitions of
+-- the next events are created ahead of time, see
+-- createEventPartitionsAhead. Requires PostgreSQL 11 or higher.
+-- The rows are copied while both tables are locked, so run it during a
+-- maintenance window:
+--   psql tournament -f database/migrations/0006_partition_by_event.sql
+
+BEGIN;
+
+LOCK TABLE matches, pairings IN ACCESS EXCLUSIVE MODE;
+
+-- The old tables are kept until their rows are copied; their sequences
+-- are reused so the ids go on from where they were
+ALTER TABLE matches RENAME TO matchesUnpartitioned;
+ALTER INDEX matches_pkey RENAME TO matchesUnpartitioned_pkey;
+ALTER SEQUENCE matches_id_seq OWNED BY NONE;
+ALTER TABLE pairings RENAME TO pairingsUnpartitioned;
+ALTER INDEX pairings_pkey RENAME TO pairingsUnpartitioned_pkey;
+ALTER SEQUENCE pairings_id_seq OWNED BY NONE;
+
+CREATE TABLE matches (
+	player_one INTEGER REFERENCES players(id),
+	player_two INTEGER REFERENCES players(id),
+	player_one_score DOUBLE PRECISION,
+	player_two_score DOUBLE PRECISION,
+	event INTEGER NOT NULL REFERENCES events(id) ON DELETE CASCADE,
+	round_number INTEGER,
+	id INTEGER NOT NULL DEFAULT nextval('matches_id_seq'),
+	PRIMARY KEY(event, id)
+) PARTITION BY RANGE (event);
+
+CREATE TABLE pairings (
+	id1 INTEGER REFERENCES players(id),
+	name1  TEXT,
+	points1 DOUBLE PRECISION,
+	id2 INTEGER REFERENCES players(id),
+	name2 TEXT,
+	points2 DOUBLE PRECISION,
+	event INTEGER NOT NULL REFERENCES events(id) ON DELETE CASCADE,
+	round_number INTEGER,
+	id INTEGER NOT NULL DEFAULT nextval('pairings_id_seq'),
+	PRIMARY KEY(event, id)
+) PARTITION BY RANGE (event);
+
+CREATE OR REPLACE FUNCTION eventPartitionSize()
+RETURNS INTEGER AS $func$
+SELECT 100;
+$func$  LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION createEventPartitions(eventId INTEGER)
+RETURNS INTEGER AS $func$
+DECLARE
+	firstEvent INTEGER := eventId - eventId % eventPartitionSize();
+	tableName TEXT;
+	partitionName TEXT;
+	created INTEGER := 0;
+BEGIN
+	-- Serializes the creation of a range by concurrent transactions
+	PERFORM pg_advisory_xact_lock(2, firstEvent);
+	FOREACH tableName IN ARRAY ARRAY['matches', 'pairings'] LOOP
+		partitionName := tableName || '_' || firstEvent;
+		IF to_regclass(partitionName) IS NULL THEN
+			EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)',
+				partitionName, tableName);
+			EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I '
+					'FOR VALUES FROM (%s) TO (%s)',
+				tableName, partitionName,
+				firstEvent, firstEvent + eventPartitionSize());
+			created := created + 1;
+		END IF;
+	END LOOP;
+	RETURN created;
+END;
+$func$  LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION createEventPartitionsAhead(ahead INTEGER)
+RETURNS INTEGER AS $func$
+SELECT coalesce(sum(createEventPartitions(e)), 0)::INTEGER
+FROM (SELECT coalesce(pg_sequence_last_value(
+		pg_get_serial_sequence('events', 'id')), 0)::INTEGER AS lastEvent)
+	AS l,
+	generate_series(lastEvent - lastEvent % eventPartitionSize(),
+		lastEvent + ahead, eventPartitionSize()) AS e;
+$func$  LANGUAGE sql;
+
+SELECT createEventPartitions(id) FROM events;
+SELECT createEventPartitionsAhead(1000);
+
+-- Copied before matchesStandings exists, eventStandings already counts
+-- these matches. Rows without an event cannot be routed to a partition
+-- and are left out
+INSERT INTO matches (player_one, player_two, player_one_score,
+		player_two_score, event, round_number, id)
+	SELECT player_one, player_two, player_one_score, player_two_score,
+		event, round_number, id
+	FROM matchesUnpartitioned WHERE event IS NOT NULL;
+INSERT INTO pairings (id1, name1, points1, id2, name2, points2,
+		event, round_number, id)
+	SELECT id1, name1, points1, id2, name2, points2, event, round_number, id
+	FROM pairingsUnpartitioned WHERE event IS NOT NULL;
+
+DROP TABLE matchesUnpartitioned, pairingsUnpartitioned;
+ALTER SEQUENCE matches_id_seq OWNED BY matches.id;
+ALTER SEQUENCE pairings_id_seq OWNED BY pairings.id;
+
+CREATE INDEX matchesEventPlayerOne ON matches (event, player_one, player_two);
+CREATE INDEX matchesEventPlayerTwo ON matches (event, player_two, player_one);
+CREATE INDEX pairingsEventRound ON pairings (event, round_number);
+
+CREATE TRIGGER matchesStandings
+	AFTER INSERT OR UPDATE OR DELETE ON matches
+	FOR EACH ROW EXECUTE PROCEDURE matchesStandings();
+
+COMMIT;
+
+ANALYZE matches;
+ANALYZE pairings;
@@ -0,0 +1,22 @@
+-- Migration 0007: idempotency keys of players and matches
+--
+-- Registrations and results written by tournament_journal.py carry a key,
+-- unique among the players and among the matches of an event, so replaying
+-- the journal never stores them twice. The columns are added without a
+-- default, which does not rewrite the tables. The index of matches is
+-- built on every partition and blocks writes to matches meanwhile.
+-- Run it once on an existing tournament database:
+--   psql tournament -f database/migrations/0007_idempotency_keys.sql
+
+BEGIN;
+
+ALTER TABLE players ADD COLUMN idempotency_key TEXT;
+ALTER TABLE matches ADD COLUMN idempotency_key TEXT;
+ALTER TABLE archive.matches ADD COLUMN idempotency_key TEXT;
+
+ALTER TABLE players ADD CONSTRAINT players_idempotency_key_key
+	UNIQUE (idempotency_key);
+ALTER TABLE matches ADD CONSTRAINT matches_event_idempotency_key_key
+	UNIQUE (event, idempotency_key);
+
+COMMIT;
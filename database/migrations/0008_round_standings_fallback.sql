@@ -0,0 +1,78 @@
+-- Migration 0008: standings of rounds without snapshot
+--
+-- roundStandings computes the standings of a round from the matches when
+-- the round has no snapshot, instead of returning no rows, and a match
+-- inserted, changed or deleted drops the snapshots of its round and of the
+-- later ones, taken again when the next round is paired. Take the
+-- snapshots dropped meanwhile with:
+--   python tournament_admin.py backfill-snapshots
+-- Run it once on an existing tournament database:
+--   psql tournament -f database/migrations/0008_round_standings_fallback.sql
+
+BEGIN;
+
+-- Function: Round Standings
+-- It reads the standings snapshot taken at the end of a round, or computes
+-- them from the matches if the round has no snapshot
+CREATE OR REPLACE FUNCTION roundStandings(currentEvent INTEGER,
+		currentRound INTEGER)
+RETURNS TABLE(
+	id INTEGER,
+	name TEXT,
+	points DOUBLE PRECISION,
+	matches BIGINT
+) AS $func$
+SELECT players.id, (firstname || ' ' || lastname) as name,
+		standingsSnapshots.points, standingsSnapshots.matches
+        FROM standingsSnapshots JOIN players
+        ON players.id = standingsSnapshots.player
+        WHERE standingsSnapshots.event = currentEvent AND
+        	standingsSnapshots.round_number = currentRound
+UNION ALL
+SELECT players.id, (firstname || ' ' || lastname) as name,
+		computed.points, computed.matches
+        FROM computedRoundStandings(currentEvent, currentRound) AS computed
+        JOIN players ON players.id = computed.player
+        WHERE NOT EXISTS (SELECT 1 FROM standingsSnapshots
+        	WHERE standingsSnapshots.event = currentEvent AND
+        		standingsSnapshots.round_number = currentRound)
+        ORDER BY points DESC, name ASC;
+$func$  LANGUAGE sql STABLE;
+
+
+-- Trigger: Matches Standings
+-- Keeps eventStandings up to date in the same transaction that inserts,
+-- updates or deletes a match, and drops the standings snapshots of its
+-- round and of the later ones, which no longer match the results
+CREATE OR REPLACE FUNCTION matchesStandings()
+RETURNS trigger AS $func$
+BEGIN
+	IF TG_OP IN ('UPDATE', 'DELETE') THEN
+		UPDATE eventStandings
+			SET points = points - COALESCE(OLD.player_one_score, 0),
+				matches = matches - 1
+			WHERE event = OLD.event AND player = OLD.player_one;
+		UPDATE eventStandings
+			SET points = points - COALESCE(OLD.player_two_score, 0),
+				matches = matches - 1
+			WHERE event = OLD.event AND player = OLD.player_two;
+		DELETE FROM standingsSnapshots
+			WHERE event = OLD.event AND round_number >= OLD.round_number;
+	END IF;
+	IF TG_OP IN ('INSERT', 'UPDATE') THEN
+		UPDATE eventStandings
+			SET points = points + COALESCE(NEW.player_one_score, 0),
+				matches = matches + 1
+			WHERE event = NEW.event AND player = NEW.player_one;
+		UPDATE eventStandings
+			SET points = points + COALESCE(NEW.player_two_score, 0),
+				matches = matches + 1
+			WHERE event = NEW.event AND player = NEW.player_two;
+		DELETE FROM standingsSnapshots
+			WHERE event = NEW.event AND round_number >= NEW.round_number;
+	END IF;
+	RETURN NULL;
+END;
+$func$  LANGUAGE plpgsql;
+
+COMMIT;
@@ -0,0 +1,64 @@
+-- Migration 0009: partitions created ahead of time
+--
+-- The partitions of matches and pairings were created by a trigger on
+-- events, holding an ACCESS EXCLUSIVE lock on both tables until the event
+-- was committed, so every live round waited each time a new range of
+-- events started. The trigger is dropped: partitions are created as
+-- standalone tables and then attached, ahead of time, by
+--   python tournament_admin.py partitions
+-- Run it once on an existing tournament database (after 0006):
+--   psql tournament -f database/migrations/0009_partitions_ahead.sql
+
+BEGIN;
+
+DROP TRIGGER IF EXISTS eventsPartitions ON events;
+DROP FUNCTION IF EXISTS eventsPartitions();
+DROP FUNCTION IF EXISTS createEventPartitions(INTEGER);
+
+-- Function: Create Event Partitions
+-- Creates the partitions of matches and pairings holding an event, if they
+-- do not exist yet, and returns how many tables were created. Attaching a
+-- standalone table only takes a SHARE UPDATE EXCLUSIVE lock on matches and
+-- pairings (PostgreSQL 12 or higher)
+CREATE OR REPLACE FUNCTION createEventPartitions(eventId INTEGER)
+RETURNS INTEGER AS $func$
+DECLARE
+	firstEvent INTEGER := eventId - eventId % eventPartitionSize();
+	tableName TEXT;
+	partitionName TEXT;
+	created INTEGER := 0;
+BEGIN
+	-- Serializes the creation of a range by concurrent transactions
+	PERFORM pg_advisory_xact_lock(2, firstEvent);
+	FOREACH tableName IN ARRAY ARRAY['matches', 'pairings'] LOOP
+		partitionName := tableName || '_' || firstEvent;
+		IF to_regclass(partitionName) IS NULL THEN
+			EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)',
+				partitionName, tableName);
+			EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I '
+					'FOR VALUES FROM (%s) TO (%s)',
+				tableName, partitionName,
+				firstEvent, firstEvent + eventPartitionSize());
+			created := created + 1;
+		END IF;
+	END LOOP;
+	RETURN created;
+END;
+$func$  LANGUAGE plpgsql;
+
+-- Function: Create Event Partitions Ahead
+-- Creates the partitions of the next events, up to `ahead` events after
+-- the last one registered, and returns how many tables were created
+CREATE OR REPLACE FUNCTION createEventPartitionsAhead(ahead INTEGER)
+RETURNS INTEGER AS $func$
+SELECT coalesce(sum(createEventPartitions(e)), 0)::INTEGER
+FROM (SELECT coalesce(pg_sequence_last_value(
+		pg_get_serial_sequence('events', 'id')), 0)::INTEGER AS lastEvent)
+	AS l,
+	generate_series(lastEvent - lastEvent % eventPartitionSize(),
+		lastEvent + ahead, eventPartitionSize()) AS e;
+$func$  LANGUAGE sql;
+
+SELECT createEventPartitionsAhead(1000);
+
+COMMIT;
@@ -0,0 +1,15 @@
+-- Migration 0010: SQL pairing functions removed
+--
+-- insertPair and makeAllPairs paired a round in SQL one pair at a time,
+-- rescanning the standings and the opponents of every player for each
+-- pair. swiss_pairings pairs the round in memory instead and nothing calls
+-- them anymore, so they are dropped.
+-- Run it once on an existing tournament database:
+--   psql tournament -f database/migrations/0010_drop_sql_pairing.sql
+
+BEGIN;
+
+DROP FUNCTION IF EXISTS makeAllPairs(INTEGER, INTEGER, INTEGER);
+DROP FUNCTION IF EXISTS insertPair(INTEGER, INTEGER);
+
+COMMIT;
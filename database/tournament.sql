@@ -4,14 +4,20 @@ DROP DATABASE IF EXISTS tournament;
 CREATE DATABASE tournament;
 \c tournament;
 
+-- Trigram matching for the fuzzy player search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 
 -- Containtais all the players registered in database
 -- It stores the lastname and firstname separately 
 -- to allows diferents orders
+-- The idempotency key, if any, is given by the client that registered the
+-- player, so a registration replayed by tournament_journal.py is ignored
 CREATE TABLE players (
 	firstname TEXT,
 	lastname TEXT,
-	id SERIAL PRIMARY KEY
+	id SERIAL PRIMARY KEY,
+	idempotency_key TEXT UNIQUE
 );
 
 
@@ -27,7 +33,7 @@ CREATE TABLE events (
 -- Table Players in Event specifies the relation between 
 -- the registered player and the current event
 CREATE TABLE playersInEvent (
-	event INTEGER REFERENCES events(id),
+	event INTEGER REFERENCES events(id) ON DELETE CASCADE,
 	player INTEGER REFERENCES players(id),
 	PRIMARY KEY(event, player)
 );
@@ -37,20 +43,29 @@ CREATE TABLE playersInEvent (
 -- It allows to store the round number,
 -- player order (if we can implement white and black order for chess)
 -- and the points granted for each player
+-- A bye is stored as a match without player_two
+-- The idempotency key, if any, is unique in the event, so a result
+-- replayed by tournament_journal.py is ignored
+-- It is partitioned by ranges of events (see createEventPartitions), so
+-- the queries of an event only read its partition
 CREATE TABLE matches (
 	player_one INTEGER REFERENCES players(id),
 	player_two INTEGER REFERENCES players(id),
 	player_one_score DOUBLE PRECISION,
 	player_two_score DOUBLE PRECISION,
-	event INTEGER REFERENCES events(id),
+	event INTEGER NOT NULL REFERENCES events(id) ON DELETE CASCADE,
 	round_number INTEGER,
-	id SERIAL PRIMARY KEY
-);
+	id SERIAL,
+	idempotency_key TEXT,
+	PRIMARY KEY(event, id),
+	UNIQUE(event, idempotency_key)
+) PARTITION BY RANGE (event);
 
 
 -- Table Pairings stores every pairing among players
 -- It allows to store the round number, event, 
 -- and the points granted for each player at that time
+-- It is partitioned like matches
 CREATE TABLE pairings (
 	id1 INTEGER REFERENCES players(id),
 	name1  TEXT,
@@ -58,12 +73,132 @@ CREATE TABLE pairings (
 	id2 INTEGER REFERENCES players(id),
 	name2 TEXT,
 	points2 DOUBLE PRECISION,
-	event INTEGER REFERENCES events(id),
+	event INTEGER NOT NULL REFERENCES events(id) ON DELETE CASCADE,
 	round_number INTEGER,
-	id SERIAL PRIMARY KEY
+	id SERIAL,
+	PRIMARY KEY(event, id)
+) PARTITION BY RANGE (event);
+
+
+-- Table Event Standings keeps the points and number of matches of every
+-- player in an event, so standings are read instead of being computed.
+-- It is maintained by triggers on playersInEvent and matches
+CREATE TABLE eventStandings (
+	event INTEGER REFERENCES events(id) ON DELETE CASCADE,
+	player INTEGER REFERENCES players(id),
+	points DOUBLE PRECISION NOT NULL DEFAULT 0,
+	matches BIGINT NOT NULL DEFAULT 0,
+	PRIMARY KEY(event, player)
 );
 
 
+-- Table Standings Snapshots keeps the points and number of matches of every
+-- player at the end of each finalized round, so the standings of a past
+-- round are read instead of being replayed from the matches
+CREATE TABLE standingsSnapshots (
+	event INTEGER REFERENCES events(id) ON DELETE CASCADE,
+	round_number INTEGER,
+	player INTEGER REFERENCES players(id),
+	points DOUBLE PRECISION NOT NULL,
+	matches BIGINT NOT NULL,
+	PRIMARY KEY(event, round_number, player)
+);
+
+
+-- Function: Create Event Partitions
+-- Creates the partitions of matches and pairings holding an event, if they
+-- do not exist yet, and returns how many tables were created. Each
+-- partition holds eventPartitionSize() consecutive events, and as event ids
+-- grow with time the old partitions are left untouched by the live rounds.
+-- A partition is created as a standalone table and then attached, which
+-- only takes a SHARE UPDATE EXCLUSIVE lock on matches and pairings
+-- (PostgreSQL 12 or higher), so live reads and writes go on meanwhile
+CREATE OR REPLACE FUNCTION eventPartitionSize()
+RETURNS INTEGER AS $func$
+SELECT 100;
+$func$  LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION createEventPartitions(eventId INTEGER)
+RETURNS INTEGER AS $func$
+DECLARE
+	firstEvent INTEGER := eventId - eventId % eventPartitionSize();
+	tableName TEXT;
+	partitionName TEXT;
+	created INTEGER := 0;
+BEGIN
+	-- Serializes the creation of a range by concurrent transactions
+	PERFORM pg_advisory_xact_lock(2, firstEvent);
+	FOREACH tableName IN ARRAY ARRAY['matches', 'pairings'] LOOP
+		partitionName := tableName || '_' || firstEvent;
+		IF to_regclass(partitionName) IS NULL THEN
+			EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)',
+				partitionName, tableName);
+			EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I '
+					'FOR VALUES FROM (%s) TO (%s)',
+				tableName, partitionName,
+				firstEvent, firstEvent + eventPartitionSize());
+			created := created + 1;
+		END IF;
+	END LOOP;
+	RETURN created;
+END;
+$func$  LANGUAGE plpgsql;
+
+
+-- Function: Create Event Partitions Ahead
+-- Creates the partitions of the next events, up to `ahead` events after
+-- the last one registered, and returns how many tables were created.
+-- Partitions are never created while an event is registered: run it ahead
+-- of time, e.g. daily with `python tournament_admin.py partitions`
+CREATE OR REPLACE FUNCTION createEventPartitionsAhead(ahead INTEGER)
+RETURNS INTEGER AS $func$
+SELECT coalesce(sum(createEventPartitions(e)), 0)::INTEGER
+FROM (SELECT coalesce(pg_sequence_last_value(
+		pg_get_serial_sequence('events', 'id')), 0)::INTEGER AS lastEvent)
+	AS l,
+	generate_series(lastEvent - lastEvent % eventPartitionSize(),
+		lastEvent + ahead, eventPartitionSize()) AS e;
+$func$  LANGUAGE sql;
+
+SELECT createEventPartitionsAhead(1000);
+
+
+-- Archive: tables with the same columns as the live ones, without keys,
+-- where purge_events(..., archive=True) moves old events so the live
+-- tables stay small
+CREATE SCHEMA archive;
+CREATE TABLE archive.events (LIKE events);
+CREATE TABLE archive.playersInEvent (LIKE playersInEvent);
+CREATE TABLE archive.matches (LIKE matches);
+CREATE TABLE archive.pairings (LIKE pairings);
+CREATE TABLE archive.eventStandings (LIKE eventStandings);
+CREATE TABLE archive.standingsSnapshots (LIKE standingsSnapshots);
+CREATE INDEX archiveMatchesEvent ON archive.matches (event);
+CREATE INDEX archivePairingsEvent ON archive.pairings (event);
+
+
+-- Indexes for the hot queries, every one of them is scoped to an event:
+-- matches of a player (as player one or player two), opponents already
+-- faced and the pairings of a round. The indexes of matches and pairings
+-- are created on each of their partitions
+CREATE INDEX matchesEventPlayerOne ON matches (event, player_one, player_two);
+CREATE INDEX matchesEventPlayerTwo ON matches (event, player_two, player_one);
+CREATE INDEX pairingsEventRound ON pairings (event, round_number);
+CREATE INDEX playersInEventPlayer ON playersInEvent (player);
+
+
+-- Indexes for the player lookups: exact names (find_player, lookup_player),
+-- case-insensitive exact and prefix search on the full name and the
+-- lastname, and trigram (fuzzy) search on the full name
+CREATE INDEX playersFirstnameLastname ON players (firstname, lastname);
+CREATE INDEX playersLowerName
+	ON players (lower(firstname || ' ' || lastname) text_pattern_ops);
+CREATE INDEX playersLowerLastname
+	ON players (lower(lastname) text_pattern_ops);
+CREATE INDEX playersNameTrigram
+	ON players USING gin (lower(firstname || ' ' || lastname) gin_trgm_ops);
+
+
 -- Function: Active Players In Event
 -- determines which players are in the current event
 -- and puts togther the full name
@@ -75,12 +210,13 @@ RETURNS TABLE(
 SELECT players.id, (firstname || ' ' || lastname) as name 
         FROM players, playersInEvent WHERE event=currentEvent 
         AND players.id=playersInEvent.player;
-$func$  LANGUAGE sql;
+$func$  LANGUAGE sql STABLE;
 
 
 -- Function: Matches by players in the current event
 -- It performs a left join between the active players in the curren event
--- and the stored matches
+-- and their matches in that event, taken once as player one and once as
+-- player two so each side can use its index
 -- For every match we select the right score deppending of the player order
 -- in that match, if None we set it to zero
 CREATE OR REPLACE FUNCTION matchesByPlayersInEvent(currentEvent INTEGER)
@@ -91,23 +227,24 @@ RETURNS TABLE(
 	match INTEGER
 ) AS $func$
 SELECT activePlayers.id, activePlayers.name, 
-	CASE WHEN activePlayers.id = matches.player_one 
-			THEN  matches.player_one_score
-        WHEN activePlayers.id = matches.player_two 
-        	THEN matches.player_two_score
-        ELSE 0.0
-    END as score
-	, matches.id as match 
-	FROM (SELECT * FROM activePlayersInEvent(currentEvent)) as activePlayers
-	LEFT JOIN matches ON (activePlayers.id = matches.player_one) or 
-        (activePlayers.id = matches.player_two)
-$func$  LANGUAGE sql;
+	COALESCE(eventMatches.score, 0.0) as score,
+	eventMatches.match
+	FROM activePlayersInEvent(currentEvent) as activePlayers
+	LEFT JOIN (
+		SELECT player_one AS player, player_one_score AS score, id AS match
+			FROM matches WHERE event = currentEvent
+		UNION ALL
+		SELECT player_two AS player, player_two_score AS score, id AS match
+			FROM matches WHERE event = currentEvent
+	) AS eventMatches ON activePlayers.id = eventMatches.player
+$func$  LANGUAGE sql STABLE;
 
 
--- Function: Standings
+-- Function: Computed Standings
 -- It has aggregation functions to determine:
 -- number of matches and total points earned in that matches
-CREATE OR REPLACE FUNCTION standings(currentEvent INTEGER)
+-- It is the former standings() computation, kept to check eventStandings
+CREATE OR REPLACE FUNCTION computedStandings(currentEvent INTEGER)
 RETURNS TABLE(
 	id INTEGER,
 	name TEXT,
@@ -119,97 +256,165 @@ SELECT id, name, SUM(matchesByPlayers.score) AS points,
         FROM matchesByPlayersInEvent(currentEvent) as matchesByPlayers
         GROUP BY id, name 
         ORDER BY points DESC, name ASC;
-$func$  LANGUAGE sql;
+$func$  LANGUAGE sql STABLE;
+
+
+-- Function: Standings
+-- It reads the points and number of matches maintained in eventStandings
+CREATE OR REPLACE FUNCTION standings(currentEvent INTEGER)
+RETURNS TABLE(
+	id INTEGER,
+	name TEXT,
+	points DOUBLE PRECISION,
+	matches BIGINT 
+) AS $func$
+SELECT players.id, (firstname || ' ' || lastname) as name,
+		eventStandings.points, eventStandings.matches
+        FROM eventStandings JOIN players
+        ON players.id = eventStandings.player
+        WHERE eventStandings.event = currentEvent
+        ORDER BY points DESC, name ASC;
+$func$  LANGUAGE sql STABLE;
+
+
+
+-- Function: Computed Round Standings
+-- Points and number of matches of every player in the event counting only
+-- the matches played up to a round, used to take the snapshots
+CREATE OR REPLACE FUNCTION computedRoundStandings(currentEvent INTEGER,
+		currentRound INTEGER)
+RETURNS TABLE(
+	player INTEGER,
+	points DOUBLE PRECISION,
+	matches BIGINT
+) AS $func$
+SELECT playersInEvent.player, COALESCE(SUM(roundMatches.score), 0.0),
+		COUNT(roundMatches.score)
+	FROM playersInEvent LEFT JOIN (
+		SELECT player_one AS player, player_one_score AS score
+			FROM matches
+			WHERE event = currentEvent AND round_number <= currentRound
+		UNION ALL
+		SELECT player_two AS player, player_two_score AS score
+			FROM matches
+			WHERE event = currentEvent AND round_number <= currentRound
+	) AS roundMatches ON roundMatches.player = playersInEvent.player
+	WHERE playersInEvent.event = currentEvent
+	GROUP BY playersInEvent.player;
+$func$  LANGUAGE sql STABLE;
+
+
+-- Function: Round Standings
+-- It reads the standings snapshot taken at the end of a round, or computes
+-- them from the matches if the round has no snapshot
+CREATE OR REPLACE FUNCTION roundStandings(currentEvent INTEGER,
+		currentRound INTEGER)
+RETURNS TABLE(
+	id INTEGER,
+	name TEXT,
+	points DOUBLE PRECISION,
+	matches BIGINT
+) AS $func$
+SELECT players.id, (firstname || ' ' || lastname) as name,
+		standingsSnapshots.points, standingsSnapshots.matches
+        FROM standingsSnapshots JOIN players
+        ON players.id = standingsSnapshots.player
+        WHERE standingsSnapshots.event = currentEvent AND
+        	standingsSnapshots.round_number = currentRound
+UNION ALL
+SELECT players.id, (firstname || ' ' || lastname) as name,
+		computed.points, computed.matches
+        FROM computedRoundStandings(currentEvent, currentRound) AS computed
+        JOIN players ON players.id = computed.player
+        WHERE NOT EXISTS (SELECT 1 FROM standingsSnapshots
+        	WHERE standingsSnapshots.event = currentEvent AND
+        		standingsSnapshots.round_number = currentRound)
+        ORDER BY points DESC, name ASC;
+$func$  LANGUAGE sql STABLE;
         
         
 -- Function: Opponents
--- It has aggregation functions to determine:
--- Opponents from a specific player
+-- Opponents from a specific player in the current event
 CREATE OR REPLACE FUNCTION opponents(currentEvent INTEGER, playerId INTEGER)
 RETURNS TABLE(
 	id INTEGER,
 	name TEXT
 ) AS $func$
-SELECT opps.opponent_id as id, ap2.name
-FROM activePlayersInEvent(currentEvent) as ap2 LEFT JOIN (
-	SELECT ap.id as player_id,
-	CASE WHEN ap.id = mt.player_one
-		THEN mt.player_two
-		ELSE mt.player_one
-	END AS opponent_id
-	FROM activePlayersInEvent(currentEvent) AS ap 
-	LEFT JOIN matches AS mt 
-	ON (ap.id = mt.player_one) OR (ap.id = mt.player_two) 
-) AS opps ON ap2.id = opps.opponent_id WHERE opps.player_id = playerId;
-$func$  LANGUAGE sql;
+SELECT opps.opponent_id as id, ap.name
+FROM activePlayersInEvent(currentEvent) as ap JOIN (
+	SELECT player_two AS opponent_id FROM matches
+		WHERE event = currentEvent AND player_one = playerId
+	UNION ALL
+	SELECT player_one AS opponent_id FROM matches
+		WHERE event = currentEvent AND player_two = playerId
+) AS opps ON ap.id = opps.opponent_id;
+$func$  LANGUAGE sql STABLE;
 
 
--- Function: Insert Pair
--- This function insert a single pair of players that will be confronting
--- Avoid rematch between players
--- We need to perform this operation for every pair of players registered
-CREATE OR REPLACE FUNCTION insertPair(currentEvent INTEGER, currentRound INTEGER)
-RETURNS void AS $func$
-INSERT INTO pairings (id1, name1, points1, id2, name2, points2,
-		 event, round_number) (
-	SELECT id1, name1, points1, id2, name2, points2, 
-		currentEvent, currentRound  FROM 
-		(
-			SELECT std1.id AS id1, std1.name AS name1, std1.points AS points1,
-	   			   std2.id AS id2, std2.name AS name2, std2.points AS points2
-			FROM (
-				SELECT row_number() OVER () as num, *
-				FROM standings(currentEvent)
-			) as std1 LEFT JOIN (
-				SELECT row_number() OVER () as num, *
-				FROM standings(currentEvent)
-			) as std2
-			ON std1.id <> std2.id AND std1.num < std2.num
-			WHERE std2.id NOT IN (SELECT id FROM opponents(currentEvent,std1.id))
-		) as stdxstd 
-		WHERE 
-			id1 not in (SELECT id1 FROM pairings 
-				WHERE event=currentEvent AND round_number=currentRound) AND 
-			id1 not in (SELECT id2 FROM pairings
-				WHERE event=currentEvent AND round_number=currentRound) AND 
-			id2 not in (SELECT id1 FROM pairings
-				WHERE event=currentEvent AND round_number=currentRound) AND 
-			id2 not in (SELECT id2 FROM pairings
-				WHERE event=currentEvent AND round_number=currentRound)
-	limit 1
-);
-$func$  LANGUAGE sql;
+-- Trigger: Players In Event Standings
+-- Adds a row in eventStandings when a player joins an event, with the
+-- matches already stored for that player, and removes it when he or she
+-- leaves the event
+CREATE OR REPLACE FUNCTION playersInEventStandings()
+RETURNS trigger AS $func$
+BEGIN
+	IF TG_OP = 'INSERT' THEN
+		INSERT INTO eventStandings (event, player, points, matches)
+		SELECT NEW.event, NEW.player,
+			COALESCE(SUM(CASE WHEN player_one = NEW.player
+					THEN player_one_score
+					ELSE player_two_score END), 0),
+			COUNT(id)
+		FROM matches WHERE event = NEW.event AND
+			(player_one = NEW.player OR player_two = NEW.player);
+		RETURN NEW;
+	END IF;
+	DELETE FROM eventStandings
+		WHERE event = OLD.event AND player = OLD.player;
+	RETURN OLD;
+END;
+$func$  LANGUAGE plpgsql;
 
+CREATE TRIGGER playersInEventStandings
+	AFTER INSERT OR DELETE ON playersInEvent
+	FOR EACH ROW EXECUTE PROCEDURE playersInEventStandings();
 
--- Function: Make All Pairs
--- It makes every pair of players that will be confronting
--- We generate every pair from the number of players registered to the event
-CREATE OR REPLACE FUNCTION makeAllPairs(currentEvent INTEGER, currentRound INTEGER, playersNumber INTEGER)
-RETURNS TABLE(
-	id1 INTEGER,
-	name1 TEXT,
-	id2 INTEGER,
-	name2 TEXT
-) AS $func$
-#variable_conflict use_column
-DECLARE
-	x int;
-BEGIN
-	-- Deleting possible records if this function was called before
-	DELETE FROM pairings WHERE event=currentEvent AND round_number=currentRound;
-	
-	-- Determining number of pairs
-	x := playersNumber / 2;
-
-	FOR i IN 1..x LOOP
-		PERFORM insertPair(currentEvent, currentRound);
-	END LOOP;
 
-	-- Returning all the records for this round
-	RETURN QUERY SELECT id1, name1, id2, name2
-				FROM pairings 
-				WHERE event = currentEvent AND
-					round_number = currentRound;
+-- Trigger: Matches Standings
+-- Keeps eventStandings up to date in the same transaction that inserts,
+-- updates or deletes a match, and drops the standings snapshots of its
+-- round and of the later ones, which no longer match the results
+CREATE OR REPLACE FUNCTION matchesStandings()
+RETURNS trigger AS $func$
+BEGIN
+	IF TG_OP IN ('UPDATE', 'DELETE') THEN
+		UPDATE eventStandings
+			SET points = points - COALESCE(OLD.player_one_score, 0),
+				matches = matches - 1
+			WHERE event = OLD.event AND player = OLD.player_one;
+		UPDATE eventStandings
+			SET points = points - COALESCE(OLD.player_two_score, 0),
+				matches = matches - 1
+			WHERE event = OLD.event AND player = OLD.player_two;
+		DELETE FROM standingsSnapshots
+			WHERE event = OLD.event AND round_number >= OLD.round_number;
+	END IF;
+	IF TG_OP IN ('INSERT', 'UPDATE') THEN
+		UPDATE eventStandings
+			SET points = points + COALESCE(NEW.player_one_score, 0),
+				matches = matches + 1
+			WHERE event = NEW.event AND player = NEW.player_one;
+		UPDATE eventStandings
+			SET points = points + COALESCE(NEW.player_two_score, 0),
+				matches = matches + 1
+			WHERE event = NEW.event AND player = NEW.player_two;
+		DELETE FROM standingsSnapshots
+			WHERE event = NEW.event AND round_number >= NEW.round_number;
+	END IF;
+	RETURN NULL;
 END;
 $func$  LANGUAGE plpgsql;
 
+CREATE TRIGGER matchesStandings
+	AFTER INSERT OR UPDATE OR DELETE ON matches
+	FOR EACH ROW EXECUTE PROCEDURE matchesStandings();
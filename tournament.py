@@ -3,8 +3,500 @@
 # tournament.py -- implementation of a Swiss-system tournament
 #
 
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from io import StringIO
+from multiprocessing.pool import ThreadPool
+
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
+
+import tournament_metrics
+from tournament_cache import VersionedCache, clock
+from tournament_channel import (CHANGED_STANDINGS, SEND_PAYLOADS,
+                                STANDINGS_CHANNEL, changed_players,
+                                standings_payloads)
+from tournament_metrics import instrumented
+from tournament_pairing import (BYE_POINTS, STRATEGIES, PlayedMatrix,
+                                round_result_errors, split_bye)
+from tournament_queries import (FINALIZE_ROUND, REGISTER_PLAYER,
+                                REGISTER_PLAYER_ONCE, REPORT_MATCH,
+                                REPORT_MATCH_ONCE)
+from tournament_tiebreak import compute_tiebreaks
+
+
+DEFAULT_DSN = os.environ.get("TOURNAMENT_DSN", "dbname=tournament")
+# Optional hot standby of the database, serving the read-only functions
+REPLICA_DSN = os.environ.get("TOURNAMENT_REPLICA_DSN") or None
+
+_default_db = None
+_default_db_lock = threading.Lock()
+
+# Seconds a thread waits for a free connection when the pool is exhausted
+POOL_TIMEOUT = 30.0
+
+log = logging.getLogger(__name__)
+
+# Cache of standings and pairings, disabled until configure_cache is
+# called, see configure_cache
+_cache = VersionedCache(0)
+# Default time to live of the cached results, in seconds
+CACHE_TTL = 5.0
+
+# First key of the advisory lock held while an event is paired, the second
+# one being the event id (2 is taken by createEventPartitions in the schema)
+PAIRING_LOCK = 1
+
+# Cache of player ids by (firstname, lastname), for check-in desks
+_player_ids = {}
+_player_ids_lock = threading.Lock()
+PLAYER_IDS_CACHE_SIZE = 100000
+
+# Rematch bit matrices by event, see _played_matrix
+_played = {}
+_played_lock = threading.Lock()
+PLAYED_CACHE_SIZE = 256
+
+# Search modes of search_players
+SEARCH_MODES = ("exact", "prefix", "fuzzy")
+
+# First table (or function) named by a statement, labels its metrics
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+(\w+)", re.IGNORECASE)
+
+
+def _query_label(query):
+    """Short label of a statement for the metrics, e.g. 'SELECT matches'."""
+    if isinstance(query, bytes):
+        query = query[:200].decode("latin-1")
+    head = query[:200]
+    words = head.split(None, 1)
+    table = _TABLE.search(head)
+    verb = words[0].upper() if words else ""
+    return verb + " " + table.group(1) if table else verb
+
+
+class _TimedCursorMixin(object):
+    """Records the latency and rows of every statement in the metrics of
+    tournament_metrics, when they are enabled."""
+
+    def execute(self, query, vars=None):
+        if not tournament_metrics.enabled():
+            return super(_TimedCursorMixin, self).execute(query, vars)
+        start = tournament_metrics.clock()
+        try:
+            return super(_TimedCursorMixin, self).execute(query, vars)
+        finally:
+            self._observe(_query_label(query), start)
+
+    def executemany(self, query, vars_list):
+        if not tournament_metrics.enabled():
+            return super(_TimedCursorMixin, self).executemany(query,
+                                                              vars_list)
+        start = tournament_metrics.clock()
+        try:
+            return super(_TimedCursorMixin, self).executemany(query,
+                                                              vars_list)
+        finally:
+            self._observe(_query_label(query), start)
+
+    def callproc(self, procname, parameters=None):
+        if not tournament_metrics.enabled():
+            return super(_TimedCursorMixin, self).callproc(procname,
+                                                           parameters)
+        start = tournament_metrics.clock()
+        try:
+            return super(_TimedCursorMixin, self).callproc(procname,
+                                                           parameters)
+        finally:
+            self._observe(procname, start)
+
+    def _observe(self, label, start):
+        tournament_metrics.observe("tournament_query_seconds", label,
+                                   tournament_metrics.clock() - start)
+        if self.rowcount >= 0:
+            tournament_metrics.observe("tournament_query_rows", label,
+                                       self.rowcount)
+
+
+class TimedCursor(_TimedCursorMixin, psycopg2.extensions.cursor):
+    """Default cursor of the pooled connections."""
+
+
+class TimedDictCursor(_TimedCursorMixin, psycopg2.extras.DictCursor):
+    """DictCursor used by crud_operation."""
+
+
+def _lsn_value(lsn):
+    """Position of a WAL location such as '16/B374D848', for comparisons."""
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class TournamentDB(object):
+    """Pooled access to the tournament database.
+
+    Connections are borrowed from a thread-safe pool instead of being opened
+    for every statement. Statements executed inside a `transaction()` block
+    share the same connection and are committed (or rolled back) together.
+
+    With a replica, reads outside of a transaction block (see `read_only`)
+    go to a second pool connected to a hot standby, and writes to the
+    primary. With read_your_writes, the WAL location of every write is
+    remembered and the replica is only read once it has replayed the last
+    one, the primary being read meanwhile: the process always sees its own
+    writes, and never caches older results.
+
+    Args:
+      dsn: libpq connection string of the tournament database.
+      minconn: connections opened when the pool is created.
+      maxconn: maximum number of connections kept by the pool.
+      replica_dsn: libpq connection string of a single hot standby of the
+                   database, None to read from the primary.
+      read_your_writes: wait for the replica to replay the writes of this
+                        process before reading from it.
+      pool_timeout: seconds a thread waits for a connection while all of
+                    them are borrowed, before raising PoolError.
+    """
+
+    def __init__(self, dsn=DEFAULT_DSN, minconn=1, maxconn=10,
+                 replica_dsn=REPLICA_DSN, read_your_writes=True,
+                 pool_timeout=POOL_TIMEOUT):
+        self.dsn = dsn
+        self.maxconn = maxconn
+        self.pool_timeout = pool_timeout
+        self.replica_dsn = replica_dsn
+        self.read_your_writes = read_your_writes
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn, maxconn, dsn, cursor_factory=TimedCursor)
+        self._replica_pool = None
+        if replica_dsn is not None:
+            self._replica_pool = psycopg2.pool.ThreadedConnectionPool(
+                minconn, maxconn, replica_dsn, cursor_factory=TimedCursor)
+        self._local = threading.local()
+        self._returned = threading.Condition()
+        self._lsn = None
+        self._lsn_unknown = False
+        self._lsn_lock = threading.Lock()
+
+    def _getconn(self, pool, label):
+        """Borrows a connection, waiting up to pool_timeout seconds for one
+        to be returned when they are all borrowed: ThreadedConnectionPool
+        itself raises PoolError at once."""
+        start = tournament_metrics.clock()
+        with self._returned:
+            while True:
+                try:
+                    db = pool.getconn()
+                    break
+                except psycopg2.pool.PoolError:
+                    remaining = start + self.pool_timeout - \
+                        tournament_metrics.clock()
+                    if pool.closed or remaining <= 0:
+                        raise
+                    self._returned.wait(remaining)
+        if tournament_metrics.enabled():
+            tournament_metrics.observe(
+                "tournament_connection_acquire_seconds", label,
+                tournament_metrics.clock() - start)
+        return db
+
+    def _putconn(self, pool, db, close=False):
+        """Returns a borrowed connection and wakes up the waiting threads."""
+        pool.putconn(db, close=close)
+        with self._returned:
+            self._returned.notify_all()
+
+    def in_transaction(self):
+        """Returns True if the current thread is inside a transaction block."""
+        return getattr(self._local, "conn", None) is not None
+
+    def written(self):
+        """Marks the current transaction as a write, whose WAL location is
+        remembered once committed, see read_your_writes."""
+        if self.in_transaction():
+            self._local.wrote = True
+
+    def on_commit(self, callback):
+        """Calls `callback` once the current transaction commits, or right
+        away outside of a transaction block."""
+        if self.in_transaction():
+            self._local.on_commit.append(callback)
+        else:
+            callback()
+
+    @contextmanager
+    def transaction(self):
+        """Groups several operations into one database transaction.
+
+        Nested blocks join the outermost transaction, so module level
+        functions can be freely combined inside a single block. Once the
+        transaction is committed, the on_commit callbacks always run.
+
+        Yields:
+          The connection bound to the transaction.
+        """
+        db = getattr(self._local, "conn", None)
+        if db is not None:
+            yield db
+            return
+        db = self._getconn(self._pool, "default")
+        self._local.conn = db
+        self._local.on_commit = []
+        self._local.wrote = False
+        try:
+            try:
+                yield db
+                db.commit()
+            except Exception:
+                if not db.closed:
+                    db.rollback()
+                raise
+            if self._local.wrote and self.read_your_writes and \
+                    self._replica_pool is not None:
+                self._remember_lsn(db)
+        finally:
+            self._local.conn = None
+            self._putconn(self._pool, db, close=bool(db.closed))
+        callbacks, self._local.on_commit = self._local.on_commit, []
+        for callback in callbacks:
+            callback()
+
+    def _remember_lsn(self, db):
+        """Remembers the WAL location of a committed write.
+
+        The write being committed, a failure to read it (e.g. a lost
+        connection) is not raised: the primary is read instead of the
+        replica until the location is read again, see read_only.
+        """
+        try:
+            c = db.cursor()
+            c.execute("SELECT pg_current_wal_insert_lsn()::text")
+            lsn = c.fetchone()[0]
+            c.close()
+            db.rollback()
+        except Exception as e:
+            log.warning("Reading the WAL location of a write failed: %s", e)
+            with self._lsn_lock:
+                self._lsn_unknown = True
+            return
+        with self._lsn_lock:
+            self._lsn_unknown = False
+            if self._lsn is None or _lsn_value(lsn) > _lsn_value(self._lsn):
+                self._lsn = lsn
+
+    def _replica_connection(self):
+        """Borrows a replica connection, None if the replica has not
+        replayed the last write of this process yet."""
+        with self._lsn_lock:
+            lsn, unknown = self._lsn, self._lsn_unknown
+        if unknown and self.read_your_writes:
+            return None
+        db = self._getconn(self._replica_pool, "replica")
+        if lsn is None or not self.read_your_writes:
+            return db
+        try:
+            c = db.cursor()
+            c.execute("SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn,"
+                      " false)", [lsn])
+            replayed = c.fetchone()[0]
+            c.close()
+            db.rollback()
+        except Exception:
+            self._putconn(self._replica_pool, db, close=bool(db.closed))
+            raise
+        if replayed:
+            return db
+        self._putconn(self._replica_pool, db)
+        return None
+
+    @contextmanager
+    def read_only(self):
+        """Groups reads on a replica connection, in a read-only transaction
+        rolled back at the end.
+
+        The primary is read instead inside a transaction block, without a
+        replica, or while the replica lags behind the writes of this
+        process (see read_your_writes), or while the location of its last
+        write is unknown, which the next read on the primary takes again.
+        Nested blocks share the connection.
+
+        Yields:
+          The connection to read from.
+        """
+        db = getattr(self._local, "conn", None) or \
+            getattr(self._local, "read_conn", None)
+        if db is not None:
+            yield db
+            return
+        if self._replica_pool is not None:
+            db = self._replica_connection()
+        if db is None:
+            with self.transaction() as db:
+                if self._lsn_unknown:
+                    self._remember_lsn(db)
+                yield db
+            return
+        db.set_session(readonly=True)
+        self._local.read_conn = db
+        try:
+            yield db
+        finally:
+            self._local.read_conn = None
+            if not db.closed:
+                db.rollback()
+            self._putconn(self._replica_pool, db, close=bool(db.closed))
+
+    def execute(self, is_proc, operation, query, params, expected_rows,
+                has_return_id):
+        """Runs a single statement, see `crud_operation` for the arguments.
+        Reads go through `read_only`, other statements through
+        `transaction`."""
+        rows = None
+        block = self.read_only if operation == "read" else self.transaction
+        with block() as db:
+            if operation != "read":
+                self.written()
+            c = db.cursor(cursor_factory=TimedDictCursor)
+            if is_proc:
+                c.callproc(query, params)
+            else:
+                c.execute(query, params)
+            if operation == "read":
+                rows = c.fetchone() if expected_rows == "one" else c.fetchall()
+            else:
+                if operation == "create" and has_return_id:
+                    rows = c.fetchone()
+            c.close()
+        return rows
+
+    def close(self):
+        """Closes every connection held by the pools."""
+        self._pool.closeall()
+        if self._replica_pool is not None:
+            self._replica_pool.closeall()
+
+
+def configure(dsn=DEFAULT_DSN, minconn=1, maxconn=10,
+              replica_dsn=REPLICA_DSN, read_your_writes=True,
+              pool_timeout=POOL_TIMEOUT):
+    """Replaces the default pool used by the module level functions.
+
+    Args:
+      dsn: libpq connection string of the tournament database.
+      minconn: connections opened when the pool is created.
+      maxconn: maximum number of connections kept by the pool.
+      replica_dsn: libpq connection string of a hot standby serving the
+                   reads, None to read from the primary.
+      read_your_writes: see TournamentDB.
+      pool_timeout: see TournamentDB.
+    Returns:
+      The new default TournamentDB.
+    """
+    global _default_db
+    with _default_db_lock:
+        if _default_db is not None:
+            _default_db.close()
+        _default_db = TournamentDB(dsn, minconn, maxconn, replica_dsn,
+                                   read_your_writes, pool_timeout)
+        return _default_db
+
+
+def get_db():
+    """Returns the default TournamentDB, creating it on first use."""
+    global _default_db
+    if _default_db is None:
+        with _default_db_lock:
+            if _default_db is None:
+                _default_db = TournamentDB()
+    return _default_db
+
+
+def transaction():
+    """Groups module level calls into a single transaction of the default
+    pool, e.g.:
+
+        with transaction():
+            event_id = register_event("Blitz", "2015/12/30")
+            add_player_to_event(event_id, register_player("Ana", "Diaz"))
+    """
+    return get_db().transaction()
+
+
+def read_only():
+    """Groups module level reads on the replica of the default pool, or on
+    the primary if there is none, see TournamentDB.read_only."""
+    return get_db().read_only()
+
+
+def configure_cache(max_entries=1024, max_bytes=64 * 1024 * 1024,
+                    ttl=CACHE_TTL):
+    """Replaces the cache of standings and pairings, which is disabled by
+    default.
+
+    The cached results of an event are invalidated by the writes of this
+    process only: the writes of other processes (another server, psql,
+    tournament_async, ...) are seen once the results expire, after ttl
+    seconds.
+
+    Args:
+      max_entries: maximum number of cached results, 0 disables the cache.
+      max_bytes: approximate memory cap of the cached results.
+      ttl: seconds a result is served for, None to serve it until the next
+           write of this process, when no other process writes.
+    """
+    global _cache
+    _cache = VersionedCache(max_entries, max_bytes, ttl)
+
+
+def cache_stats():
+    """Returns the hit, miss and eviction counters and the size of the
+    cache of standings and pairings."""
+    return _cache.stats()
+
+
+def _cached(kind, event_id, args, loader):
+    """Reads through the cache, except inside a transaction block, whose
+    uncommitted writes must neither be cached nor hidden by the cache."""
+    if get_db().in_transaction():
+        return loader()
+    return _cache.get(kind, event_id, args, loader)
+
+
+def _changed(event_id=None):
+    """Invalidates the cached reads of an event, or of every event if
+    event_id is None, once the current write is committed."""
+    db = get_db()
+    db.written()
+    db.on_commit(lambda: _cache.bump(event_id))
+
+
+def _notify(event_id=None, round_number=None, player_ids=None, **extra):
+    """Tells the subscribers of STANDINGS_CHANNEL, once the current write
+    is committed, that the standings of an event changed, see
+    tournament_channel.standings_payloads. Call it inside the transaction
+    of the write, so the message is sent if and only if the write commits.
+
+    Args:
+      event_id: the id's event, None for every event.
+      round_number: the round the change belongs to.
+      player_ids: the players whose standings changed, None to ask for a
+                  resync.
+      extra: other keys of the message, e.g. paired=True.
+    """
+    with transaction() as db:
+        c = db.cursor()
+        rows = None
+        if player_ids is not None:
+            c.execute(CHANGED_STANDINGS,
+                      [event_id, changed_players(player_ids)])
+            rows = c.fetchall()
+        c.execute(SEND_PAYLOADS, [STANDINGS_CHANNEL, standings_payloads(
+            event_id, round_number, rows, **extra)])
+        c.close()
 
 
 def connect():
@@ -12,9 +504,10 @@ def connect():
 
     Returns:
       A database connection."""
-    return psycopg2.connect("dbname=tournament")
+    return psycopg2.connect(DEFAULT_DSN)
 
 
+@instrumented
 def crud_operation(is_proc, operation, query, params, expected_rows,
                    has_return_id):
     """Perform CRUD operations on database
@@ -32,23 +525,11 @@ def crud_operation(is_proc, operation, query, params, expected_rows,
            from last INSERT
       rows: If multiple rows are returned
     """
-    rows = None
-    db = connect()
-    c = db.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    if is_proc:
-        c.callproc(query, params)
-    else:
-        c.execute(query, params)
-    if operation == "read":
-        rows = c.fetchone() if expected_rows == "one" else c.fetchall()
-    else:
-        if operation == "create" and has_return_id:
-            rows = c.fetchone()
-    db.commit()
-    db.close()
-    return rows
+    return get_db().execute(is_proc, operation, query, params, expected_rows,
+                            has_return_id)
 
 
+@instrumented
 def delete_event(event_id):
     """Remove an event and all its related data from the database, without
     erasing registered players.
@@ -57,44 +538,161 @@ def delete_event(event_id):
       event_id: the id's event.
     """
     query = "DELETE FROM events WHERE id=%s"
-    crud_operation(False, "delete", query, [event_id], None, None)
+    with transaction():
+        crud_operation(False, "delete", query, [event_id], None, None)
+        _changed(event_id)
+        _notify(event_id)
 
 
+@instrumented
 def delete_all_events():
     """Remove all events and all their related data from the database,
-    without erasing registered players."""
-    query = "DELETE FROM pairings"
-    crud_operation(False, "delete", query, [], None, None)
-    query = "DELETE FROM matches"
-    crud_operation(False, "delete", query, [], None, None)
-    query = "DELETE FROM playersInEvent"
-    crud_operation(False, "delete", query, [], None, None)
+    without erasing registered players.
+
+    The rows of every table referencing an event are deleted with it (ON
+    DELETE CASCADE), see purge_events to archive them and reset_database
+    to empty a test database faster."""
     query = "DELETE FROM events"
-    crud_operation(False, "delete", query, [], None, None)
+    with transaction():
+        crud_operation(False, "delete", query, [], None, None)
+        _changed()
+        _notify()
 
 
+@instrumented
 def delete_all_matches():
-    """Remove all the match records from the database."""
-    query = "DELETE FROM matches"
-    crud_operation(False, "delete", query, [], None, None)
+    """Remove all the match records from the database, with the standings
+    snapshots taken from them."""
+    with transaction():
+        query = "DELETE FROM standingsSnapshots"
+        crud_operation(False, "delete", query, [], None, None)
+        query = "DELETE FROM matches"
+        crud_operation(False, "delete", query, [], None, None)
+        _changed()
+        _notify()
 
 
+@instrumented
 def delete_matches_from_event(event_id):
     """Remove all the match records from an event.\
 
     Args:
       event_id: the id's event.
     """
-    query = "DELETE FROM matches WHERE event=%s"
-    crud_operation(False, "delete", query, [event_id], None, None)
+    with transaction():
+        query = "DELETE FROM standingsSnapshots WHERE event=%s"
+        crud_operation(False, "delete", query, [event_id], None, None)
+        query = "DELETE FROM matches WHERE event=%s"
+        crud_operation(False, "delete", query, [event_id], None, None)
+        _changed(event_id)
+        _notify(event_id)
+
+
+# Events after the last registered one given their partitions of matches
+# and pairings by create_partitions
+PARTITIONS_AHEAD = 1000
+
+# Tables holding the rows of an event, archived by purge_events
+EVENT_TABLES = ("playersInEvent", "matches", "pairings", "eventStandings",
+                "standingsSnapshots")
+
+
+@instrumented
+def purge_events(event_ids=None, before=None, archive=False):
+    """Removes whole events in a single transaction, optionally moving
+    them to the archive schema first so the live tables stay small.
+
+    The derived standings are deleted first, so the triggers have nothing
+    left to update when the matches are deleted with their event.
+
+    Args:
+      event_ids: list of the events to remove.
+      before: also remove the events dated before this date.
+      archive: True to copy the events and all their rows to the archive
+               tables (archive.events, archive.matches, ...) before.
+    Returns:
+      The sorted list of the ids of the removed events
+    """
+    with transaction() as db:
+        c = db.cursor()
+        c.execute("SELECT id FROM events WHERE id = ANY(%(ids)s) OR \
+                   event_date < %(before)s ORDER BY id FOR UPDATE",
+                  {"ids": list(event_ids or []), "before": before})
+        ids = [row[0] for row in c.fetchall()]
+        if ids:
+            if archive:
+                c.execute("INSERT INTO archive.events \
+                           SELECT * FROM events WHERE id = ANY(%s)", [ids])
+                for table in EVENT_TABLES:
+                    c.execute("INSERT INTO archive." + table + " SELECT * \
+                               FROM " + table + " WHERE event = ANY(%s)",
+                              [ids])
+            c.execute("DELETE FROM eventStandings WHERE event = ANY(%s)",
+                      [ids])
+            c.execute("DELETE FROM events WHERE id = ANY(%s)", [ids])
+        c.close()
+        for event_id in ids:
+            _changed(event_id)
+            _notify(event_id)
+    return ids
+
+
+@instrumented
+def reset_database(keep_players=False):
+    """Empties the database with TRUNCATE, for test databases: it is much
+    faster than deleting the rows but locks every table meanwhile. Ids
+    start again from 1.
+
+    Args:
+      keep_players: True to keep the registered players.
+    """
+    tables = ["events"] + list(EVENT_TABLES)
+    if not keep_players:
+        tables.append("players")
+    query = "TRUNCATE " + ", ".join(tables) + " RESTART IDENTITY CASCADE"
+    with transaction() as db:
+        crud_operation(False, "delete", query, [], None, None)
+        _changed()
+        _notify()
+        if not keep_players:
+            db.on_commit(_forget_player_ids)
+
+
+@instrumented
+def create_partitions(ahead=PARTITIONS_AHEAD):
+    """Creates the partitions of matches and pairings of the next events.
+
+    Registering an event never creates its partitions, as that would lock
+    matches and pairings for every live event: run it ahead of time, e.g.
+    daily, so the events registered meanwhile already have them.
+
+    Args:
+      ahead: number of events after the last registered one to cover.
+    Returns:
+      The number of tables created
+    """
+    query = "SELECT createEventPartitionsAhead(%s) AS created"
+    row = crud_operation(False, "create", query, [ahead], None, True)
+    return row["created"]
 
 
+@instrumented
 def delete_players():
     """Remove all the player records from the database."""
     query = "DELETE FROM players"
-    crud_operation(False, "delete", query, [], None, None)
+    with transaction() as db:
+        crud_operation(False, "delete", query, [], None, None)
+        _changed()
+        _notify()
+        db.on_commit(_forget_player_ids)
+
+
+def _forget_player_ids():
+    with _player_ids_lock:
+        _player_ids.clear()
 
 
+@instrumented
 def register_event(name, event_date):
     """Adds a new event to the tournament database.
 
@@ -107,12 +705,17 @@ def register_event(name, event_date):
       id: Key created from last INSERT
     """
     query = "INSERT INTO events (name, event_date) \
-             VALUES (%s, %s) RETURNING id"
+             VALUES (%s, %s) RETURNING id, to_regclass('matches_' || \
+             (id - id %% eventPartitionSize())) IS NOT NULL AS partitioned"
     row = crud_operation(False, "create", query, [name, event_date],
                          None, True)
+    if not row["partitioned"]:
+        log.warning("Event %s has no partition to store its matches, run "
+                    "create_partitions first", row["id"])
     return row["id"]
 
 
+@instrumented
 def count_events():
     """Returns the number of events currently registered.
 
@@ -124,6 +727,7 @@ def count_events():
     return row["num"]
 
 
+@instrumented
 def count_players():
     """Returns the number of players currently registered.
 
@@ -135,7 +739,8 @@ def count_players():
     return row["num"]
 
 
-def register_player(firstname, lastname):
+@instrumented
+def register_player(firstname, lastname, idempotency_key=None):
     """Adds a player to the tournament database.
 
     The database assigns a unique serial id number for the player.  (This
@@ -144,16 +749,23 @@ def register_player(firstname, lastname):
     Args:
       firstname: the player's firstname (need not be unique).
       lastname: the player's lastname (need not be unique).
+      idempotency_key: optional unique key of the registration, registering
+                       again with the same key returns the same player,
+                       see tournament_journal.py.
     Returns:
       id: Key created from last INSERT
     """
-    query = "INSERT INTO players (firstname, lastname) \
-             VALUES (%s, %s) RETURNING id"
-    row = crud_operation(False, "create", query, [firstname, lastname],
-                         None, True)
+    if idempotency_key is None:
+        query = REGISTER_PLAYER
+        params = [firstname, lastname]
+    else:
+        query = REGISTER_PLAYER_ONCE
+        params = [firstname, lastname, idempotency_key]
+    row = crud_operation(False, "create", query, params, None, True)
     return row["id"]
 
 
+@instrumented
 def add_player_to_event(event_id, player_id):
     """Adds a player into an existing event.
 
@@ -162,9 +774,59 @@ def add_player_to_event(event_id, player_id):
       player_id: the id's player.
     """
     query = "INSERT INTO playersInEvent (event, player) VALUES (%s, %s)"
-    crud_operation(False, "create", query, [event_id, player_id], None, False)
+    with transaction():
+        crud_operation(False, "create", query, [event_id, player_id], None,
+                       False)
+        _changed(event_id)
+        _notify(event_id)
+
+
+@instrumented
+def register_players_bulk(players, page_size=1000):
+    """Adds many players to the tournament database in a single transaction.
+
+    Args:
+      players: iterable of (firstname, lastname) tuples.
+      page_size: number of rows sent in each multi-row INSERT.
+    Returns:
+      ids: List of the new keys, in the same order as `players`
+    """
+    rows = [(firstname, lastname, ordinal)
+            for ordinal, (firstname, lastname) in enumerate(players)]
+    if not rows:
+        return []
+    # Serial ids are drawn in insertion order, so sorting them restores the
+    # input order whatever order RETURNING uses.
+    query = "INSERT INTO players (firstname, lastname) \
+             SELECT firstname, lastname FROM (VALUES %s) \
+             AS v(firstname, lastname, ordinal) ORDER BY ordinal RETURNING id"
+    with transaction() as db:
+        c = db.cursor()
+        ids = psycopg2.extras.execute_values(c, query, rows,
+                                             page_size=page_size, fetch=True)
+        c.close()
+    return sorted(row[0] for row in ids)
 
 
+@instrumented
+def add_players_to_event_bulk(event_id, player_ids):
+    """Adds many players into an existing event with a single COPY.
+
+    Args:
+      event_id: the id's event.
+      player_ids: iterable of the id's players.
+    """
+    data = StringIO(u"".join(u"{}\t{}\n".format(event_id, player_id)
+                             for player_id in player_ids))
+    with transaction() as db:
+        c = db.cursor()
+        c.copy_expert("COPY playersInEvent (event, player) FROM STDIN", data)
+        c.close()
+        _changed(event_id)
+        _notify(event_id)
+
+
+@instrumented
 def remove_player_from_event(event_id, player_id):
     """Removes a single player from an existing event.
 
@@ -173,9 +835,14 @@ def remove_player_from_event(event_id, player_id):
       player_id: the id's player.
     """
     query = "DELETE FROM playersInEvent WHERE event=%s AND player=%s"
-    crud_operation(False, "delete", query, [event_id, player_id], None, False)
+    with transaction():
+        crud_operation(False, "delete", query, [event_id, player_id], None,
+                       False)
+        _changed(event_id)
+        _notify(event_id)
 
 
+@instrumented
 def count_players_in_event(event_id):
     """Returns the number of players in an specified event.
 
@@ -189,29 +856,178 @@ def count_players_in_event(event_id):
     return row["num"]
 
 
-def player_standings(event_id):
+@instrumented
+def player_standings(event_id, tiebreaks=None, round_number=None):
     """Returns a list of the players and their win records, sorted by
     ontained points from an event.
 
     The first entry in the list should be the player in first place,
     or a player tied for first place if there is currently a tie.
+    Points and matches are read from the eventStandings table, which
+    report_match keeps up to date (see rebuild_standings), through the
+    cache of the module (see cache_stats). The standings after a past
+    round are read from the snapshot taken by finalize_round, when the
+    next round is paired, or computed from the matches up to that round if
+    it has none.
 
    Args:
       event_id: the id's event.
+      tiebreaks: optional list of tiebreaks to rank players with the same
+                 points, among 'omw', 'buchholz' and 'sonneborn_berger'
+                 (see tournament_tiebreak).
+      round_number: return the standings at the end of this round instead
+                    of the current ones.
     Returns:
       A list of tuples, each of which contains (id, name, points, matches):
         id: the player's unique id (assigned by the database)
         name: the player's full name (as registered)
         points: the number of matches the player has won
         matches: the number of matches the player has played
+      followed by one value per requested tiebreak
     """
-    procedure = "standings"
-    rows = crud_operation(True, "read", procedure, [event_id], "all", None)
-    return rows
+    if round_number is None:
+        procedure, params = "standings", [event_id]
+    else:
+        procedure, params = "roundStandings", [event_id, round_number]
+    args = (round_number, tuple(tiebreaks or ()))
+    if not tiebreaks:
+        return _cached("standings", event_id, args, lambda: crud_operation(
+            True, "read", procedure, params, "all", None))
 
+    def load():
+        with read_only() as db:
+            c = db.cursor()
+            c.callproc(procedure, params)
+            standings = c.fetchall()
+            c.execute("SELECT player_one, player_one_score, player_two, \
+                       player_two_score FROM matches WHERE event=%s AND \
+                       (%s IS NULL OR round_number <= %s)",
+                      [event_id, round_number, round_number])
+            rows = compute_tiebreaks(standings, c, tiebreaks)
+            c.close()
+        return rows
+    return _cached("standings", event_id, args, load)
 
+
+_COMPUTED_STANDINGS = """
+    SELECT playersInEvent.event, playersInEvent.player,
+        COALESCE(SUM(CASE WHEN matches.player_one = playersInEvent.player
+                THEN matches.player_one_score
+                ELSE matches.player_two_score END), 0) AS points,
+        COUNT(matches.id) AS matches
+    FROM playersInEvent LEFT JOIN matches
+        ON matches.event = playersInEvent.event AND
+            (matches.player_one = playersInEvent.player OR
+             matches.player_two = playersInEvent.player)
+    WHERE %(event)s IS NULL OR playersInEvent.event = %(event)s
+    GROUP BY playersInEvent.event, playersInEvent.player"""
+
+
+@instrumented
+def rebuild_standings(event_id=None, check_only=False):
+    """Recomputes the materialized standings from the stored matches.
+
+    The eventStandings table is kept up to date by triggers, this command
+    checks it against a full computation and, unless check_only is set,
+    replaces its content.
+
+    Args:
+      event_id: the id's event, all events if None.
+      check_only: True to only report the differences.
+    Returns:
+      A list of tuples, each of which contains
+      (event, player, stored_points, stored_matches, points, matches)
+      for every row where the stored standings disagree
+    """
+    params = {"event": event_id}
+    with transaction() as db:
+        c = db.cursor()
+        if not check_only:
+            c.execute("LOCK TABLE matches, playersInEvent IN SHARE MODE")
+        c.execute("""
+            WITH computed AS (""" + _COMPUTED_STANDINGS + """),
+            stored AS (SELECT * FROM eventStandings
+                       WHERE %(event)s IS NULL OR event = %(event)s)
+            SELECT COALESCE(computed.event, stored.event),
+                COALESCE(computed.player, stored.player),
+                stored.points, stored.matches,
+                computed.points, computed.matches
+            FROM computed FULL JOIN stored
+                ON stored.event = computed.event AND
+                    stored.player = computed.player
+            WHERE stored.points IS DISTINCT FROM computed.points OR
+                stored.matches IS DISTINCT FROM computed.matches
+            ORDER BY 1, 2""", params)
+        differences = c.fetchall()
+        if differences and not check_only:
+            c.execute("DELETE FROM eventStandings \
+                       WHERE %(event)s IS NULL OR event = %(event)s", params)
+            c.execute("INSERT INTO eventStandings \
+                       (event, player, points, matches) " +
+                      _COMPUTED_STANDINGS, params)
+            _changed(event_id)
+            _notify(event_id)
+        c.close()
+    return differences
+
+
+@instrumented
+def finalize_round(event_id, round_number):
+    """Takes the snapshot of the standings at the end of a round, read
+    afterwards by player_standings(event_id, round_number=round_number).
+
+    Only the matches up to that round are counted, so a round can be
+    finalized again after a correction or long after it was played. Rounds
+    are finalized by report_round and, for the ones reported match by
+    match, by swiss_pairings when the next round is paired. A match stored,
+    changed or deleted afterwards drops the snapshot (see matchesStandings
+    in the schema), and the round is read from the matches until it is
+    finalized again.
+
+    Args:
+      event_id: the id's event
+      round_number: the round to finalize
+    """
+    params = {"event": event_id, "round": round_number}
+    with transaction() as db:
+        c = db.cursor()
+        for query in FINALIZE_ROUND:
+            c.execute(query, params)
+        c.close()
+    _changed(event_id)
+
+
+@instrumented
+def backfill_snapshots(event_id=None):
+    """Takes the standings snapshot of every round with matches that has
+    none, for events played before snapshots existed or rounds corrected
+    after they were finalized.
+
+    Args:
+      event_id: the id's event, all events if None.
+    Returns:
+      A list of tuples, each of which contains (event, round_number) for
+      every round finalized
+    """
+    with transaction() as db:
+        c = db.cursor()
+        c.execute("SELECT DISTINCT event, round_number FROM matches \
+                   WHERE (%(event)s IS NULL OR event = %(event)s) AND \
+                   NOT EXISTS (SELECT 1 FROM standingsSnapshots \
+                       WHERE standingsSnapshots.event = matches.event AND \
+                       standingsSnapshots.round_number = \
+                           matches.round_number) \
+                   ORDER BY event, round_number", {"event": event_id})
+        rounds = c.fetchall()
+        c.close()
+        for event, round_number in rounds:
+            finalize_round(event, round_number)
+    return [tuple(row) for row in rounds]
+
+
+@instrumented
 def report_match(event_id, round_number, player_one_id, player_one_points,
-                 player_two_id, player_two_points):
+                 player_two_id, player_two_points, idempotency_key=None):
     """Records the outcome of a single match between two players.
     If a player won obtains one point, if is a tie, half point to each one
 
@@ -222,63 +1038,378 @@ def report_match(event_id, round_number, player_one_id, player_one_points,
       player_one_points: Number of points obtained in this match
       player_two_id:  the id number of the second player
       player_two_points: Number of points obtained in this match
+      idempotency_key: optional key of the result, unique in the event: a
+                       result reported again with the same key is ignored,
+                       see tournament_journal.py.
+    """
+    query = REPORT_MATCH if idempotency_key is None else REPORT_MATCH_ONCE
+    with transaction():
+        crud_operation(False, "create", query, [player_one_id, player_two_id,
+                       player_one_points, player_two_points, event_id,
+                       round_number, idempotency_key],
+                       None, False)
+        _changed(event_id)
+        _notify(event_id, round_number, [player_one_id, player_two_id])
+
+
+@instrumented
+def report_round(event_id, round_number, results):
+    """Records the outcome of every match of a round at once.
+
+    The results are checked against the pairings stored for the round:
+    every board must be paired and not reported before, and every paired
+    player must be reported exactly once. Either all the results are
+    stored, in a single transaction and INSERT, or none of them. Once
+    stored the round is finalized, see finalize_round.
+
+    Args:
+      event_id: the id's event
+      round_number: The round that has played
+      results: list of tuples, each of which contains
+        (player_one_id, player_one_points, player_two_id, player_two_points)
+    Returns:
+      A list of tuples, each of which contains (board, message)
+        board: position of the wrong result in `results`, None for a
+               pairing without result
+        message: description of the problem
+      An empty list means the round was stored
     """
-    query = "INSERT INTO matches (player_one, player_two, player_one_score, \
-             player_two_score, event, round_number) \
-             VALUES (%s, %s, %s, %s, %s, %s)"
-    crud_operation(False, "create", query, [player_one_id, player_two_id,
-                   player_one_points, player_two_points, event_id,
-                   round_number],
-                   None, False)
+    with transaction() as db:
+        c = db.cursor()
+        c.execute("SELECT id1, id2, EXISTS (SELECT 1 FROM matches \
+                   WHERE matches.event = pairings.event AND \
+                   matches.round_number = pairings.round_number AND \
+                   matches.player_one IN (id1, id2)) AS reported \
+                   FROM pairings WHERE event=%s AND round_number=%s \
+                   ORDER BY id FOR UPDATE", [event_id, round_number])
+        errors = round_result_errors(c.fetchall(), results, round_number)
+        if not errors:
+            psycopg2.extras.execute_values(
+                c, "INSERT INTO matches (player_one, player_two, \
+                    player_one_score, player_two_score, event, round_number) \
+                    VALUES %s",
+                [(player_one_id, player_two_id, player_one_points,
+                  player_two_points, event_id, round_number)
+                 for (player_one_id, player_one_points, player_two_id,
+                      player_two_points) in results],
+                page_size=max(1, len(results)))
+            finalize_round(event_id, round_number)
+            _changed(event_id)
+            _notify(event_id, round_number,
+                    [player_id for result in results
+                     for player_id in (result[0], result[2])])
+        c.close()
+    return errors
 
 
+@instrumented
 def find_player(player_name):
     """Returns player id if there is an existing player
     with that name
 
     Args:
       player_name:  Name to find
+    Returns:
+      The id of the first player registered with that firstname, -1 if
+      there is none
     """
-    query = "SELECT id FROM players WHERE firstname=%s"
+    query = "SELECT id FROM players WHERE firstname=%s ORDER BY id LIMIT 1"
     row = crud_operation(False, "read", query, [player_name], "one", None)
     if row is not None:
         return row["id"]
     return -1
 
 
-def insert_player_bye(event_id):
-    """ Insert Player Bye to have an even number of players
-    in the current event
+@instrumented
+def lookup_player(firstname, lastname):
+    """Returns the id of a player from his or her exact name.
+
+    Found ids are kept in memory, so repeated lookups (e.g. at a check-in
+    desk) do not reach the database. Players are never renamed and
+    delete_players empties the cache.
+
+    Args:
+      firstname: the player's firstname.
+      lastname: the player's lastname.
+    Returns:
+      The id of the first player registered with that name, -1 if there is
+      none
+    """
+    key = (firstname, lastname)
+    with _player_ids_lock:
+        player_id = _player_ids.get(key)
+    if player_id is not None:
+        return player_id
+    query = "SELECT id FROM players WHERE firstname=%s AND lastname=%s \
+             ORDER BY id LIMIT 1"
+    row = crud_operation(False, "read", query, [firstname, lastname], "one",
+                         None)
+    if row is None:
+        return -1
+    if not get_db().in_transaction():
+        with _player_ids_lock:
+            if len(_player_ids) >= PLAYER_IDS_CACHE_SIZE:
+                _player_ids.clear()
+            _player_ids[key] = row["id"]
+    return row["id"]
+
+
+def _like_prefix(text):
+    """LIKE pattern matching the strings that start with text."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace(
+        "_", "\\_") + "%"
+
+
+@instrumented
+def search_players(text, mode="prefix", limit=20, offset=0):
+    """Searches players by name, ignoring case.
+
+    Modes:
+      exact: the full name, the firstname or the lastname is text.
+      prefix: the full name (so the firstname) or the lastname starts with
+              text.
+      fuzzy: the full name is similar to text (pg_trgm trigrams), the most
+             similar first.
+
+    Args:
+      text: the name, or part of it, to search.
+      mode: 'exact', 'prefix' or 'fuzzy'.
+      limit: maximum number of players returned.
+      offset: number of matching players skipped, for the next pages.
+    Returns:
+      A list of tuples, each of which contains (id, firstname, lastname),
+      sorted by lastname and firstname except for fuzzy searches
     """
-    bye_id = find_player("Bye")
-    if bye_id < 0:
-        bye_id = register_player("Bye", "")
-    add_player_to_event(event_id, bye_id)
+    if mode not in SEARCH_MODES:
+        raise ValueError("Unknown search mode {}, expected one of: {}".format(
+            mode, ", ".join(SEARCH_MODES)))
+    text = text.lower()
+    params = {"text": text, "prefix": _like_prefix(text),
+              "firstname": _like_prefix(text + " "), "limit": limit,
+              "offset": offset}
+    name = "lower(firstname || ' ' || lastname)"
+    if mode == "exact":
+        where = name + " = %(text)s OR " + name + " LIKE %(firstname)s \
+                 OR lower(lastname) = %(text)s"
+        order = "lastname, firstname, id"
+    elif mode == "prefix":
+        where = name + " LIKE %(prefix)s OR lower(lastname) LIKE %(prefix)s"
+        order = "lastname, firstname, id"
+    else:
+        where = name + " %% %(text)s"
+        order = "similarity(" + name + ", %(text)s) DESC, id"
+    query = "SELECT id, firstname, lastname FROM players WHERE " + where + \
+        " ORDER BY " + order + " LIMIT %(limit)s OFFSET %(offset)s"
+    return [tuple(row) for row in crud_operation(False, "read", query,
+                                                 params, "all", None)]
 
 
-def swiss_pairings(event_id, round_number):
+@instrumented
+def swiss_pairings(event_id, round_number, strategy="greedy"):
     """Returns a list of pairs of players for the next round of a match.
 
-    Assuming that there are an even number of players registered, each player
-    appears exactly once in the pairings.  Each player is paired with another
-    player with an equal or nearly-equal win record, that is, a player adjacent
-    to him or her in the standings.
+    Each player appears exactly once in the pairings.  Each player is paired
+    with another player with an equal or nearly-equal win record, that is, a
+    player adjacent to him or her in the standings. With an odd number of
+    players the lowest ranked player without a previous bye gets the bye:
+    a pairing without second player, recorded at once as a match without
+    player_two worth BYE_POINTS.
+
+    The whole round is paired in one transaction holding an advisory lock
+    on the event, so concurrent calls for the same event run one after the
+    other. The previous round is finalized (see finalize_round) first.
+    Standings and the opponents already faced are loaded once, the round
+    is paired in memory (see tournament_pairing) and stored in pairings
+    with a single INSERT.
+
     Args:
       event_id: the id's event.
+      round_number: the round being paired.
+      strategy: 'greedy' pairs down the standings with backtracking, and
+                falls back to 'matching' when it dead-ends, 'matching'
+                solves a minimum-cost perfect matching that never dead-ends
+                in late rounds.
     Returns:
       A list of tuples, each of which contains (id1, name1, id2, name2)
         id1: the first player's unique id
         name1: the first player's name
-        id2: the second player's unique id
-        name2: the second player's name
-    """
-    players_number = count_players_in_event(event_id)
-    if players_number % 2 != 0:
-        insert_player_bye(event_id)
-        players_number = count_players_in_event(event_id)
-
-    procedure = "makeAllPairs"
-    rows = crud_operation(True, "read", procedure, [event_id, round_number,
-                          players_number], "all", None)
-#    print ("\nPairings:{}\n".format(rows))
-    return rows
+        id2: the second player's unique id, None for the bye
+        name2: the second player's name, None for the bye
+    """
+    with transaction() as db:
+        c = db.cursor()
+        c.execute("SELECT pg_advisory_xact_lock(%s, id) FROM events \
+                   WHERE id=%s", [PAIRING_LOCK, event_id])
+        if c.rowcount == 0:
+            raise ValueError("Event {} does not exist.".format(event_id))
+        if round_number > 1:
+            finalize_round(event_id, round_number - 1)
+        # Pairing a round again replaces its pairings and its bye
+        c.execute("DELETE FROM pairings WHERE event=%s AND round_number=%s",
+                  [event_id, round_number])
+        c.execute("DELETE FROM matches WHERE event=%s AND round_number=%s \
+                   AND player_two IS NULL RETURNING player_one",
+                  [event_id, round_number])
+        changed = [row[0] for row in c.fetchall()]
+        c.callproc("standings", [event_id])
+        standings = c.fetchall()
+        c.execute("SELECT player_one FROM matches WHERE event=%s AND \
+                   player_two IS NULL", [event_id])
+        byes = set(row[0] for row in c.fetchall())
+        standings, bye = split_bye(standings, byes)
+        pairs = STRATEGIES[strategy](standings, _played_matrix(c, event_id))
+        rows = [(row1[0], row1[1], row1[2], row2[0], row2[1], row2[2],
+                 event_id, round_number) for row1, row2 in pairs]
+        if bye is not None:
+            rows.append((bye[0], bye[1], bye[2], None, None, None, event_id,
+                         round_number))
+            c.execute("INSERT INTO matches (player_one, player_two, \
+                       player_one_score, player_two_score, event, \
+                       round_number) VALUES (%s, NULL, %s, NULL, %s, %s)",
+                      [bye[0], BYE_POINTS, event_id, round_number])
+            changed.append(bye[0])
+        psycopg2.extras.execute_values(
+            c, "INSERT INTO pairings (id1, name1, points1, id2, name2, \
+                points2, event, round_number) VALUES %s", rows,
+            page_size=max(1, len(rows)))
+        c.close()
+        _changed(event_id)
+        _notify(event_id, round_number, changed, paired=True)
+    return [(row[0], row[1], row[3], row[4]) for row in rows]
+
+
+def _played_matrix(c, event_id):
+    """Returns the PlayedMatrix of an event.
+
+    The matrix kept in memory is brought up to date with the matches stored
+    after it, or built again from every match of the event if some were
+    deleted meanwhile. The result is kept once the current transaction
+    commits.
+
+    Args:
+      c: cursor of the current transaction.
+      event_id: the id's event
+    """
+    version, loaded = _cache.version(event_id), clock()
+    with _played_lock:
+        entry = _played.get(event_id)
+    c.execute("SELECT count(player_two), COALESCE(max(id), 0) FROM matches \
+               WHERE event=%s", [event_id])
+    count, last_id = c.fetchone()
+    matrix = None
+    if entry is not None and count >= entry[1]:
+        c.execute("SELECT player_one, player_two FROM matches \
+                   WHERE event=%s AND id > %s AND player_two IS NOT NULL",
+                  [event_id, entry[2]])
+        rows = c.fetchall()
+        if entry[1] + len(rows) == count:
+            matrix = entry[3].copy() if rows else entry[3]
+            matrix.update(rows)
+    if matrix is None:
+        c.execute("SELECT player_one, player_two FROM matches \
+                   WHERE event=%s AND player_two IS NOT NULL", [event_id])
+        matrix = PlayedMatrix(c.fetchall())
+
+    def keep():
+        with _played_lock:
+            if len(_played) >= PLAYED_CACHE_SIZE and event_id not in _played:
+                _played.clear()
+            _played[event_id] = (version, count, last_id, matrix, loaded)
+    get_db().on_commit(keep)
+    return matrix
+
+
+@instrumented
+def have_played(event_id, player_one_id, player_two_id):
+    """Tells whether two players already met in an event.
+
+    Checks are answered in O(1) from a bit matrix of the event kept in
+    memory. Like the cached reads, it is used as is while the cache is
+    enabled (see configure_cache), and otherwise brought up to date with
+    the matches stored since by a single query.
+
+    Args:
+      event_id: the id's event
+      player_one_id: the id number of the first player
+      player_two_id: the id number of the second player
+    Returns:
+      True if they played a match in the event, byes excluded
+    """
+    if not get_db().in_transaction():
+        with _played_lock:
+            entry = _played.get(event_id)
+        if entry is not None and _cache.valid(event_id, entry[0], entry[4]):
+            return (player_one_id, player_two_id) in entry[3]
+    with read_only() as db:
+        c = db.cursor()
+        matrix = _played_matrix(c, event_id)
+        c.close()
+    return (player_one_id, player_two_id) in matrix
+
+
+def _timed_pairing(request, strategy):
+    event_id, round_number = request
+    start = tournament_metrics.clock()
+    try:
+        pairings, error = swiss_pairings(event_id, round_number,
+                                         strategy), None
+    except Exception as e:
+        pairings, error = None, e
+    return (event_id, round_number, pairings,
+            tournament_metrics.clock() - start, error)
+
+
+@instrumented
+def pair_events(requests, strategy="greedy", workers=None):
+    """Pairs a round of many events at once, e.g. every section of a
+    festival.
+
+    Every event is paired by swiss_pairings in its own transaction, from a
+    pool of worker threads each holding one connection, so the database
+    work of the events overlaps. A failing event does not stop the others.
+    Workers wait for a connection while the pool is exhausted, see
+    TournamentDB.pool_timeout.
+
+    Args:
+      requests: list of (event_id, round_number) tuples.
+      strategy: pairing strategy, see swiss_pairings.
+      workers: number of events paired at the same time, by default the
+               maximum number of connections of the pool (see configure)
+               but one, left to the calling thread.
+    Returns:
+      A list of tuples in the order of requests, each of which contains
+      (event_id, round_number, pairings, seconds, error)
+        pairings: the result of swiss_pairings, None if it failed
+        seconds: time spent pairing the event
+        error: the exception raised, None if the event was paired
+    """
+    requests = list(requests)
+    if not requests:
+        return []
+    if workers is None:
+        workers = get_db().maxconn - 1
+    pool = ThreadPool(max(1, min(workers, len(requests))))
+    try:
+        return pool.map(lambda request: _timed_pairing(request, strategy),
+                        requests)
+    finally:
+        pool.close()
+        pool.join()
+
+
+@instrumented
+def round_pairings(event_id, round_number):
+    """Returns the pairings stored for a round of an event.
+
+    Args:
+      event_id: the id's event.
+      round_number: the round already paired by swiss_pairings.
+    Returns:
+      A list of tuples, each of which contains (id1, name1, id2, name2)
+    """
+    query = "SELECT id1, name1, id2, name2 FROM pairings \
+             WHERE event=%s AND round_number=%s ORDER BY id"
+    return _cached("pairings", event_id, (round_number,),
+                   lambda: crud_operation(False, "read", query,
+                                          [event_id, round_number], "all",
+                                          None))
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+#
+# tournament_admin.py -- maintenance commands for the tournament database
+#
+# Usage:
+#   python tournament_admin.py rebuild-standings [--event ID] [--check]
+#   python tournament_admin.py backfill-snapshots [--event ID]
+#   python tournament_admin.py export TABLE PATH [--event ID] [--format F]
+#   python tournament_admin.py purge [--event ID]... [--before DATE]
+#                                    [--archive]
+#   python tournament_admin.py reset --yes [--keep-players]
+#   python tournament_admin.py partitions [--ahead N]
+
+import argparse
+import sys
+
+from tournament import *
+from tournament_export import EXPORTS, FORMATS, export
+
+
+def cmd_rebuild_standings(args):
+    """Checks or rebuilds the materialized standings."""
+    differences = rebuild_standings(args.event, check_only=args.check)
+    for (event, player, stored_points, stored_matches, points,
+         matches) in differences:
+        print ("event {} player {}: stored {}/{}, computed {}/{}".format(
+            event, player, stored_points, stored_matches, points, matches))
+    if args.check:
+        print ("{} standings rows differ.".format(len(differences)))
+        return 1 if differences else 0
+    print ("{} standings rows rebuilt.".format(len(differences)))
+    return 0
+
+
+def cmd_backfill_snapshots(args):
+    """Takes the missing standings snapshots of past rounds."""
+    rounds = backfill_snapshots(args.event)
+    for event, round_number in rounds:
+        print ("event {} round {}: snapshot taken".format(event,
+                                                          round_number))
+    print ("{} rounds finalized.".format(len(rounds)))
+    return 0
+
+
+def cmd_export(args):
+    """Streams a table of the tournament history to a file."""
+    count = export(args.table, args.path, args.format, args.event,
+                   args.batch_size)
+    print ("{} {} rows exported to {}.".format(count, args.table, args.path))
+    return 0
+
+
+def cmd_purge(args):
+    """Removes (and optionally archives) whole events."""
+    if not args.event and args.before is None:
+        print ("Nothing to purge, give --event or --before.")
+        return 1
+    ids = purge_events(args.event, args.before, archive=args.archive)
+    print ("{} events {}: {}".format(
+        len(ids), "archived" if args.archive else "purged",
+        ", ".join(str(event_id) for event_id in ids)))
+    return 0
+
+
+def cmd_reset(args):
+    """Empties the whole database."""
+    if not args.yes:
+        print ("This erases every event{}, add --yes to confirm.".format(
+            "" if args.keep_players else " and player"))
+        return 1
+    reset_database(keep_players=args.keep_players)
+    print ("Database reset.")
+    return 0
+
+
+def cmd_partitions(args):
+    """Creates the partitions of the next events ahead of time."""
+    created = create_partitions(args.ahead)
+    print ("{} partitions created.".format(created))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Maintenance commands for the tournament database")
+    parser.add_argument("--dsn", help="connection string, by default "
+                        "TOURNAMENT_DSN or dbname=tournament")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    rebuild = commands.add_parser(
+        "rebuild-standings",
+        help="check eventStandings against the stored matches")
+    rebuild.add_argument("--event", type=int, help="only this event")
+    rebuild.add_argument("--check", action="store_true",
+                         help="report the differences without fixing them")
+    rebuild.set_defaults(run=cmd_rebuild_standings)
+
+    backfill = commands.add_parser(
+        "backfill-snapshots",
+        help="take the standings snapshots of rounds played before them")
+    backfill.add_argument("--event", type=int, help="only this event")
+    backfill.set_defaults(run=cmd_backfill_snapshots)
+
+    exporter = commands.add_parser(
+        "export", help="stream matches, pairings or per-round standings "
+        "to CSV or Parquet")
+    exporter.add_argument("table", choices=sorted(EXPORTS))
+    exporter.add_argument("path", help="output file")
+    exporter.add_argument("--event", type=int, help="only this event")
+    exporter.add_argument("--format", choices=FORMATS,
+                          help="by default guessed from the extension")
+    exporter.add_argument("--batch-size", type=int, default=10000,
+                          help="rows fetched at a time")
+    exporter.set_defaults(run=cmd_export)
+
+    purge = commands.add_parser(
+        "purge", help="remove whole events in one transaction")
+    purge.add_argument("--event", type=int, action="append",
+                       help="event to remove, can be repeated")
+    purge.add_argument("--before", help="remove the events dated before "
+                       "this date, e.g. 2015-01-01")
+    purge.add_argument("--archive", action="store_true",
+                       help="move them to the archive schema first")
+    purge.set_defaults(run=cmd_purge)
+
+    reset = commands.add_parser(
+        "reset", help="empty a test database with TRUNCATE")
+    reset.add_argument("--keep-players", action="store_true")
+    reset.add_argument("--yes", action="store_true",
+                       help="confirm that everything is erased")
+    reset.set_defaults(run=cmd_reset)
+
+    partitions = commands.add_parser(
+        "partitions", help="create the partitions of matches and pairings "
+        "of the next events, e.g. daily")
+    partitions.add_argument("--ahead", type=int, default=PARTITIONS_AHEAD,
+                            help="events after the last registered one")
+    partitions.set_defaults(run=cmd_partitions)
+
+    args = parser.parse_args()
+    if args.dsn:
+        configure(args.dsn)
+    sys.exit(args.run(args))
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+#
+# tournament_async.py -- asyncio interface of the Swiss-system tournament
+#
+# Same functions and results as tournament.py for asyncio servers, built
+# on psycopg 3 (https://www.psycopg.org/psycopg3/) and its async pool:
+#
+#   pip install "psycopg[pool]"
+#
+# Requires Python 3.7 or higher. Not mirrored from tournament.py: the
+# transaction() blocks, the read replica, the cache, bulk loads and
+# report_round, tiebreaks, rematch checks (have_played), search and the
+# maintenance functions (purge, rebuild and backfill of standings).
+
+import asyncio
+import os
+
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from tournament_channel import (CHANGED_STANDINGS, SEND_PAYLOADS,
+                                STANDINGS_CHANNEL, changed_players,
+                                standings_payloads)
+from tournament_pairing import (BYE_POINTS, STRATEGIES, PlayedMatrix,
+                                had_byes, split_bye)
+from tournament_queries import (FINALIZE_ROUND, REGISTER_PLAYER,
+                                REGISTER_PLAYER_ONCE, REPORT_MATCH,
+                                REPORT_MATCH_ONCE)
+
+
+DEFAULT_DSN = os.environ.get("TOURNAMENT_DSN", "dbname=tournament")
+
+# Advisory lock held while an event is paired, same as tournament.py
+PAIRING_LOCK = 1
+
+_pool = None
+
+
+async def configure(dsn=DEFAULT_DSN, min_size=1, max_size=10):
+    """Opens the pool used by every function of this module, closing the
+    previous one.
+
+    Args:
+      dsn: libpq connection string of the tournament database.
+      min_size: connections kept open by the pool.
+      max_size: maximum number of connections of the pool.
+    Returns:
+      The new AsyncConnectionPool.
+    """
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+    _pool = AsyncConnectionPool(dsn, min_size=min_size, max_size=max_size,
+                                kwargs={"row_factory": dict_row},
+                                open=False)
+    await _pool.open()
+    return _pool
+
+
+async def get_pool():
+    """Returns the pool of the module, opening it on first use."""
+    if _pool is None:
+        await configure()
+    return _pool
+
+
+async def close():
+    """Closes the pool of the module."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def crud_operation(query, params, expected_rows):
+    """Runs a statement in its own transaction, see tournament.crud_operation
+
+    Args:
+      query: SQL query statement
+      params: Array with params for query
+      expected_rows: 'one' or 'many' if we expect a single row or multiple,
+                     None if the statement returns nothing
+    Returns:
+      None, a single row or a list of rows
+    """
+    pool = await get_pool()
+    async with pool.connection() as db:
+        c = await db.execute(query, params)
+        if expected_rows == "one":
+            return await c.fetchone()
+        if expected_rows == "many":
+            return await c.fetchall()
+    return None
+
+
+async def _notify(db, event_id=None, round_number=None, player_ids=None,
+                  **extra):
+    """Sends the messages of a write on STANDINGS_CHANNEL in its
+    transaction, see tournament._notify
+
+    Args:
+      db: connection of the transaction of the write.
+    """
+    rows = None
+    if player_ids is not None:
+        c = await db.execute(CHANGED_STANDINGS,
+                             [event_id, changed_players(player_ids)])
+        rows = [(row["player"], row["points"], row["matches"])
+                for row in await c.fetchall()]
+    await db.execute(SEND_PAYLOADS, [STANDINGS_CHANNEL, standings_payloads(
+        event_id, round_number, rows, **extra)])
+
+
+async def register_event(name, event_date):
+    """Adds a new event, see tournament.register_event"""
+    query = "INSERT INTO events (name, event_date) \
+             VALUES (%s, %s) RETURNING id"
+    row = await crud_operation(query, [name, event_date], "one")
+    return row["id"]
+
+
+async def count_events():
+    """Returns the number of events, see tournament.count_events"""
+    query = "SELECT count(*) as num FROM events"
+    row = await crud_operation(query, [], "one")
+    return row["num"]
+
+
+async def count_players():
+    """Returns the number of players, see tournament.count_players"""
+    query = "SELECT count(*) as num FROM players"
+    row = await crud_operation(query, [], "one")
+    return row["num"]
+
+
+async def register_player(firstname, lastname, idempotency_key=None):
+    """Adds a player, see tournament.register_player"""
+    if idempotency_key is None:
+        row = await crud_operation(REGISTER_PLAYER, [firstname, lastname],
+                                   "one")
+    else:
+        row = await crud_operation(REGISTER_PLAYER_ONCE,
+                                   [firstname, lastname, idempotency_key],
+                                   "one")
+    return row["id"]
+
+
+async def add_player_to_event(event_id, player_id):
+    """Adds a player into an event, see tournament.add_player_to_event"""
+    pool = await get_pool()
+    async with pool.connection() as db:
+        await db.execute("INSERT INTO playersInEvent (event, player) \
+                          VALUES (%s, %s)", [event_id, player_id])
+        await _notify(db, event_id)
+
+
+async def remove_player_from_event(event_id, player_id):
+    """Removes a player from an event, see
+    tournament.remove_player_from_event"""
+    pool = await get_pool()
+    async with pool.connection() as db:
+        await db.execute("DELETE FROM playersInEvent \
+                          WHERE event=%s AND player=%s", [event_id, player_id])
+        await _notify(db, event_id)
+
+
+async def count_players_in_event(event_id):
+    """Returns the number of players in an event, see
+    tournament.count_players_in_event"""
+    query = "SELECT count(*) as num FROM playersInEvent WHERE event=%s"
+    row = await crud_operation(query, [event_id], "one")
+    return row["num"]
+
+
+async def player_standings(event_id, round_number=None):
+    """Returns the standings of an event, or after a finalized round, see
+    tournament.player_standings
+
+    Returns:
+      A list of tuples, each of which contains (id, name, points, matches)
+    """
+    if round_number is None:
+        query = "SELECT id, name, points, matches FROM standings(%s)"
+        rows = await crud_operation(query, [event_id], "many")
+    else:
+        query = "SELECT id, name, points, matches FROM roundStandings(%s, %s)"
+        rows = await crud_operation(query, [event_id, round_number], "many")
+    return [(row["id"], row["name"], row["points"], row["matches"])
+            for row in rows]
+
+
+async def report_match(event_id, round_number, player_one_id,
+                       player_one_points, player_two_id, player_two_points,
+                       idempotency_key=None):
+    """Records the outcome of a match, see tournament.report_match"""
+    query = REPORT_MATCH if idempotency_key is None else REPORT_MATCH_ONCE
+    pool = await get_pool()
+    async with pool.connection() as db:
+        await db.execute(query, [player_one_id, player_two_id,
+                                 player_one_points, player_two_points,
+                                 event_id, round_number, idempotency_key])
+        await _notify(db, event_id, round_number,
+                      [player_one_id, player_two_id])
+
+
+async def swiss_pairings(event_id, round_number, strategy="greedy"):
+    """Pairs the next round of an event, see tournament.swiss_pairings
+
+    The pairing itself runs in the default executor so the event loop is
+    never blocked.
+
+    Returns:
+      A list of tuples, each of which contains (id1, name1, id2, name2)
+    """
+    pool = await get_pool()
+    async with pool.connection() as db:
+        c = await db.execute("SELECT pg_advisory_xact_lock(%s, id) \
+                              FROM events WHERE id=%s",
+                             [PAIRING_LOCK, event_id])
+        if c.rowcount == 0:
+            raise ValueError("Event {} does not exist.".format(event_id))
+        if round_number > 1:
+            # Finalizes the previous round, see tournament.finalize_round
+            params = {"event": event_id, "round": round_number - 1}
+            for query in FINALIZE_ROUND:
+                await db.execute(query, params)
+        await db.execute("DELETE FROM pairings \
+                          WHERE event=%s AND round_number=%s",
+                         [event_id, round_number])
+        c = await db.execute("DELETE FROM matches WHERE event=%s AND \
+                              round_number=%s AND player_two IS NULL \
+                              RETURNING player_one", [event_id, round_number])
+        changed = [row["player_one"] for row in await c.fetchall()]
+        c = await db.execute("SELECT id, name, points, matches \
+                              FROM standings(%s)", [event_id])
+        standings = [(row["id"], row["name"], row["points"], row["matches"])
+                     for row in await c.fetchall()]
+        c = await db.execute("SELECT player_one, player_two FROM matches \
+                              WHERE event=%s", [event_id])
+        matches = [(row["player_one"], row["player_two"])
+                   for row in await c.fetchall()]
+        standings, bye = split_bye(standings, had_byes(matches))
+        loop = asyncio.get_running_loop()
+        pairs = await loop.run_in_executor(None, STRATEGIES[strategy],
+                                           standings, PlayedMatrix(matches))
+        rows = [(row1[0], row1[1], row1[2], row2[0], row2[1], row2[2],
+                 event_id, round_number) for row1, row2 in pairs]
+        if bye is not None:
+            rows.append((bye[0], bye[1], bye[2], None, None, None, event_id,
+                         round_number))
+            await db.execute("INSERT INTO matches (player_one, player_two, \
+                              player_one_score, player_two_score, event, \
+                              round_number) \
+                              VALUES (%s, NULL, %s, NULL, %s, %s)",
+                             [bye[0], BYE_POINTS, event_id, round_number])
+            changed.append(bye[0])
+        async with db.cursor() as c:
+            await c.executemany(
+                "INSERT INTO pairings (id1, name1, points1, id2, name2, \
+                 points2, event, round_number) \
+                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s)", rows)
+        await _notify(db, event_id, round_number, changed, paired=True)
+    return [(row[0], row[1], row[3], row[4]) for row in rows]
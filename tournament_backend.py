@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#
+# tournament_backend.py -- pluggable storage backends of the tournament API
+#
+# A backend is a module that implements every function named in API with
+# the signatures and results documented in tournament.py.
+
+import importlib
+
+
+# Functions every backend implements
+API = (
+    "transaction",
+    "read_only",
+    "delete_event",
+    "delete_all_events",
+    "delete_all_matches",
+    "delete_matches_from_event",
+    "delete_players",
+    "purge_events",
+    "reset_database",
+    "register_event",
+    "count_events",
+    "count_players",
+    "register_player",
+    "register_players_bulk",
+    "add_player_to_event",
+    "add_players_to_event_bulk",
+    "remove_player_from_event",
+    "count_players_in_event",
+    "player_standings",
+    "rebuild_standings",
+    "finalize_round",
+    "backfill_snapshots",
+    "report_match",
+    "report_round",
+    "find_player",
+    "lookup_player",
+    "search_players",
+    "swiss_pairings",
+    "pair_events",
+    "have_played",
+    "round_pairings",
+)
+
+# Backend name and the module implementing it
+BACKENDS = {
+    "postgres": "tournament",
+    "memory": "tournament_memory",
+}
+
+
+def load_backend(name):
+    """Returns the module implementing the tournament API for a backend.
+
+    Args:
+      name: 'postgres' (tournament.py) or 'memory' (tournament_memory.py).
+    Returns:
+      The backend module
+    """
+    if name not in BACKENDS:
+        raise ValueError("Unknown backend {}, expected one of: {}".format(
+            name, ", ".join(sorted(BACKENDS))))
+    module = importlib.import_module(BACKENDS[name])
+    missing = [function for function in API if not hasattr(module, function)]
+    if missing:
+        raise NotImplementedError("Backend {} does not implement: {}".format(
+            name, ", ".join(missing)))
+    return module
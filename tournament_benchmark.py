@@ -0,0 +1,576 @@
+#!/usr/bin/env python
+#
+# Benchmarks for tournament.py
+#
+# Every benchmark runs against the database configured by TOURNAMENT_DSN
+# (see README) and erases its content, never run it against production data.
+
+import argparse
+import datetime
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import timeit
+
+import tournament_metrics
+from tournament import *
+from tournament_pairing import STRATEGIES, played_pairs
+from tournament_tiebreak import compute_tiebreaks
+
+
+def timed(function, *args):
+    """Runs a function once.
+
+    Returns:
+      A tuple (seconds, result)
+    """
+    start = timeit.default_timer()
+    result = function(*args)
+    return timeit.default_timer() - start, result
+
+
+def synthetic_players(players_number):
+    """Returns a list of (firstname, lastname) tuples for fake players."""
+    return [("Player{}".format(i), "Bench") for i in range(players_number)]
+
+
+def bench_registration(args):
+    """Compares the per-row registration loop with the bulk APIs."""
+    for players_number in args.sizes:
+        players = synthetic_players(players_number)
+
+        delete_all_events()
+        delete_players()
+        event_id = register_event("Registration Benchmark", "2015/12/30")
+
+        def register_loop():
+            for firstname, lastname in players:
+                add_player_to_event(event_id,
+                                    register_player(firstname, lastname))
+
+        loop_time, _ = timed(register_loop)
+
+        delete_all_events()
+        delete_players()
+        event_id = register_event("Registration Benchmark", "2015/12/30")
+
+        def register_bulk():
+            add_players_to_event_bulk(event_id,
+                                      register_players_bulk(players))
+
+        bulk_time, _ = timed(register_bulk)
+        print ("{:>7} players  loop {:8.3f}s  bulk {:8.3f}s  x{:.1f}".format(
+            players_number, loop_time, bulk_time, loop_time / bulk_time))
+
+
+def bench_pairing(args):
+    """Times the in-memory pairing strategies over simulated tournaments,
+    no database is needed."""
+    for players_number in args.sizes:
+        for strategy in args.strategies:
+            rng = random.Random(args.seed)
+            points = dict((i, 0.0) for i in range(players_number))
+            matches = []
+            times = []
+            rematches = short_rounds = 0
+            for round_number in range(args.rounds):
+                standings = sorted(
+                    [(i, "Player{}".format(i), points[i], round_number)
+                     for i in range(players_number)],
+                    key=lambda row: (-row[2], row[1]))
+                played = played_pairs(matches)
+                seconds, pairs = timed(STRATEGIES[strategy], standings,
+                                       played)
+                times.append(seconds)
+                if len(pairs) < players_number // 2:
+                    short_rounds += 1
+                for row1, row2 in pairs:
+                    if (row1[0], row2[0]) in played:
+                        rematches += 1
+                    score = rng.choice([0.0, 0.5, 1.0])
+                    points[row1[0]] += score
+                    points[row2[0]] += 1.0 - score
+                    matches.append((row1[0], row2[0]))
+            print ("{:>6} players {:>2} rounds {:<8}  mean {:7.3f}s  "
+                   "max {:7.3f}s  rematches {:>4}  short rounds {:>2}".format(
+                       players_number, args.rounds, strategy,
+                       sum(times) / len(times), max(times), rematches,
+                       short_rounds))
+
+
+def bench_festival(args):
+    """Pairs the first round of many events one by one and then all at
+    once with pair_events."""
+    delete_all_events()
+    delete_players()
+    create_partitions(args.events)
+    events = []
+    for k in range(args.events):
+        event_id = register_event("Section {}".format(k), "2015/12/30")
+        add_players_to_event_bulk(event_id, register_players_bulk(
+            synthetic_players(args.players)))
+        events.append(event_id)
+
+    def sequential():
+        for event_id in events:
+            swiss_pairings(event_id, 1)
+
+    sequential_time, _ = timed(sequential)
+    parallel_time, results = timed(pair_events,
+                                   [(event_id, 1) for event_id in events],
+                                   "greedy", args.workers)
+    failures = [result for result in results if result[4] is not None]
+    print ("{} events x {} players  sequential {:7.3f}s  pair_events "
+           "{:7.3f}s  x{:.1f}  slowest event {:6.3f}s  failures {}".format(
+               args.events, args.players, sequential_time, parallel_time,
+               sequential_time / parallel_time,
+               max(result[3] for result in results), len(failures)))
+
+
+def bench_async_standings(args):
+    """Hammers player_standings from many coroutines of tournament_async."""
+    import asyncio
+    import tournament_async
+
+    delete_all_events()
+    delete_players()
+    event_id = register_event("Scoreboard Benchmark", "2015/12/30")
+    add_players_to_event_bulk(event_id, register_players_bulk(
+        synthetic_players(args.players)))
+
+    async def spectator(latencies):
+        for i in range(args.requests):
+            start = timeit.default_timer()
+            await tournament_async.player_standings(event_id)
+            latencies.append(timeit.default_timer() - start)
+
+    async def hammer():
+        await tournament_async.configure(min_size=args.pool_size,
+                                         max_size=args.pool_size)
+        latencies = []
+        start = timeit.default_timer()
+        await asyncio.gather(*[spectator(latencies)
+                               for i in range(args.coroutines)])
+        elapsed = timeit.default_timer() - start
+        await tournament_async.close()
+        return elapsed, sorted(latencies)
+
+    elapsed, latencies = asyncio.run(hammer())
+    print ("{} coroutines x {} requests, pool {}: {:.0f} req/s, "
+           "p50 {:.1f}ms, p99 {:.1f}ms".format(
+               args.coroutines, args.requests, args.pool_size,
+               len(latencies) / elapsed,
+               latencies[len(latencies) // 2] * 1000,
+               latencies[int(len(latencies) * 0.99)] * 1000))
+
+
+def naive_tiebreaks(standings, matches):
+    """Buchholz and Sonneborn-Berger the way the opponents() SQL function
+    would give them: a scan of the matches per player and a lookup of
+    every opponent in the standings."""
+    rows = []
+    for row in standings:
+        buchholz = sonneborn_berger = 0.0
+        for player_one, player_one_score, player_two, player_two_score \
+                in matches:
+            if row[0] == player_one:
+                opponent, score = player_two, player_one_score
+            elif row[0] == player_two:
+                opponent, score = player_one, player_two_score
+            else:
+                continue
+            for other in standings:
+                if other[0] == opponent:
+                    buchholz += other[2]
+                    sonneborn_berger += score * other[2]
+        rows.append(tuple(row) + (buchholz, sonneborn_berger))
+    return rows
+
+
+def bench_tiebreaks(args):
+    """Compares the single-pass tiebreaks with a naive per-player
+    computation on simulated events, no database is needed."""
+    for players_number in args.sizes:
+        rng = random.Random(args.seed)
+        points = dict((i, 0.0) for i in range(players_number))
+        played = dict((i, 0) for i in range(players_number))
+        matches = []
+        for round_number in range(args.rounds):
+            standings = sorted(
+                [(i, "Player{}".format(i), points[i], played[i])
+                 for i in range(players_number)],
+                key=lambda row: (-row[2], row[1]))
+            for row1, row2 in STRATEGIES["greedy"](
+                    standings, played_pairs((m[0], m[2]) for m in matches)):
+                score = rng.choice([0.0, 0.5, 1.0])
+                matches.append((row1[0], score, row2[0], 1.0 - score))
+                points[row1[0]] += score
+                points[row2[0]] += 1.0 - score
+                played[row1[0]] += 1
+                played[row2[0]] += 1
+        standings = [(i, "Player{}".format(i), points[i], played[i])
+                     for i in range(players_number)]
+        fast, _ = timed(compute_tiebreaks, standings, matches,
+                        ["buchholz", "sonneborn_berger"])
+        if players_number <= args.naive_max:
+            naive, _ = timed(naive_tiebreaks, standings, matches)
+            naive = "{:8.3f}s".format(naive)
+        else:
+            naive = "  skipped"
+        print ("{:>6} players {:>6} matches  single pass {:8.4f}s  "
+               "naive {}".format(players_number, len(matches), fast, naive))
+
+
+def summary(times):
+    """Returns the number of calls and the total, mean, median, 95th
+    percentile and maximum of a list of durations, in seconds."""
+    ordered = sorted(times)
+    if not ordered:
+        return {"calls": 0}
+    return {"calls": len(ordered), "total": sum(ordered),
+            "mean": sum(ordered) / len(ordered),
+            "p50": ordered[len(ordered) // 2],
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max": ordered[-1]}
+
+
+class _Rollback(Exception):
+    """Raised to undo the writes of an EXPLAIN ANALYZE."""
+
+
+def explain_analyze(query, params):
+    """Runs EXPLAIN ANALYZE of a statement and rolls back its writes.
+
+    Returns:
+      The plan, as given by EXPLAIN (FORMAT JSON)
+    """
+    plan = []
+    try:
+        with transaction() as db:
+            c = db.cursor()
+            c.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query,
+                      params)
+            plan.append(c.fetchone()[0])
+            c.close()
+            raise _Rollback()
+    except _Rollback:
+        pass
+    return plan[0]
+
+
+def current_commit():
+    """Returns the git commit of the working tree, None outside git."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            stderr=subprocess.STDOUT).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Timed calls of each run of the suite
+SUITE_CALLS = ("register_player", "add_player_to_event", "swiss_pairings",
+               "report_match", "player_standings")
+
+
+def bench_suite(args):
+    """Plays a full tournament for each field size with the per-row API
+    and times every call, then saves the results as JSON."""
+    results = []
+    for players_number in args.sizes:
+        rng = random.Random(args.seed)
+        rounds = args.rounds or int(math.ceil(math.log(players_number, 2)))
+        delete_all_events()
+        delete_players()
+        event_id = register_event("Benchmark Suite", "2015/12/30")
+        times = dict((name, []) for name in SUITE_CALLS)
+
+        for firstname, lastname in synthetic_players(players_number):
+            seconds, player_id = timed(register_player, firstname, lastname)
+            times["register_player"].append(seconds)
+            seconds, _ = timed(add_player_to_event, event_id, player_id)
+            times["add_player_to_event"].append(seconds)
+
+        for round_number in range(1, rounds + 1):
+            seconds, pairings = timed(swiss_pairings, event_id,
+                                      round_number, args.strategy)
+            times["swiss_pairings"].append(seconds)
+            for id1, name1, id2, name2 in pairings:
+                if id2 is None:
+                    continue
+                score = rng.choice([0.0, 0.5, 1.0])
+                seconds, _ = timed(report_match, event_id, round_number,
+                                   id1, score, id2, 1.0 - score)
+                times["report_match"].append(seconds)
+            seconds, _ = timed(player_standings, event_id)
+            times["player_standings"].append(seconds)
+
+        result = dict((name, summary(values))
+                      for name, values in times.items())
+        result["players"] = players_number
+        result["rounds"] = rounds
+        result["swiss_pairings"]["per_round"] = times["swiss_pairings"]
+        result["explain"] = {"standings": explain_analyze(
+            "SELECT * FROM standings(%s)", [event_id])}
+        results.append(result)
+        print ("{:>6} players {:>2} rounds  register {:6.2f}ms  "
+               "add {:6.2f}ms  report {:6.2f}ms  standings {:7.2f}ms  "
+               "pairing {:8.2f}ms".format(
+                   players_number, rounds,
+                   result["register_player"]["mean"] * 1000,
+                   result["add_player_to_event"]["mean"] * 1000,
+                   result["report_match"]["mean"] * 1000,
+                   result["player_standings"]["mean"] * 1000,
+                   result["swiss_pairings"]["mean"] * 1000))
+
+    report = {"commit": current_commit(),
+              "created": datetime.datetime.utcnow().isoformat() + "Z",
+              "python": platform.python_version(),
+              "strategy": args.strategy, "seed": args.seed,
+              "results": results}
+    with open(args.output, "w") as out:
+        json.dump(report, out, indent=2, sort_keys=True)
+    print ("Results saved to {}".format(args.output))
+
+
+def bench_compare(args):
+    """Compares the mean times of two saved runs of the suite.
+
+    Returns:
+      1 if a call got slower than the threshold allows, 0 otherwise
+    """
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    before = dict((result["players"], result)
+                  for result in baseline["results"])
+    regressions = 0
+    print ("{} -> {}".format(baseline.get("commit"), current.get("commit")))
+    for result in current["results"]:
+        old = before.get(result["players"])
+        if old is None:
+            continue
+        for name in SUITE_CALLS:
+            if not old[name].get("mean") or "mean" not in result[name]:
+                continue
+            ratio = result[name]["mean"] / old[name]["mean"]
+            slower = ratio > args.threshold
+            regressions += slower
+            print ("{:>6} players  {:<20} {:9.3f}ms -> {:9.3f}ms  "
+                   "x{:.2f}{}".format(result["players"], name,
+                                      old[name]["mean"] * 1000,
+                                      result[name]["mean"] * 1000, ratio,
+                                      "  REGRESSION" if slower else ""))
+    return 1 if regressions else 0
+
+
+def load_history(matches_number, players, event_matches, batch_events=100):
+    """Stores finished events of synthetic matches, generated by the
+    server, batch_events events per transaction.
+
+    Args:
+      matches_number: number of matches to add, rounded up to whole events.
+      players: ids of the players of the matches.
+      event_matches: matches of every event.
+      batch_events: events inserted per transaction.
+    Returns:
+      The number of matches added
+    """
+    events_number = -(-matches_number // event_matches)
+    half = max(1, len(players) // 2)
+    added = 0
+    while events_number > 0:
+        batch = min(batch_events, events_number)
+        create_partitions(batch)
+        with transaction() as db:
+            c = db.cursor()
+            c.execute("INSERT INTO events (name, event_date) \
+                       SELECT 'History ' || g, '2010-01-01' \
+                       FROM generate_series(1, %s) AS g RETURNING id",
+                      [batch])
+            event_ids = [row[0] for row in c.fetchall()]
+            c.execute("INSERT INTO matches (player_one, player_two, \
+                       player_one_score, player_two_score, event, \
+                       round_number) \
+                       SELECT (%(players)s::integer[])[1 + 2 * g %% %(n)s], \
+                       (%(players)s::integer[])[1 + (2 * g + 1) %% %(n)s], \
+                           1.0, 0.0, e, 1 + g / %(half)s \
+                       FROM unnest(%(events)s::integer[]) AS e, \
+                           generate_series(0, %(matches)s - 1) AS g",
+                      {"players": list(players), "n": len(players),
+                       "half": half, "events": event_ids,
+                       "matches": event_matches})
+            added += c.rowcount
+            c.close()
+        events_number -= batch
+    return added
+
+
+def scanned_relations(plan):
+    """Returns the names of the tables read by an EXPLAIN (FORMAT JSON)
+    plan."""
+    names = set()
+    nodes = [node["Plan"] for node in plan]
+    while nodes:
+        node = nodes.pop()
+        if "Relation Name" in node:
+            names.add(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return names
+
+
+def bench_history(args):
+    """Plays live rounds while the history of matches grows, to check that
+    their latency does not depend on the size of the history."""
+    reset_database()
+    history_players = register_players_bulk(synthetic_players(args.players))
+    rng = random.Random(args.seed)
+    history = 0
+    for size in args.sizes:
+        if size > history:
+            history += load_history(size - history, history_players,
+                                    args.event_matches)
+        with transaction() as db:
+            c = db.cursor()
+            c.execute("ANALYZE matches")
+            c.execute("SELECT count(*) FROM pg_inherits \
+                       WHERE inhparent = 'matches'::regclass")
+            partitions = c.fetchone()[0]
+            c.close()
+
+        create_partitions(1)
+        event_id = register_event("Live Round", "2015/12/30")
+        add_players_to_event_bulk(event_id, register_players_bulk(
+            synthetic_players(args.players)))
+        times = {"swiss_pairings": [], "report_match": [],
+                 "player_standings": [], "computedStandings": []}
+        for round_number in range(1, args.rounds + 1):
+            seconds, pairings = timed(swiss_pairings, event_id, round_number)
+            times["swiss_pairings"].append(seconds)
+            for id1, name1, id2, name2 in pairings:
+                if id2 is None:
+                    continue
+                score = rng.choice([0.0, 0.5, 1.0])
+                seconds, _ = timed(report_match, event_id, round_number,
+                                   id1, score, id2, 1.0 - score)
+                times["report_match"].append(seconds)
+            seconds, _ = timed(player_standings, event_id)
+            times["player_standings"].append(seconds)
+            seconds, _ = timed(crud_operation, True, "read",
+                               "computedStandings", [event_id], "all", None)
+            times["computedStandings"].append(seconds)
+
+        scanned = [name for name in scanned_relations(explain_analyze(
+            "SELECT * FROM computedStandings(%s)", [event_id]))
+            if name.startswith("matches")]
+        means = dict((name, summary(values)["mean"] * 1000)
+                     for name, values in times.items())
+        print ("{:>9} matches {:>5} partitions  pairing {:7.2f}ms  "
+               "report {:6.2f}ms  standings {:6.2f}ms  computed {:7.2f}ms  "
+               "partitions read {}".format(
+                   history, partitions, means["swiss_pairings"],
+                   means["report_match"], means["player_standings"],
+                   means["computedStandings"], len(scanned)))
+
+
+def parse_sizes(value):
+    """Parses a comma separated list of field sizes."""
+    return [int(size) for size in value.split(",")]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="tournament.py benchmarks")
+    parser.add_argument("--metrics", action="store_true",
+                        help="print the latency histograms of every "
+                        "function and query at the end")
+    benchmarks = parser.add_subparsers(dest="benchmark")
+    benchmarks.required = True
+
+    registration = benchmarks.add_parser(
+        "registration", help="per-row loop versus bulk registration")
+    registration.add_argument("--sizes", type=parse_sizes,
+                              default=[1000, 10000])
+    registration.set_defaults(run=bench_registration)
+
+    pairing = benchmarks.add_parser(
+        "pairing", help="in-memory pairing strategies, no database needed")
+    pairing.add_argument("--sizes", type=parse_sizes,
+                         default=[64, 512, 2000, 5000])
+    pairing.add_argument("--rounds", type=int, default=9)
+    pairing.add_argument("--strategies", type=lambda v: v.split(","),
+                         default=sorted(STRATEGIES))
+    pairing.add_argument("--seed", type=int, default=2015)
+    pairing.set_defaults(run=bench_pairing)
+
+    festival = benchmarks.add_parser(
+        "festival", help="sequential swiss_pairings versus pair_events")
+    festival.add_argument("--events", type=int, default=30)
+    festival.add_argument("--players", type=int, default=200)
+    festival.add_argument("--workers", type=int,
+                          help="by default the size of the pool")
+    festival.set_defaults(run=bench_festival)
+
+    async_standings = benchmarks.add_parser(
+        "async-standings",
+        help="concurrent player_standings calls with tournament_async")
+    async_standings.add_argument("--players", type=int, default=256)
+    async_standings.add_argument("--coroutines", type=int, default=1000)
+    async_standings.add_argument("--requests", type=int, default=20)
+    async_standings.add_argument("--pool-size", type=int, default=10)
+    async_standings.set_defaults(run=bench_async_standings)
+
+    tiebreaks = benchmarks.add_parser(
+        "tiebreaks", help="single-pass versus per-player tiebreaks, no "
+        "database needed")
+    tiebreaks.add_argument("--sizes", type=parse_sizes,
+                           default=[100, 500, 1000, 5000])
+    tiebreaks.add_argument("--rounds", type=int, default=9)
+    tiebreaks.add_argument("--naive-max", type=int, default=1000,
+                           help="largest field timed with the naive version")
+    tiebreaks.add_argument("--seed", type=int, default=2015)
+    tiebreaks.set_defaults(run=bench_tiebreaks)
+
+    history = benchmarks.add_parser(
+        "history", help="live round latency as the history of matches "
+        "grows")
+    history.add_argument("--sizes", type=parse_sizes,
+                         default=[10000, 100000, 1000000, 10000000],
+                         help="matches stored before each live event")
+    history.add_argument("--players", type=int, default=64)
+    history.add_argument("--rounds", type=int, default=6)
+    history.add_argument("--event-matches", type=int, default=1000,
+                         help="matches of every past event")
+    history.add_argument("--seed", type=int, default=2015)
+    history.set_defaults(run=bench_history)
+
+    suite = benchmarks.add_parser(
+        "suite", help="full tournaments timed call by call, saved as JSON")
+    suite.add_argument("--sizes", type=parse_sizes,
+                       default=[64, 512, 2000, 10000])
+    suite.add_argument("--rounds", type=int,
+                       help="by default log2 of the number of players")
+    suite.add_argument("--strategy", choices=sorted(STRATEGIES),
+                       default="greedy")
+    suite.add_argument("--seed", type=int, default=2015)
+    suite.add_argument("--output", default="benchmark.json")
+    suite.set_defaults(run=bench_suite)
+
+    compare = benchmarks.add_parser(
+        "compare", help="compare two JSON results of the suite")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=1.2,
+                         help="slowdown ratio reported as a regression")
+    compare.set_defaults(run=bench_compare)
+
+    args = parser.parse_args()
+    if args.metrics:
+        tournament_metrics.enable()
+    status = args.run(args)
+    if args.metrics:
+        print (tournament_metrics.render())
+    sys.exit(status or 0)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+#
+# tournament_cache.py -- read-through cache of event standings and pairings
+#
+# Entries are keyed by the version of their event. Every write of this
+# process bumps that version, so an entry loaded before such a write can
+# never be served after it. Writes of other processes are not seen: entries
+# expire after a time to live instead.
+
+import copy
+import sys
+import threading
+import timeit
+from collections import OrderedDict
+
+clock = timeit.default_timer
+
+
+def _sizeof(value):
+    """Approximate memory used by a result: rows of scalars."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        for row in value:
+            size += sys.getsizeof(row)
+            if isinstance(row, (list, tuple)):
+                size += sum(sys.getsizeof(field) for field in row)
+    return size
+
+
+class VersionedCache(object):
+    """Thread-safe LRU cache of read results, keyed by (event, version).
+
+    Results are lists of rows, every call of get returns a copy of the rows
+    so that callers can not change the cached ones.
+
+    Args:
+      max_entries: maximum number of cached results, 0 disables the cache.
+      max_bytes: approximate memory cap of the cached results.
+      ttl: seconds a result is served for, None to serve it until the next
+           write of this process.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024,
+                 ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._generation = 0
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def enabled(self):
+        """Returns True if results are cached."""
+        return self.max_entries > 0
+
+    def version(self, event_id):
+        """Returns the current version of an event."""
+        with self._lock:
+            return (self._generation, self._versions.get(event_id, 0))
+
+    def valid(self, event_id, version, loaded):
+        """Tells whether a result derived from the database may still be
+        served: the cache is enabled, the result is younger than ttl and the
+        event was not written since.
+
+        Args:
+          event_id: the id's event the result depends on.
+          version: version of the event taken before loading the result.
+          loaded: time the result was loaded at, see clock.
+        """
+        if not self.enabled():
+            return False
+        if self.ttl is not None and clock() - loaded > self.ttl:
+            return False
+        return version == self.version(event_id)
+
+    def bump(self, event_id=None):
+        """Invalidates the cached results of an event, or of every event
+        if event_id is None."""
+        with self._lock:
+            if event_id is None:
+                self._generation += 1
+                self._versions.clear()
+                self._entries.clear()
+                self._bytes = 0
+                return
+            self._versions[event_id] = self._versions.get(event_id, 0) + 1
+            for key in [key for key in self._entries if key[1] == event_id]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def get(self, kind, event_id, args, loader):
+        """Returns a cached result or loads and caches it.
+
+        Args:
+          kind: name of the cached read, e.g. 'standings'.
+          event_id: the id's event the result depends on.
+          args: hashable tuple with the other arguments of the read.
+          loader: function without arguments that reads the result.
+        """
+        if not self.enabled():
+            return loader()
+        # The version is taken before loading: a write committed while
+        # loading makes this entry unreachable instead of stale.
+        key = (kind, event_id, args, self.version(event_id))
+        now = clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or
+                                      now - entry[2] <= self.ttl):
+                self._entries[key] = self._entries.pop(key)
+                self.hits += 1
+                return [copy.copy(row) for row in entry[0]]
+            if entry is not None:
+                self._bytes -= self._entries.pop(key)[1]
+            self.misses += 1
+        value = loader()
+        size = _sizeof(value)
+        with self._lock:
+            if key[3] != (self._generation,
+                          self._versions.get(event_id, 0)):
+                return value
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size, now)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     self._bytes > self.max_bytes):
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+                self.evictions += 1
+        return [copy.copy(row) for row in value]
+
+    def stats(self):
+        """Returns the hit/miss counters and the size of the cache."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self._bytes}
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+#
+# tournament_channel.py -- messages of the standings NOTIFY channel
+#
+# The write functions of tournament.py and tournament_async.py send the
+# same messages on STANDINGS_CHANNEL, read by tournament_notify.py. This
+# module builds them without depending on a database driver: the caller
+# runs CHANGED_STANDINGS and then SEND_PAYLOADS in the transaction of the
+# write, so the messages are delivered once it commits.
+
+import json
+
+
+# Channel of the NOTIFY messages sent when standings change
+STANDINGS_CHANNEL = "tournament_standings"
+# Players per message, keeping the payloads under the 8000 bytes limit
+NOTIFY_PLAYERS = 200
+
+# Reads the new standings of the players a message is about, with the
+# event and a list of player ids as parameters
+CHANGED_STANDINGS = "SELECT player, points, matches FROM eventStandings \
+                     WHERE event=%s AND player = ANY(%s) ORDER BY player"
+# Sends a list of payloads on a channel, in a single statement
+SEND_PAYLOADS = "SELECT pg_notify(%s, payload) \
+                 FROM unnest(%s::text[]) AS payload"
+
+
+def standings_payloads(event_id=None, round_number=None, rows=None,
+                       **extra):
+    """Builds the payloads telling that the standings of an event changed.
+
+    The message is a JSON object with 'event' and either 'resync' (read
+    again the standings of the event, of every event if event_id is None)
+    or 'round' and 'standings', the new [player, points, matches] of the
+    players changed. Long lists are split over several messages.
+
+    Args:
+      event_id: the id's event, None for every event.
+      round_number: the round the change belongs to.
+      rows: the [player, points, matches] rows read by CHANGED_STANDINGS,
+            None to ask for a resync.
+      extra: other keys of the message, e.g. paired=True.
+    Returns:
+      A list of JSON strings, the parameter of SEND_PAYLOADS
+    """
+    if rows is None:
+        messages = [{"event": event_id, "resync": True}]
+    else:
+        rows = [list(row) for row in rows]
+        messages = [dict(extra, event=event_id, round=round_number,
+                         standings=rows[k:k + NOTIFY_PLAYERS])
+                    for k in range(0, max(1, len(rows)), NOTIFY_PLAYERS)]
+    return [json.dumps(message, sort_keys=True, separators=(",", ":"))
+            for message in messages]
+
+
+def changed_players(player_ids):
+    """Returns the ids of the players changed by a write, without the None
+    of a bye, the parameter of CHANGED_STANDINGS."""
+    return [player_id for player_id in player_ids if player_id is not None]
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+#
+# tournament_export.py -- streaming export of the tournament history
+#
+# Matches, pairings and per-round standings are read through server-side
+# (named) cursors in fixed-size batches and written as they arrive, so the
+# memory used does not depend on the number of rows exported. Parquet
+# output requires pyarrow:
+#
+#   pip install pyarrow
+
+import csv
+
+from tournament import read_only
+
+
+# Exportable tables: columns with their Parquet type, and the query
+# reading them for one event (or every event if %(event)s is NULL)
+EXPORTS = {
+    "matches": (
+        [("id", "int64"), ("event", "int64"), ("round_number", "int64"),
+         ("player_one", "int64"), ("player_one_score", "float64"),
+         ("player_two", "int64"), ("player_two_score", "float64")],
+        "SELECT id, event, round_number, player_one, player_one_score, \
+                player_two, player_two_score \
+         FROM matches \
+         WHERE %(event)s IS NULL OR event = %(event)s \
+         ORDER BY event, round_number, id"),
+    "pairings": (
+        [("id", "int64"), ("event", "int64"), ("round_number", "int64"),
+         ("id1", "int64"), ("name1", "string"), ("points1", "float64"),
+         ("id2", "int64"), ("name2", "string"), ("points2", "float64")],
+        "SELECT id, event, round_number, id1, name1, points1, \
+                id2, name2, points2 \
+         FROM pairings \
+         WHERE %(event)s IS NULL OR event = %(event)s \
+         ORDER BY event, round_number, id"),
+    # Points and matches of every player after each round he or she played
+    "standings": (
+        [("event", "int64"), ("round_number", "int64"), ("player", "int64"),
+         ("name", "string"), ("points", "float64"), ("matches", "int64")],
+        "SELECT r.event, r.round_number, r.player, \
+                p.firstname || ' ' || p.lastname AS name, \
+                r.points, r.matches \
+         FROM (SELECT event, round_number, player, \
+                      sum(sum(score)) OVER w AS points, \
+                      (sum(count(*)) OVER w)::bigint AS matches \
+               FROM (SELECT event, round_number, player_one AS player, \
+                            player_one_score AS score \
+                     FROM matches \
+                     WHERE %(event)s IS NULL OR event = %(event)s \
+                     UNION ALL \
+                     SELECT event, round_number, player_two, \
+                            player_two_score \
+                     FROM matches \
+                     WHERE %(event)s IS NULL OR event = %(event)s) AS s \
+               GROUP BY event, round_number, player \
+               WINDOW w AS (PARTITION BY event, player \
+                            ORDER BY round_number)) AS r \
+         JOIN players p ON p.id = r.player \
+         ORDER BY r.event, r.round_number, r.points DESC, name"),
+}
+
+FORMATS = ("csv", "parquet")
+
+
+def iter_batches(table, event_id=None, batch_size=10000):
+    """Reads an exportable table in batches through a named cursor.
+
+    The rows stay on the server until they are fetched, at most batch_size
+    at a time. The generator holds a pooled connection (of the replica if
+    there is one) and its transaction until it is exhausted or closed.
+
+    Args:
+      table: 'matches', 'pairings' or 'standings', see EXPORTS.
+      event_id: only export this event, every event if None.
+      batch_size: rows fetched per round trip.
+    Yields:
+      Lists of at most batch_size tuples, in the column order of EXPORTS
+    """
+    if table not in EXPORTS:
+        raise ValueError("Unknown table {}, expected one of: {}".format(
+            table, ", ".join(sorted(EXPORTS))))
+    query = EXPORTS[table][1]
+    with read_only() as db:
+        c = db.cursor(name="export_{}".format(table))
+        c.itersize = batch_size
+        try:
+            c.execute(query, {"event": event_id})
+            while True:
+                rows = c.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            c.close()
+
+
+def export_csv(table, out, event_id=None, batch_size=10000):
+    """Writes a table as CSV with a header line.
+
+    Args:
+      table: 'matches', 'pairings' or 'standings', see EXPORTS.
+      out: file object opened for writing text.
+      event_id: only export this event, every event if None.
+      batch_size: rows fetched and written at a time.
+    Returns:
+      The number of rows written
+    """
+    writer = csv.writer(out)
+    writer.writerow([name for name, _ in EXPORTS[table][0]])
+    count = 0
+    for rows in iter_batches(table, event_id, batch_size):
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def export_parquet(table, path, event_id=None, batch_size=10000):
+    """Writes a table as a Parquet file, one row group per batch.
+
+    Args:
+      table: 'matches', 'pairings' or 'standings', see EXPORTS.
+      path: name of the Parquet file.
+      event_id: only export this event, every event if None.
+      batch_size: rows fetched and written at a time.
+    Returns:
+      The number of rows written
+    """
+    import pyarrow
+    import pyarrow.parquet
+
+    columns = EXPORTS[table][0]
+    schema = pyarrow.schema([(name, getattr(pyarrow, kind)())
+                             for name, kind in columns])
+    count = 0
+    writer = pyarrow.parquet.ParquetWriter(path, schema)
+    try:
+        for rows in iter_batches(table, event_id, batch_size):
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array([row[k] for row in rows], type=field.type)
+                 for k, field in enumerate(schema)], schema=schema))
+            count += len(rows)
+    finally:
+        writer.close()
+    return count
+
+
+def export(table, path, file_format=None, event_id=None, batch_size=10000):
+    """Exports a table to a file.
+
+    Args:
+      table: 'matches', 'pairings' or 'standings', see EXPORTS.
+      path: name of the output file.
+      file_format: 'csv' or 'parquet', guessed from the extension of path
+                   if None.
+      event_id: only export this event, every event if None.
+      batch_size: rows fetched and written at a time.
+    Returns:
+      The number of rows written
+    """
+    if file_format is None:
+        file_format = "parquet" if path.endswith(".parquet") else "csv"
+    if file_format not in FORMATS:
+        raise ValueError("Unknown format {}, expected one of: {}".format(
+            file_format, ", ".join(FORMATS)))
+    if file_format == "parquet":
+        return export_parquet(table, path, event_id, batch_size)
+    with open(path, "w") as out:
+        return export_csv(table, out, event_id, batch_size)
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+#
+# tournament_journal.py -- write-ahead journal of results and registrations
+#
+# At venues with an unreliable link to the database, results and
+# registrations are first appended to a local JSON lines file, synced to
+# disk, and then written to the database in batches by a background
+# thread. Every entry carries an idempotency key stored with the match or
+# the player, so an entry written again after a crash or a lost connection
+# is ignored by the database. Standings read through the journal include
+# the entries not written yet, and the last standings read while the
+# database can not be reached.
+#
+#   journal = Journal("results.journal")
+#   journal.start()
+#   journal.report_match(event_id, 1, player_one_id, 1.0, player_two_id, 0.0)
+
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+try:
+    import psycopg2
+    import psycopg2.pool
+    # Errors meaning the database can not be reached, the entries are kept
+    OFFLINE_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError,
+                      psycopg2.pool.PoolError)
+except ImportError:
+    OFFLINE_ERRORS = ()
+
+# Size of the journal file above which it is compacted once every entry
+# has been written
+COMPACT_BYTES = 1024 * 1024
+
+
+class Journal(object):
+    """Durable queue of results and registrations for the database.
+
+    The journal file holds one JSON object per line: the entries, each one
+    with its key, operation and arguments, and then a 'done' (with the id
+    of a registered player) or 'failed' line for each of them. Entries
+    without one are written again when the journal is opened.
+
+    Args:
+      path: name of the journal file, created if missing.
+      backend: module implementing the tournament API (see
+               tournament_backend), tournament.py by default.
+      batch_size: entries written per transaction.
+      interval: seconds between two flushes of the background thread.
+      sync: sync the file to disk after every entry.
+    """
+
+    def __init__(self, path, backend=None, batch_size=100, interval=1.0,
+                 sync=True):
+        if backend is None:
+            import tournament as backend
+        self.path = path
+        self.backend = backend
+        self.batch_size = batch_size
+        self.interval = interval
+        self.sync = sync
+        self.last_error = None
+        self._lock = threading.RLock()
+        self._pending = OrderedDict()
+        self._players = {}
+        self._failed = {}
+        self._standings = {}
+        self._load()
+        self._file = open(path, "a")
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load(self):
+        """Reads back the journal file, a torn last line is ignored."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._apply(record)
+
+    def _apply(self, record):
+        if "op" in record:
+            self._pending[record["key"]] = record
+        elif "done" in record:
+            self._pending.pop(record["done"], None)
+            if record.get("result") is not None:
+                self._players[record["done"]] = record["result"]
+        elif "failed" in record:
+            self._failed[record["failed"]] = (
+                self._pending.pop(record["failed"], None), record["error"])
+
+    def _append(self, records):
+        """Appends records to the file and syncs it, then applies them."""
+        with self._lock:
+            for record in records:
+                self._file.write(json.dumps(record, sort_keys=True) + "\n")
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+            for record in records:
+                self._apply(record)
+
+    def _add(self, operation, args):
+        key = uuid.uuid4().hex
+        self._append([{"key": key, "op": operation, "args": args}])
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return key
+
+    def report_match(self, event_id, round_number, player_one_id,
+                     player_one_points, player_two_id, player_two_points):
+        """Journals the outcome of a match, see tournament.report_match.
+        Players registered through the journal and not written yet are
+        given by the key returned by register_player.
+
+        Returns:
+          The idempotency key of the result
+        """
+        return self._add("report_match", [event_id, round_number,
+                                          player_one_id, player_one_points,
+                                          player_two_id, player_two_points])
+
+    def register_player(self, firstname, lastname, event_id=None):
+        """Journals the registration of a player, see
+        tournament.register_player.
+
+        Args:
+          firstname: the player's firstname.
+          lastname: the player's lastname.
+          event_id: optional event the player is added to.
+        Returns:
+          The idempotency key of the registration, see player_id
+        """
+        return self._add("register_player", [firstname, lastname, event_id])
+
+    def player_id(self, key):
+        """Returns the id of a player registered through the journal, None
+        until the registration is written."""
+        with self._lock:
+            return self._players.get(key)
+
+    def pending(self):
+        """Returns the entries not written yet, in the order they were
+        journaled."""
+        with self._lock:
+            return list(self._pending.values())
+
+    def failed(self):
+        """Returns {key: (entry, error)} for the entries the database
+        refused, e.g. results of an unknown event. They are not retried."""
+        with self._lock:
+            return dict(self._failed)
+
+    def _resolve(self, player, written):
+        """Id of a player given by id or by registration key."""
+        if player in written:
+            return written[player]
+        return self._players.get(player, player)
+
+    def _write(self, batch):
+        """Writes entries in a single transaction.
+
+        Returns:
+          {key: player id or None} for the entries written
+        """
+        written = {}
+        with self.backend.transaction():
+            for entry in batch:
+                args = entry["args"]
+                if entry["op"] == "register_player":
+                    firstname, lastname, event_id = args
+                    player_id = self.backend.register_player(
+                        firstname, lastname, idempotency_key=entry["key"])
+                    if event_id is not None and player_id not in [
+                            row[0] for row in
+                            self.backend.player_standings(event_id)]:
+                        self.backend.add_player_to_event(event_id, player_id)
+                    written[entry["key"]] = player_id
+                else:
+                    event_id, round_number = args[:2]
+                    self.backend.report_match(
+                        event_id, round_number,
+                        self._resolve(args[2], written), args[3],
+                        self._resolve(args[4], written), args[5],
+                        idempotency_key=entry["key"])
+                    written[entry["key"]] = None
+        return written
+
+    def flush(self):
+        """Writes the pending entries, batch_size per transaction, in the
+        order they were journaled.
+
+        A batch refused by the database is written again entry by entry,
+        and the entries still refused are set aside, see failed.
+
+        Returns:
+          The number of entries written
+        Raises:
+          One of OFFLINE_ERRORS if the database can not be reached, the
+          entries not written yet being kept
+        """
+        count = 0
+        while True:
+            batch = self.pending()[:self.batch_size]
+            if not batch:
+                break
+            try:
+                batches = [(batch, self._write(batch))]
+            except OFFLINE_ERRORS:
+                raise
+            except Exception:
+                batches = [([entry], None) for entry in batch]
+            for entries, written in batches:
+                if written is None:
+                    try:
+                        written = self._write(entries)
+                    except OFFLINE_ERRORS:
+                        raise
+                    except Exception as e:
+                        self._append([{"failed": entries[0]["key"],
+                                       "error": str(e)}])
+                        continue
+                self._append([{"done": entry["key"],
+                               "result": written[entry["key"]]}
+                              for entry in entries])
+                count += len(entries)
+        self.compact()
+        return count
+
+    def compact(self, max_bytes=COMPACT_BYTES):
+        """Rewrites a journal file larger than max_bytes without the
+        written entries, once there is no pending entry left. The ids of
+        the registered players and the failed entries are kept."""
+        with self._lock:
+            if self._pending or os.path.getsize(self.path) <= max_bytes:
+                return
+            records = [{"done": key, "result": player_id}
+                       for key, player_id in self._players.items()]
+            for key, (entry, error) in self._failed.items():
+                if entry is not None:
+                    records.append(entry)
+                records.append({"failed": key, "error": error})
+            temporary = self.path + ".tmp"
+            with open(temporary, "w") as f:
+                for record in records:
+                    f.write(json.dumps(record, sort_keys=True) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.rename(temporary, self.path)
+            self._file = open(self.path, "a")
+
+    def player_standings(self, event_id):
+        """Returns the standings of an event including the entries not
+        written yet, see tournament.player_standings.
+
+        While the database can not be reached, the last standings read
+        through the journal are used. Players registered and not written
+        yet have their registration key as id.
+
+        Returns:
+          A list of tuples (id, name, points, matches) sorted by points and
+          then by name
+        """
+        try:
+            rows = [tuple(row[:4])
+                    for row in self.backend.player_standings(event_id)]
+            with self._lock:
+                self._standings[event_id] = rows
+        except OFFLINE_ERRORS:
+            with self._lock:
+                rows = self._standings.get(event_id)
+            if rows is None:
+                raise
+        with self._lock:
+            pending = list(self._pending.values())
+            standings = dict((row[0], list(row)) for row in rows)
+            for entry in pending:
+                args = entry["args"]
+                if entry["op"] == "register_player":
+                    if args[2] == event_id:
+                        standings.setdefault(entry["key"], [
+                            entry["key"], args[0] + " " + args[1], 0.0, 0])
+                elif args[0] == event_id:
+                    for player, points in ((args[2], args[3]),
+                                           (args[4], args[5])):
+                        row = standings.get(self._resolve(player, {}))
+                        if row is not None:
+                            row[2] = (row[2] or 0.0) + (points or 0.0)
+                            row[3] += 1
+        return sorted((tuple(row) for row in standings.values()),
+                      key=lambda row: (-(row[2] or 0.0), row[1]))
+
+    def _run(self):
+        delay = self.interval
+        while not self._stop.is_set():
+            try:
+                self.flush()
+                delay = self.interval
+                self.last_error = None
+            except Exception as e:
+                # Offline: retry less and less often, up to a minute
+                self.last_error = e
+                delay = min(60.0, delay * 2)
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+    def start(self):
+        """Starts the background thread writing the pending entries."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            name="tournament-journal")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stops the background thread, the pending entries are kept."""
+        if self._thread is not None:
+            self._stop.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """Stops the background thread and closes the file."""
+        self.stop()
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,779 @@
+#!/usr/bin/env python
+#
+# tournament_memory.py -- in-memory backend of the Swiss-system tournament
+#
+# Implements the API of tournament.py (see tournament_backend.API) without
+# a database, for simulations and tests. Every MemoryTournament is an
+# independent tournament database, the module level functions use a
+# default one.
+
+import copy
+import re
+import threading
+import timeit
+from array import array
+from contextlib import contextmanager
+
+from tournament_pairing import (BYE_POINTS, STRATEGIES, PlayedMatrix,
+                                had_byes, round_result_errors, split_bye)
+from tournament_tiebreak import compute_tiebreaks
+
+try:
+    long
+except NameError:
+    long = int
+
+# Lowest similarity of a fuzzy search, as pg_trgm.similarity_threshold
+SIMILARITY_THRESHOLD = 0.3
+
+
+def _trigrams(text):
+    """Trigrams of a text the way pg_trgm extracts them."""
+    trigrams = set()
+    for word in re.findall(r"[^\W_]+", text.lower(), re.UNICODE):
+        word = "  " + word + " "
+        for k in range(len(word) - 2):
+            trigrams.add(word[k:k + 3])
+    return trigrams
+
+
+def similarity(text_one, text_two):
+    """Trigram similarity of two texts, see pg_trgm similarity()."""
+    trigrams_one = _trigrams(text_one)
+    trigrams_two = _trigrams(text_two)
+    union = len(trigrams_one | trigrams_two)
+    return float(len(trigrams_one & trigrams_two)) / union if union else 0.0
+
+
+class MemoryTournament(object):
+    """Tournament database kept in memory.
+
+    Matches are stored column by column in compact typed arrays, and the
+    points and matches of every player in an event are maintained on each
+    write, like the eventStandings table of the PostgreSQL schema.
+    """
+
+    # Arrays holding the matches, one value per match
+    MATCH_COLUMNS = ("_match_ids", "_match_events", "_match_rounds",
+                     "_player_ones", "_player_twos", "_player_one_scores",
+                     "_player_two_scores")
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._next_player_id = 1
+        self._next_event_id = 1
+        self._next_match_id = 1
+        # Players, by position: id, firstname and lastname
+        self._player_ids = array("l")
+        self._firstnames = []
+        self._lastnames = []
+        self._player_index = {}
+        # Idempotency keys of the registrations: key -> player
+        self._player_keys = {}
+        # Events: id -> (name, event_date)
+        self._events = {}
+        # Players in event with their standings: event -> {player: [p, m]}
+        self._standings = {}
+        # Matches, by position, player two being 0 for a bye, see
+        # MATCH_COLUMNS
+        self._match_ids = array("l")
+        self._match_events = array("l")
+        self._match_rounds = array("l")
+        self._player_ones = array("l")
+        self._player_twos = array("l")
+        self._player_one_scores = array("d")
+        self._player_two_scores = array("d")
+        # Positions of the matches of every event: event -> list
+        self._event_positions = {}
+        # Idempotency keys of the results: (event, key) -> match id
+        self._match_keys = {}
+        # Rematch bit matrices, built on first use: event -> PlayedMatrix
+        self._played = {}
+        # Pairings: (event, round_number) -> list of
+        # (id1, name1, points1, id2, name2, points2)
+        self._pairings = {}
+        # Standings snapshots: (event, round_number) -> {player: (p, m)}
+        self._snapshots = {}
+        # Archived events: id -> dict with every row of the event
+        self._archive = {}
+        # Functions undoing the writes of the current transaction
+        self._undo = None
+
+    @contextmanager
+    def transaction(self):
+        """Groups several operations: they are all undone if the block
+        raises an exception. Other threads wait until the block ends.
+
+        Every write made inside the block logs a function undoing it, so a
+        block costs nothing more than its writes, run backwards on errors.
+
+        Yields:
+          None, there is no connection in memory
+        """
+        with self._lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield None
+                finally:
+                    self._depth -= 1
+                return
+            self._depth = 1
+            self._undo = []
+            try:
+                yield None
+            except Exception:
+                for undo in reversed(self._undo):
+                    undo()
+                raise
+            finally:
+                self._depth = 0
+                self._undo = None
+
+    @contextmanager
+    def read_only(self):
+        """Groups several reads, see tournament.read_only. There is no
+        replica in memory: other threads wait until the block ends.
+
+        Yields:
+          None, there is no connection in memory
+        """
+        with self._lock:
+            yield None
+
+    def _logged(self, undo):
+        """Logs the function undoing a write, inside a transaction."""
+        if self._undo is not None:
+            self._undo.append(undo)
+
+    def _replace(self, **values):
+        """Replaces attributes with new values, logging the current ones."""
+        old = dict((name, getattr(self, name)) for name in values)
+        self._logged(lambda: self.__dict__.update(old))
+        self.__dict__.update(values)
+
+    def _positions(self, event_id):
+        """Returns the positions of the matches of an event."""
+        return self._event_positions.get(event_id, [])
+
+    def _name(self, player_id):
+        index = self._player_index[player_id]
+        return self._firstnames[index] + " " + self._lastnames[index]
+
+    def _check_event(self, event_id):
+        if event_id not in self._events:
+            raise ValueError("Event {} does not exist.".format(event_id))
+
+    def _check_player(self, player_id):
+        if player_id not in self._player_index:
+            raise ValueError("Player {} does not exist.".format(player_id))
+
+    def _keep_matches(self, keep):
+        """Keeps the matches for which keep(position) is True."""
+        positions = [k for k in range(len(self._match_ids)) if keep(k)]
+        columns = dict((name, array(getattr(self, name).typecode,
+                                    [getattr(self, name)[k]
+                                     for k in positions]))
+                       for name in self.MATCH_COLUMNS)
+        kept = set(columns["_match_ids"])
+        event_positions = {}
+        for k, event_id in enumerate(columns["_match_events"]):
+            event_positions.setdefault(event_id, []).append(k)
+        self._replace(_match_keys=dict(item for item
+                                       in self._match_keys.items()
+                                       if item[1] in kept),
+                      _event_positions=event_positions, _played={},
+                      **columns)
+
+    def _computed_standings(self, event_id, round_number=None):
+        """Computes {player: [points, matches]} from the matches, only up
+        to round_number if given."""
+        computed = dict((player, [0.0, 0])
+                        for player in self._standings[event_id])
+        for k in self._positions(event_id):
+            if round_number is not None and \
+                    self._match_rounds[k] > round_number:
+                continue
+            for player, score in ((self._player_ones[k],
+                                   self._player_one_scores[k]),
+                                  (self._player_twos[k],
+                                   self._player_two_scores[k])):
+                if player in computed:
+                    computed[player][0] += score
+                    computed[player][1] += 1
+        return computed
+
+    def _drop_snapshots(self, event_id=None, round_number=None):
+        """Drops the snapshots of an event, only from round_number on if
+        given, like the matchesStandings trigger."""
+        dropped = dict((key, self._snapshots.pop(key)) for key in [
+            key for key in self._snapshots
+            if event_id is None or (key[0] == event_id and (
+                round_number is None or key[1] >= round_number))])
+        if dropped:
+            self._logged(lambda: self._snapshots.update(dropped))
+
+    def _event_matches(self, event_id):
+        """Returns the (player_one, player_two) pairs of an event, player_two
+        being None for a bye."""
+        return [(self._player_ones[k], self._player_twos[k] or None)
+                for k in self._positions(event_id)]
+
+    def _played_matrix(self, event_id):
+        """Returns the PlayedMatrix of an event, kept up to date by
+        _append_match once built."""
+        matrix = self._played.get(event_id)
+        if matrix is None:
+            matrix = PlayedMatrix(self._event_matches(event_id))
+            self._played[event_id] = matrix
+            self._logged(lambda: self._played.pop(event_id, None))
+        return matrix
+
+    def delete_event(self, event_id):
+        """Remove an event and all its related data, see
+        tournament.delete_event"""
+        with self._lock:
+            if event_id not in self._events:
+                return
+            event = self._events.pop(event_id)
+            players = self._standings.pop(event_id)
+            pairings = dict((key, self._pairings.pop(key)) for key in
+                            [key for key in self._pairings
+                             if key[0] == event_id])
+
+            def undo():
+                self._events[event_id] = event
+                self._standings[event_id] = players
+                self._pairings.update(pairings)
+            self._logged(undo)
+            self._drop_snapshots(event_id)
+            self._keep_matches(lambda k: self._match_events[k] != event_id)
+
+    def delete_all_events(self):
+        """Remove all events and their related data, see
+        tournament.delete_all_events"""
+        with self._lock:
+            self._replace(_events={}, _standings={}, _pairings={},
+                          _snapshots={})
+            self._keep_matches(lambda k: False)
+
+    def delete_all_matches(self):
+        """Remove all the match records, see tournament.delete_all_matches"""
+        with self._lock:
+            self._replace(_snapshots={}, _standings=dict(
+                (event_id, dict((player, [0.0, 0]) for player in players))
+                for event_id, players in self._standings.items()))
+            self._keep_matches(lambda k: False)
+
+    def delete_matches_from_event(self, event_id):
+        """Remove all the match records from an event, see
+        tournament.delete_matches_from_event"""
+        with self._lock:
+            self._drop_snapshots(event_id)
+            self._keep_matches(lambda k: self._match_events[k] != event_id)
+            players = self._standings.get(event_id)
+            if players is not None:
+                self._standings[event_id] = dict(
+                    (player, [0.0, 0]) for player in players)
+                self._logged(
+                    lambda: self._standings.update({event_id: players}))
+
+    def purge_events(self, event_ids=None, before=None, archive=False):
+        """Removes whole events, optionally archiving them, see
+        tournament.purge_events
+
+        Returns:
+          The sorted list of the ids of the removed events
+        """
+        with self._lock:
+            event_ids = set(event_ids or [])
+            ids = sorted(event_id for event_id, (name, event_date)
+                         in self._events.items()
+                         if event_id in event_ids or
+                         (before is not None and event_date < before))
+            if archive and ids:
+                self._replace(_archive=dict(self._archive))
+            for event_id in ids:
+                if archive:
+                    self._archive[event_id] = {
+                        "event": self._events[event_id],
+                        "standings": copy.deepcopy(
+                            self._standings[event_id]),
+                        "matches": [
+                            (self._match_ids[k], self._match_rounds[k],
+                             self._player_ones[k], self._player_one_scores[k],
+                             self._player_twos[k] or None,
+                             self._player_two_scores[k])
+                            for k in self._positions(event_id)],
+                        "pairings": dict(
+                            (key[1], list(rows))
+                            for key, rows in self._pairings.items()
+                            if key[0] == event_id),
+                        "snapshots": dict(
+                            (key[1], dict(standings))
+                            for key, standings in self._snapshots.items()
+                            if key[0] == event_id)}
+                self.delete_event(event_id)
+            return ids
+
+    def reset_database(self, keep_players=False):
+        """Empties the tournament, see tournament.reset_database"""
+        with self._lock:
+            old = dict(self.__dict__)
+            players = (self._next_player_id, self._player_ids,
+                       self._firstnames, self._lastnames, self._player_index,
+                       self._player_keys)
+            self.__init__()
+            self._lock, self._depth, self._undo = (
+                old["_lock"], old["_depth"], old["_undo"])
+
+            def undo():
+                self.__dict__.clear()
+                self.__dict__.update(old)
+            self._logged(undo)
+            if keep_players:
+                (self._next_player_id, self._player_ids, self._firstnames,
+                 self._lastnames, self._player_index,
+                 self._player_keys) = players
+
+    def delete_players(self):
+        """Remove all the player records, see tournament.delete_players"""
+        with self._lock:
+            for players in self._standings.values():
+                if players:
+                    raise ValueError("Players are still in an event.")
+            self._replace(_player_ids=array("l"), _firstnames=[],
+                          _lastnames=[], _player_index={}, _player_keys={})
+
+    def register_event(self, name, event_date):
+        """Adds a new event, see tournament.register_event"""
+        with self._lock:
+            event_id = self._next_event_id
+            self._next_event_id += 1
+            self._events[event_id] = (name, event_date)
+            self._standings[event_id] = {}
+
+            def undo():
+                del self._events[event_id]
+                del self._standings[event_id]
+                self._next_event_id -= 1
+            self._logged(undo)
+            return event_id
+
+    def count_events(self):
+        """Returns the number of events, see tournament.count_events"""
+        with self._lock:
+            return long(len(self._events))
+
+    def count_players(self):
+        """Returns the number of players, see tournament.count_players"""
+        with self._lock:
+            return long(len(self._player_ids))
+
+    def register_player(self, firstname, lastname, idempotency_key=None):
+        """Adds a player, see tournament.register_player"""
+        with self._lock:
+            if idempotency_key in self._player_keys:
+                return self._player_keys[idempotency_key]
+            player_id = self._next_player_id
+            if idempotency_key is not None:
+                self._player_keys[idempotency_key] = player_id
+            self._next_player_id += 1
+            self._player_index[player_id] = len(self._player_ids)
+            self._player_ids.append(player_id)
+            self._firstnames.append(firstname)
+            self._lastnames.append(lastname)
+
+            def undo():
+                self._player_keys.pop(idempotency_key, None)
+                self._next_player_id -= 1
+                del self._player_index[player_id]
+                self._player_ids.pop()
+                self._firstnames.pop()
+                self._lastnames.pop()
+            self._logged(undo)
+            return player_id
+
+    def register_players_bulk(self, players, page_size=1000):
+        """Adds many players, see tournament.register_players_bulk"""
+        with self.transaction():
+            return [self.register_player(firstname, lastname)
+                    for firstname, lastname in players]
+
+    def add_player_to_event(self, event_id, player_id):
+        """Adds a player into an event, see tournament.add_player_to_event"""
+        with self._lock:
+            self._check_event(event_id)
+            self._check_player(player_id)
+            players = self._standings[event_id]
+            if player_id in players:
+                raise ValueError("Player {} is already in event {}.".format(
+                    player_id, event_id))
+            # Like the database trigger, keep the matches already stored
+            standing = [0.0, 0]
+            for k in self._positions(event_id):
+                for player, score in ((self._player_ones[k],
+                                       self._player_one_scores[k]),
+                                      (self._player_twos[k],
+                                       self._player_two_scores[k])):
+                    if player == player_id:
+                        standing[0] += score
+                        standing[1] += 1
+            players[player_id] = standing
+            self._logged(lambda: players.pop(player_id))
+
+    def add_players_to_event_bulk(self, event_id, player_ids):
+        """Adds many players into an event, see
+        tournament.add_players_to_event_bulk"""
+        with self.transaction():
+            for player_id in player_ids:
+                self.add_player_to_event(event_id, player_id)
+
+    def remove_player_from_event(self, event_id, player_id):
+        """Removes a player from an event, see
+        tournament.remove_player_from_event"""
+        with self._lock:
+            players = self._standings.get(event_id, {})
+            standing = players.pop(player_id, None)
+            if standing is not None:
+                self._logged(lambda: players.update({player_id: standing}))
+
+    def count_players_in_event(self, event_id):
+        """Returns the number of players in an event, see
+        tournament.count_players_in_event"""
+        with self._lock:
+            return long(len(self._standings.get(event_id, {})))
+
+    def player_standings(self, event_id, tiebreaks=None, round_number=None):
+        """Returns the standings of an event, see tournament.player_standings
+
+        Returns:
+          A list of tuples, each of which contains (id, name, points, matches)
+          followed by one value per requested tiebreak
+        """
+        with self._lock:
+            if round_number is None:
+                standings = self._standings.get(event_id, {})
+            elif (event_id, round_number) in self._snapshots:
+                standings = self._snapshots[(event_id, round_number)]
+            elif event_id in self._standings:
+                standings = self._computed_standings(event_id, round_number)
+            else:
+                standings = {}
+            rows = [(player_id, self._name(player_id), points, matches)
+                    for player_id, (points, matches) in standings.items()]
+            if tiebreaks:
+                return compute_tiebreaks(rows, [
+                    (self._player_ones[k], self._player_one_scores[k],
+                     self._player_twos[k], self._player_two_scores[k])
+                    for k in self._positions(event_id)
+                    if round_number is None or
+                    self._match_rounds[k] <= round_number], tiebreaks)
+        rows.sort(key=lambda row: (-row[2], row[1]))
+        return rows
+
+    def rebuild_standings(self, event_id=None, check_only=False):
+        """Recomputes the standings from the matches, see
+        tournament.rebuild_standings"""
+        differences = []
+        with self._lock:
+            events = [event_id] if event_id is not None \
+                else sorted(self._standings)
+            for event in events:
+                if event not in self._standings:
+                    continue
+                computed = self._computed_standings(event)
+                for player in sorted(computed):
+                    stored = self._standings[event][player]
+                    if stored != computed[player]:
+                        differences.append((event, player, stored[0],
+                                            stored[1], computed[player][0],
+                                            computed[player][1]))
+                if not check_only:
+                    self._logged(lambda event=event,
+                                 old=self._standings[event]:
+                                 self._standings.update({event: old}))
+                    self._standings[event] = computed
+        return differences
+
+    def finalize_round(self, event_id, round_number):
+        """Takes the standings snapshot of a round, see
+        tournament.finalize_round"""
+        with self._lock:
+            self._check_event(event_id)
+            key = (event_id, round_number)
+            old = self._snapshots.get(key)
+            if all(self._match_rounds[k] <= round_number
+                   for k in self._positions(event_id)):
+                # No later round yet: the standings are the current ones
+                standings = self._standings[event_id]
+            else:
+                standings = self._computed_standings(event_id, round_number)
+            self._snapshots[key] = dict(
+                (player, tuple(standing))
+                for player, standing in standings.items())
+            if old is None:
+                self._logged(lambda: self._snapshots.pop(key))
+            else:
+                self._logged(lambda: self._snapshots.update({key: old}))
+
+    def backfill_snapshots(self, event_id=None):
+        """Finalizes every round with matches and without snapshot, see
+        tournament.backfill_snapshots"""
+        with self._lock:
+            positions = range(len(self._match_ids)) if event_id is None \
+                else self._positions(event_id)
+            rounds = sorted(set(
+                (self._match_events[k], self._match_rounds[k])
+                for k in positions) - set(self._snapshots))
+            for event, round_number in rounds:
+                self.finalize_round(event, round_number)
+            return rounds
+
+    def report_match(self, event_id, round_number, player_one_id,
+                     player_one_points, player_two_id, player_two_points,
+                     idempotency_key=None):
+        """Records the outcome of a match, see tournament.report_match"""
+        with self._lock:
+            self._check_event(event_id)
+            self._check_player(player_one_id)
+            if player_two_id is not None:
+                self._check_player(player_two_id)
+            if (event_id, idempotency_key) in self._match_keys:
+                return
+            if idempotency_key is not None:
+                self._match_keys[(event_id, idempotency_key)] = \
+                    self._next_match_id
+                self._logged(lambda: self._match_keys.pop(
+                    (event_id, idempotency_key)))
+            self._append_match(event_id, round_number, player_one_id,
+                               player_one_points, player_two_id,
+                               player_two_points)
+
+    def _append_match(self, event_id, round_number, player_one_id,
+                      player_one_points, player_two_id, player_two_points):
+        """Stores a match and updates the standings, player_two_id is None
+        for a bye."""
+        with self._lock:
+            self._match_ids.append(self._next_match_id)
+            self._next_match_id += 1
+            self._match_events.append(event_id)
+            self._match_rounds.append(round_number)
+            self._player_ones.append(player_one_id)
+            self._player_twos.append(player_two_id or 0)
+            self._player_one_scores.append(player_one_points or 0.0)
+            self._player_two_scores.append(player_two_points or 0.0)
+            positions = self._event_positions.setdefault(event_id, [])
+            positions.append(len(self._match_ids) - 1)
+            players = self._standings[event_id]
+            counted = []
+            for player_id, points in ((player_one_id, player_one_points),
+                                      (player_two_id, player_two_points)):
+                if player_id in players:
+                    players[player_id][0] += points or 0.0
+                    players[player_id][1] += 1
+                    counted.append((players[player_id], points or 0.0))
+            matrix = self._played.get(event_id)
+            if matrix is not None and player_two_id is not None:
+                matrix.add(player_one_id, player_two_id)
+
+            def undo():
+                for name in self.MATCH_COLUMNS:
+                    getattr(self, name).pop()
+                self._next_match_id -= 1
+                positions.pop()
+                for standing, points in counted:
+                    standing[0] -= points
+                    standing[1] -= 1
+                # The pair may have met before: built again on next use
+                self._played.pop(event_id, None)
+            self._logged(undo)
+            self._drop_snapshots(event_id, round_number)
+
+    def report_round(self, event_id, round_number, results):
+        """Records every result of a round at once, see
+        tournament.report_round"""
+        with self.transaction():
+            reported = set()
+            for k in self._positions(event_id):
+                if self._match_rounds[k] == round_number:
+                    reported.add(self._player_ones[k])
+            boards = [(row[0], row[3],
+                       row[0] in reported or row[3] in reported)
+                      for row in self._pairings.get((event_id, round_number),
+                                                    [])]
+            errors = round_result_errors(boards, results, round_number)
+            if not errors:
+                for (player_one_id, player_one_points, player_two_id,
+                     player_two_points) in results:
+                    self.report_match(event_id, round_number, player_one_id,
+                                      player_one_points, player_two_id,
+                                      player_two_points)
+                self.finalize_round(event_id, round_number)
+            return errors
+
+    def find_player(self, player_name):
+        """Returns the id of the first player with that firstname or -1,
+        see tournament.find_player"""
+        with self._lock:
+            for index, firstname in enumerate(self._firstnames):
+                if firstname == player_name:
+                    return self._player_ids[index]
+            return -1
+
+    def lookup_player(self, firstname, lastname):
+        """Returns the id of a player from his or her exact name or -1, see
+        tournament.lookup_player"""
+        with self._lock:
+            for index, player_id in enumerate(self._player_ids):
+                if self._firstnames[index] == firstname and \
+                        self._lastnames[index] == lastname:
+                    return player_id
+            return -1
+
+    def search_players(self, text, mode="prefix", limit=20, offset=0):
+        """Searches players by name, see tournament.search_players
+
+        Returns:
+          A list of tuples, each of which contains (id, firstname, lastname)
+        """
+        if mode not in ("exact", "prefix", "fuzzy"):
+            raise ValueError("Unknown search mode {}, expected one of: "
+                             "exact, prefix, fuzzy".format(mode))
+        text = text.lower()
+        with self._lock:
+            players = [(self._player_ids[k], self._firstnames[k],
+                        self._lastnames[k])
+                       for k in range(len(self._player_ids))]
+        found = []
+        for player_id, firstname, lastname in players:
+            name = (firstname + " " + lastname).lower()
+            if mode == "exact":
+                if text in (name, firstname.lower(), lastname.lower()):
+                    found.append(((lastname, firstname, player_id),
+                                  player_id, firstname, lastname))
+            elif mode == "prefix":
+                if name.startswith(text) or lastname.lower().startswith(text):
+                    found.append(((lastname, firstname, player_id),
+                                  player_id, firstname, lastname))
+            else:
+                score = similarity(name, text)
+                if score >= SIMILARITY_THRESHOLD:
+                    found.append(((-score, player_id), player_id, firstname,
+                                  lastname))
+        found.sort()
+        return [row[1:] for row in found[offset:offset + limit]]
+
+    def swiss_pairings(self, event_id, round_number, strategy="greedy"):
+        """Pairs the next round of an event, see tournament.swiss_pairings
+
+        Returns:
+          A list of tuples, each of which contains (id1, name1, id2, name2)
+        """
+        with self.transaction():
+            self._check_event(event_id)
+            if round_number > 1:
+                self.finalize_round(event_id, round_number - 1)
+            key = (event_id, round_number)
+            old = self._pairings.pop(key, None)
+            if old is None:
+                self._logged(lambda: self._pairings.pop(key, None))
+            else:
+                self._logged(lambda: self._pairings.update({key: old}))
+            byes = set(k for k in self._positions(event_id)
+                       if self._match_rounds[k] == round_number and
+                       not self._player_twos[k])
+            if byes:
+                self._drop_snapshots(event_id, round_number)
+                self._keep_matches(lambda k: k not in byes)
+                players = self._standings[event_id]
+                self._standings[event_id] = self._computed_standings(
+                    event_id)
+                self._logged(
+                    lambda: self._standings.update({event_id: players}))
+            standings = self.player_standings(event_id)
+            standings, bye = split_bye(standings, had_byes(
+                self._event_matches(event_id)))
+            pairs = STRATEGIES[strategy](standings,
+                                         self._played_matrix(event_id))
+            rows = [(row1[0], row1[1], row1[2], row2[0], row2[1], row2[2])
+                    for row1, row2 in pairs]
+            if bye is not None:
+                rows.append((bye[0], bye[1], bye[2], None, None, None))
+                self._append_match(event_id, round_number, bye[0],
+                                   BYE_POINTS, None, None)
+            self._pairings[(event_id, round_number)] = rows
+        return [(row[0], row[1], row[3], row[4]) for row in rows]
+
+    def have_played(self, event_id, player_one_id, player_two_id):
+        """Tells whether two players already met in an event, see
+        tournament.have_played"""
+        with self._lock:
+            return (player_one_id, player_two_id) in \
+                self._played_matrix(event_id)
+
+    def pair_events(self, requests, strategy="greedy", workers=None):
+        """Pairs a round of many events, see tournament.pair_events
+
+        Events are paired one after the other, the memory backend being
+        locked while pairing.
+
+        Returns:
+          A list of tuples, each of which contains
+          (event_id, round_number, pairings, seconds, error)
+        """
+        results = []
+        for event_id, round_number in requests:
+            start = timeit.default_timer()
+            try:
+                pairings, error = self.swiss_pairings(
+                    event_id, round_number, strategy), None
+            except Exception as e:
+                pairings, error = None, e
+            results.append((event_id, round_number, pairings,
+                            timeit.default_timer() - start, error))
+        return results
+
+    def round_pairings(self, event_id, round_number):
+        """Returns the pairings stored for a round, see
+        tournament.round_pairings"""
+        with self._lock:
+            return [(row[0], row[1], row[3], row[4]) for row
+                    in self._pairings.get((event_id, round_number), [])]
+
+
+# Default tournament used by the module level functions
+_default = MemoryTournament()
+
+transaction = _default.transaction
+read_only = _default.read_only
+delete_event = _default.delete_event
+delete_all_events = _default.delete_all_events
+delete_all_matches = _default.delete_all_matches
+delete_matches_from_event = _default.delete_matches_from_event
+delete_players = _default.delete_players
+purge_events = _default.purge_events
+reset_database = _default.reset_database
+register_event = _default.register_event
+count_events = _default.count_events
+count_players = _default.count_players
+register_player = _default.register_player
+register_players_bulk = _default.register_players_bulk
+add_player_to_event = _default.add_player_to_event
+add_players_to_event_bulk = _default.add_players_to_event_bulk
+remove_player_from_event = _default.remove_player_from_event
+count_players_in_event = _default.count_players_in_event
+player_standings = _default.player_standings
+rebuild_standings = _default.rebuild_standings
+finalize_round = _default.finalize_round
+backfill_snapshots = _default.backfill_snapshots
+report_match = _default.report_match
+report_round = _default.report_round
+find_player = _default.find_player
+lookup_player = _default.lookup_player
+search_players = _default.search_players
+swiss_pairings = _default.swiss_pairings
+pair_events = _default.pair_events
+have_played = _default.have_played
+round_pairings = _default.round_pairings
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#
+# tournament_metrics.py -- opt-in timing of the tournament functions
+#
+# Once enabled, tournament.py records latency histograms of its public
+# functions, of every SQL statement and procedure it runs and of the time
+# spent waiting for a pooled connection, plus the rows returned by each
+# statement. They are read as Prometheus text with render(), or pushed to
+# a callback as they happen. While disabled, the instrumented code only
+# checks a module variable.
+
+import functools
+import threading
+import timeit
+
+
+# Upper bounds of the histogram buckets, in seconds and in rows
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# Metrics recorded by tournament.py: name -> (label, buckets, help)
+METRICS = {
+    "tournament_function_seconds": (
+        "function", SECONDS_BUCKETS, "Latency of the tournament functions"),
+    "tournament_query_seconds": (
+        "query", SECONDS_BUCKETS, "Latency of SQL statements and procedures"),
+    "tournament_query_rows": (
+        "query", ROWS_BUCKETS, "Rows returned or affected by a statement"),
+    "tournament_connection_acquire_seconds": (
+        "pool", SECONDS_BUCKETS, "Time waiting for a pooled connection"),
+}
+
+clock = timeit.default_timer
+
+_registry = None
+
+
+class Histogram(object):
+    """Cumulative histogram of observed values.
+
+    Args:
+      buckets: sorted upper bounds of the buckets, +Inf is implied.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        k = 0
+        while k < len(self.buckets) and value > self.buckets[k]:
+            k += 1
+        self.counts[k] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry(object):
+    """Histograms of every metric and label, see METRICS.
+
+    Args:
+      callback: optional function called with (metric, label, value) on
+                every observation, from the thread that made it.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, metric, label, value):
+        with self._lock:
+            histogram = self._histograms.get((metric, label))
+            if histogram is None:
+                histogram = Histogram(METRICS[metric][1])
+                self._histograms[(metric, label)] = histogram
+            histogram.observe(value)
+        if self.callback is not None:
+            self.callback(metric, label, value)
+
+    def snapshot(self):
+        """Returns {(metric, label): (bucket counts, sum, count)}."""
+        with self._lock:
+            return dict((key, (list(histogram.counts), histogram.sum,
+                               histogram.count))
+                        for key, histogram in self._histograms.items())
+
+
+def enable(callback=None):
+    """Starts recording metrics, discarding the ones recorded before.
+
+    Args:
+      callback: optional function called with (metric, label, value) on
+                every observation.
+    """
+    global _registry
+    _registry = Registry(callback)
+
+
+def disable():
+    """Stops recording metrics."""
+    global _registry
+    _registry = None
+
+
+def enabled():
+    """Returns True if metrics are being recorded."""
+    return _registry is not None
+
+
+def observe(metric, label, value):
+    """Records a value of a metric, nothing if metrics are disabled."""
+    registry = _registry
+    if registry is not None:
+        registry.observe(metric, label, value)
+
+
+def instrumented(function):
+    """Decorator recording the latency of every call of a function in
+    tournament_function_seconds."""
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _registry is None:
+            return function(*args, **kwargs)
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            observe("tournament_function_seconds", name, clock() - start)
+    return wrapper
+
+
+def _format(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+def render():
+    """Returns the recorded metrics in the Prometheus text format, an
+    empty string if metrics are disabled."""
+    registry = _registry
+    if registry is None:
+        return ""
+    snapshot = registry.snapshot()
+    lines = []
+    for metric in sorted(METRICS):
+        label_name, buckets, description = METRICS[metric]
+        labels = sorted(label for name, label in snapshot if name == metric)
+        if not labels:
+            continue
+        lines.append("# HELP {} {}".format(metric, description))
+        lines.append("# TYPE {} histogram".format(metric))
+        for label in labels:
+            counts, total, count = snapshot[(metric, label)]
+            escaped = label.replace("\\", "\\\\").replace('"', '\\"')
+            cumulative = 0
+            for bound, bucket_count in zip(
+                    tuple(buckets) + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(
+                    metric, label_name, escaped, _format(bound),
+                    cumulative))
+            lines.append('{}_sum{{{}="{}"}} {}'.format(
+                metric, label_name, escaped, repr(total)))
+            lines.append('{}_count{{{}="{}"}} {}'.format(
+                metric, label_name, escaped, count))
+    return "\n".join(lines) + "\n" if lines else ""
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+#
+# tournament_notify.py -- standings pushed by PostgreSQL LISTEN/NOTIFY
+#
+# The write functions of tournament.py and tournament_async.py send the new
+# points and matches of the players they change on STANDINGS_CHANNEL (see
+# tournament_channel). A StandingsFeed listens to that channel and keeps a
+# local copy of the standings of the events it watches: they are read in
+# full once, then updated from the messages, so displays do not need to
+# poll player_standings. After a lost connection the feed reconnects and
+# reads them in full again.
+#
+# Usage:
+#   python tournament_notify.py EVENT_ID [EVENT_ID ...]
+
+import argparse
+import json
+import select
+import time
+
+import psycopg2
+
+from tournament import DEFAULT_DSN
+from tournament_channel import STANDINGS_CHANNEL
+
+
+class StandingsFeed(object):
+    """Local standings of some events, kept up to date by NOTIFY messages.
+
+    A feed is not thread-safe: poll it and read its standings from the same
+    thread.
+
+    Args:
+      event_ids: the events to watch.
+      dsn: libpq connection string of the primary tournament database, a
+           hot standby can not LISTEN.
+      callback: optional function called with (event_id, message) every
+                time the standings of an event change, message being None
+                when they were read in full.
+      reconnect_delay: seconds waited after the connection is lost.
+    """
+
+    def __init__(self, event_ids, dsn=DEFAULT_DSN, callback=None,
+                 reconnect_delay=1.0):
+        self.dsn = dsn
+        self.callback = callback
+        self.reconnect_delay = reconnect_delay
+        self.resyncs = 0
+        self._events = dict((event_id, {}) for event_id in event_ids)
+        self._conn = None
+
+    def connect(self):
+        """Connects, listens to the channel and reads the standings of every
+        watched event. Listening first, no change can be missed."""
+        self.close()
+        conn = psycopg2.connect(self.dsn)
+        conn.set_session(autocommit=True)
+        c = conn.cursor()
+        c.execute("LISTEN " + STANDINGS_CHANNEL)
+        c.close()
+        self._conn = conn
+        for event_id in list(self._events):
+            self.resync(event_id)
+
+    def close(self):
+        """Closes the connection, the standings are kept."""
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            finally:
+                self._conn = None
+
+    def watch(self, event_id):
+        """Starts watching an event, reading its standings if connected."""
+        self._events.setdefault(event_id, {})
+        if self._conn is not None:
+            self.resync(event_id)
+
+    def resync(self, event_id):
+        """Reads the standings of a watched event in full."""
+        c = self._conn.cursor()
+        c.execute("SELECT id, name, points, matches FROM standings(%s)",
+                  [event_id])
+        self._events[event_id] = dict((row[0], [row[1], row[2], row[3]])
+                                      for row in c.fetchall())
+        c.close()
+        self.resyncs += 1
+        if self.callback is not None:
+            self.callback(event_id, None)
+
+    def apply(self, message):
+        """Applies a decoded message, see
+        tournament_channel.standings_payloads.
+
+        A message about a player the feed does not know yet, e.g. one that
+        just joined the event, reads the standings of the event in full.
+
+        Returns:
+          The list of the watched events it changed
+        """
+        event_id = message.get("event")
+        if message.get("resync"):
+            if event_id is None:
+                event_ids = list(self._events)
+            else:
+                event_ids = [event_id] if event_id in self._events else []
+            for event_id in event_ids:
+                self.resync(event_id)
+            return event_ids
+        standings = self._events.get(event_id)
+        if standings is None:
+            return []
+        for player, points, matches in message["standings"]:
+            row = standings.get(player)
+            if row is None:
+                self.resync(event_id)
+                return [event_id]
+            row[1] = points
+            row[2] = matches
+        if self.callback is not None:
+            self.callback(event_id, message)
+        return [event_id]
+
+    def poll(self, timeout=None):
+        """Waits for messages and applies them, connecting first if needed.
+        If the connection is lost, it is closed and opened again by the next
+        call, after reconnect_delay seconds.
+
+        Args:
+          timeout: seconds to wait for a message, None to wait forever.
+        Returns:
+          The sorted ids of the watched events that changed
+        """
+        changed = set()
+        try:
+            if self._conn is None:
+                self.connect()
+                changed.update(self._events)
+            if not self._conn.notifies:
+                select.select([self._conn], [], [], timeout)
+            self._conn.poll()
+            while self._conn.notifies:
+                notify = self._conn.notifies.pop(0)
+                changed.update(self.apply(json.loads(notify.payload)))
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.close()
+            time.sleep(self.reconnect_delay)
+        return sorted(changed)
+
+    def run(self, stop=None, timeout=1.0):
+        """Polls until the stop event (a threading.Event) is set, forever
+        if it is None."""
+        while stop is None or not stop.is_set():
+            self.poll(timeout)
+
+    def standings(self, event_id):
+        """Returns the local standings of a watched event.
+
+        Returns:
+          A list of tuples (id, name, points, matches) sorted like
+          player_standings, by points and then by name
+        """
+        rows = [(player, row[0], row[1], row[2])
+                for player, row in self._events[event_id].items()]
+        rows.sort(key=lambda row: (-row[2], row[1]))
+        return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Prints the standings of events as they change")
+    parser.add_argument("events", type=int, nargs="+")
+    args = parser.parse_args()
+
+    def show(event_id, message):
+        print ("Event {}{}".format(event_id, "" if message is None else
+                                   ", round {}".format(message["round"])))
+        for row in feed.standings(event_id):
+            print ("  {:>6} {:<30} {:>6.1f} {:>3}".format(*row))
+
+    feed = StandingsFeed(args.events, callback=show)
+    try:
+        feed.run()
+    except KeyboardInterrupt:
+        feed.close()
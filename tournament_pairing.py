@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+#
+# tournament_pairing.py -- in-memory Swiss pairing engine
+#
+# The engine works on plain Python values so it can be fed from the
+# database, from memory or from a simulation.
+
+
+# Points given to the player receiving the bye of a round
+BYE_POINTS = 1.0
+
+
+def played_pairs(matches):
+    """Builds the set of players that already met each other.
+
+    Args:
+      matches: iterable of (player_one, player_two) tuples.
+    Returns:
+      A set with both (player_one, player_two) and (player_two, player_one)
+    """
+    played = set()
+    for player_one, player_two in matches:
+        played.add((player_one, player_two))
+        played.add((player_two, player_one))
+    return played
+
+
+class PlayedMatrix(object):
+    """Bit matrix of the players that already met each other.
+
+    Every player gets a seat and every pair of seats a bit, so a pair is
+    checked in O(1) and n players take about n * n / 8 bytes. It answers
+    `(id1, id2) in played` like played_pairs.
+
+    Args:
+      matches: iterable of (player_one, player_two) tuples, byes (matches
+               without player_two) are ignored.
+    """
+
+    def __init__(self, matches=()):
+        matches = [match for match in matches if match[1] is not None]
+        self._seats = {}
+        self._stride = 0
+        self._bits = bytearray()
+        players = set(player for match in matches for player in match)
+        self._grow((len(players) + 7) // 8)
+        self.update(matches)
+
+    def _grow(self, stride):
+        """Makes room for stride * 8 seats, keeping the bits set."""
+        bits = bytearray(stride * stride * 8)
+        for k in range(len(self._seats)):
+            bits[k * stride:k * stride + self._stride] = \
+                self._bits[k * self._stride:(k + 1) * self._stride]
+        self._stride = stride
+        self._bits = bits
+
+    def _seat(self, player):
+        seat = self._seats.get(player)
+        if seat is None:
+            seat = len(self._seats)
+            if seat >= self._stride * 8:
+                self._grow(self._stride + max(1, self._stride // 4))
+            self._seats[player] = seat
+        return seat
+
+    def add(self, player_one, player_two):
+        """Records a match between two players."""
+        i = self._seat(player_one)
+        j = self._seat(player_two)
+        self._bits[i * self._stride + (j >> 3)] |= 1 << (j & 7)
+        self._bits[j * self._stride + (i >> 3)] |= 1 << (i & 7)
+
+    def update(self, matches):
+        """Records (player_one, player_two) matches, ignoring byes."""
+        for player_one, player_two in matches:
+            if player_two is not None:
+                self.add(player_one, player_two)
+
+    def copy(self):
+        """Returns an independent copy of the matrix."""
+        other = PlayedMatrix()
+        other._seats = dict(self._seats)
+        other._stride = self._stride
+        other._bits = bytearray(self._bits)
+        return other
+
+    def __contains__(self, pair):
+        i = self._seats.get(pair[0])
+        j = self._seats.get(pair[1])
+        if i is None or j is None:
+            return False
+        return bool(self._bits[i * self._stride + (j >> 3)] >> (j & 7) & 1)
+
+
+def had_byes(matches):
+    """Returns the set of players that already received a bye.
+
+    Args:
+      matches: iterable of (player_one, player_two) tuples, a bye being a
+               match without player_two.
+    """
+    return set(player_one for player_one, player_two in matches
+               if player_two is None)
+
+
+def split_bye(standings, byes):
+    """Chooses the player receiving the bye when the number of players is
+    odd: the lowest ranked one that did not receive a bye before, or the
+    lowest ranked one if all did.
+
+    Args:
+      standings: list of (id, name, points, matches) rows in standings
+                 order.
+      byes: container answering `id in byes`, see had_byes.
+    Returns:
+      A tuple (standings, bye): the rows left to pair and the row of the
+      player receiving the bye, None if the number of players is even
+    """
+    if len(standings) % 2 == 0:
+        return standings, None
+    k = len(standings) - 1
+    while k >= 0 and standings[k][0] in byes:
+        k -= 1
+    if k < 0:
+        k = len(standings) - 1
+    return standings[:k] + standings[k + 1:], standings[k]
+
+
+def _next_unpaired(paired, start):
+    """Returns the first index from `start` that is not paired yet."""
+    for k in range(start, len(paired)):
+        if not paired[k]:
+            return k
+    return None
+
+
+def _search_pairs(ids, played, max_backtracks):
+    """Pairs every player going down the standings, backtracking when the
+    remaining players can not be paired without a rematch.
+
+    Args:
+      ids: player ids sorted by standings.
+      played: container answering `(id1, id2) in played`.
+      max_backtracks: give up after this number of backtracking steps.
+    Returns:
+      A list of (index1, index2) tuples or None if no pairing was found
+    """
+    n = len(ids)
+    paired = [False] * n
+    stack = []
+    backtracks = 0
+    i = _next_unpaired(paired, 0)
+    start = 1
+    while i is not None:
+        j = None
+        for k in range(start, n):
+            if not paired[k] and (ids[i], ids[k]) not in played:
+                j = k
+                break
+        if j is not None:
+            paired[i] = paired[j] = True
+            stack.append((i, j))
+            i = _next_unpaired(paired, i + 1)
+            start = i + 1 if i is not None else n
+        else:
+            backtracks += 1
+            if not stack or backtracks > max_backtracks:
+                return None
+            i, j = stack.pop()
+            paired[i] = paired[j] = False
+            start = j + 1
+    return stack
+
+
+def pair_round(standings, played, max_backtracks=None):
+    """Pairs the players of a round following the Swiss system.
+
+    Each player, from the top of the standings down, is paired with the
+    nearest player below him or her that is not paired yet and has not been
+    faced before, so players meet inside their score group whenever
+    possible. If the search runs out of budget, or there is no rematch-free
+    pairing, the round is paired by pair_round_matching instead, which
+    makes as few rematches as possible.
+
+    Args:
+      standings: list of (id, name, points, matches) rows in standings
+                 order, with an even number of players.
+      played: container answering `(id1, id2) in played`, see played_pairs.
+      max_backtracks: search budget, by default ten times the players.
+    Returns:
+      A list of tuples, each of which contains (row1, row2) standings rows
+    """
+    if len(standings) % 2 != 0:
+        raise ValueError("An even number of players is required.")
+    ids = [row[0] for row in standings]
+    if max_backtracks is None:
+        max_backtracks = 10 * len(ids)
+    pairs = _search_pairs(ids, played, max_backtracks)
+    if pairs is None:
+        return pair_round_matching(standings, played)
+    return [(standings[i], standings[j]) for i, j in pairs]
+
+
+def _pair_cost(standings, i, j):
+    """Cost of pairing the standings rows i < j: the squared score
+    difference, in hundredths of a point, then the distance in the
+    standings so that adjacent players are preferred inside a score group."""
+    diff = int(round(abs(standings[i][2] - standings[j][2]) * 100))
+    return diff * diff * len(standings) + (j - i)
+
+
+def _match_block(standings, played, window):
+    """Solves a block of the standings as a minimum-cost perfect matching
+    over the players that have not met yet.
+
+    Each player is first only linked with the `window` players below him or
+    her in the standings; the window doubles until everybody is paired.
+
+    Returns:
+      A list of (index1, index2) tuples or None if the block can not be
+      paired without rematches
+    """
+    from tournament_matching import max_weight_matching
+
+    n = len(standings)
+    ids = [row[0] for row in standings]
+    span = max(1, window)
+    while True:
+        span = min(span, n - 1)
+        edges = []
+        for i in range(n):
+            for j in range(i + 1, min(n, i + span + 1)):
+                if (ids[i], ids[j]) not in played:
+                    edges.append((i, j, -_pair_cost(standings, i, j)))
+        mate = max_weight_matching(edges, maxcardinality=True)
+        if len(mate) == n and -1 not in mate:
+            return [(i, mate[i]) for i in range(n) if i < mate[i]]
+        if span == n - 1:
+            return None
+        span *= 2
+
+
+def _match_with_rematches(standings, played):
+    """Pairs the whole field allowing rematches at a cost higher than any
+    rematch-free pairing, so as few rematches as possible are made."""
+    from tournament_matching import max_weight_matching
+
+    n = len(standings)
+    ids = [row[0] for row in standings]
+    rematch = (n + 1) * _pair_cost(standings, 0, n - 1) + 1
+    edges = []
+    for i in range(n):
+        for j in range(i + 1, n):
+            cost = _pair_cost(standings, i, j)
+            if (ids[i], ids[j]) in played:
+                cost += rematch
+            edges.append((i, j, -cost))
+    mate = max_weight_matching(edges, maxcardinality=True)
+    return [(i, mate[i]) for i in range(n) if i < mate[i]]
+
+
+def _blocks(standings, block_size):
+    """Splits the standings in blocks with an even number of players,
+    between `block_size` and one and a half times `block_size` players,
+    cut between score groups when possible.
+
+    Returns:
+      A list of (start, end) index ranges
+    """
+    n = len(standings)
+    if block_size is None or block_size >= n:
+        return [(0, n)]
+    blocks = []
+    start = 0
+    for end in range(1, n + 1):
+        size = end - start
+        if size % 2 != 0 or size < block_size or n - end < block_size:
+            continue
+        if (standings[end - 1][2] != standings[end][2] or
+                2 * size >= 3 * block_size):
+            blocks.append((start, end))
+            start = end
+    blocks.append((start, n))
+    return blocks
+
+
+def pair_round_matching(standings, played, window=16, block_size=32):
+    """Pairs the players of a round as a minimum-cost perfect matching.
+
+    Unlike pair_round, it never dead-ends. The round is solved as a maximum
+    weight matching (see tournament_matching) on the graph of players that
+    have not met yet, where the cost of a pair grows with the score
+    difference and then with the distance in the standings.
+
+    Large fields are split in blocks of about `block_size` players, cut
+    between score groups whenever possible, and each block is matched on
+    its own. A block with no rematch-free pairing is merged with the next
+    one until a pairing is found, so the result is optimal inside each
+    block; block_size=None matches the whole field at once. If no
+    rematch-free pairing exists at all, as few rematches as possible are
+    made.
+
+    Args:
+      standings: list of (id, name, points, matches) rows in standings
+                 order, with an even number of players.
+      played: container answering `(id1, id2) in played`, see played_pairs.
+      window: initial number of candidate opponents of each player.
+      block_size: minimum number of players of each block.
+    Returns:
+      A list of tuples, each of which contains (row1, row2) standings rows
+    """
+    n = len(standings)
+    if n % 2 != 0:
+        raise ValueError("An even number of players is required.")
+    pairs = []
+    pending = _blocks(standings, block_size)
+    while pending:
+        start, end = pending.pop(0)
+        block = _match_block(standings[start:end], played, window)
+        if block is None:
+            if pending:
+                pending[0] = (start, pending[0][1])
+                continue
+            if start > 0:
+                # Merge the last block with the ones already paired.
+                start = 0
+                block = _match_block(standings, played, window)
+            if block is None:
+                block = _match_with_rematches(standings, played)
+            pairs = []
+        pairs.extend((start + i, start + j) for i, j in block)
+    return [(standings[i], standings[j]) for i, j in pairs]
+
+
+def round_result_errors(boards, results, round_number):
+    """Checks the results of a round against its pairings.
+
+    Every result must belong to a board paired for the round that has not
+    been reported before, and every board must get exactly one result.
+
+    Args:
+      boards: list of (id1, id2, reported) tuples, one per stored pairing.
+      results: list of (player_one_id, player_one_points, player_two_id,
+               player_two_points) tuples.
+      round_number: the round being reported, for the messages.
+    Returns:
+      A list of tuples, each of which contains (board, message)
+        board: position of the wrong result in `results`, None for a
+               pairing without result
+        message: description of the problem
+    """
+    errors = []
+    reported = {}
+    for id1, id2, done in boards:
+        reported[frozenset([id1, id2])] = done
+    seen = set()
+    for board, (player_one_id, player_one_points, player_two_id,
+                player_two_points) in enumerate(results):
+        pair = frozenset([player_one_id, player_two_id])
+        if pair not in reported:
+            errors.append((board, "Players {} and {} are not paired in "
+                           "round {}.".format(player_one_id, player_two_id,
+                                              round_number)))
+        elif reported[pair]:
+            errors.append((board, "Players {} and {} were already "
+                           "reported.".format(player_one_id, player_two_id)))
+        elif pair in seen:
+            errors.append((board, "Players {} and {} are reported more "
+                           "than once.".format(player_one_id,
+                                               player_two_id)))
+        seen.add(pair)
+    for id1, id2, done in boards:
+        if not done and frozenset([id1, id2]) not in seen:
+            errors.append((None, "Players {} and {} have no "
+                           "result.".format(id1, id2)))
+    return errors
+
+
+# Pairing strategies accepted by tournament.swiss_pairings
+STRATEGIES = {
+    "greedy": pair_round,
+    "matching": pair_round_matching,
+}
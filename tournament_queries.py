@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+#
+# tournament_queries.py -- statements shared by the sync and async APIs
+#
+# tournament.py (psycopg2) and tournament_async.py (psycopg 3) must return
+# identical results, so the writes whose SQL is more than a single INSERT
+# are written once here. Both drivers take the same %s placeholders.
+
+# Registers a player, with the firstname and lastname as parameters
+REGISTER_PLAYER = "INSERT INTO players (firstname, lastname) \
+                   VALUES (%s, %s) RETURNING id"
+# Registers a player once per idempotency key: registering again with the
+# same key returns the same id. Parameters: firstname, lastname and key
+REGISTER_PLAYER_ONCE = "INSERT INTO players \
+                        (firstname, lastname, idempotency_key) \
+                        VALUES (%s, %s, %s) ON CONFLICT (idempotency_key) \
+                        DO UPDATE SET idempotency_key = \
+                            EXCLUDED.idempotency_key \
+                        RETURNING id"
+
+# Stores the result of a match, with player one, player two, their
+# points, the event, the round and the idempotency key as parameters
+REPORT_MATCH = "INSERT INTO matches (player_one, player_two, \
+                player_one_score, player_two_score, event, round_number, \
+                idempotency_key) VALUES (%s, %s, %s, %s, %s, %s, %s)"
+# Same as REPORT_MATCH, ignoring a result already stored with its key
+REPORT_MATCH_ONCE = REPORT_MATCH + \
+    " ON CONFLICT (event, idempotency_key) DO NOTHING"
+
+# Takes the standings snapshot of a round, see tournament.finalize_round:
+# statements run in order in one transaction, with {'event': event_id,
+# 'round': round_number} as parameters
+FINALIZE_ROUND = (
+    "DELETE FROM standingsSnapshots \
+     WHERE event=%(event)s AND round_number=%(round)s",
+    "INSERT INTO standingsSnapshots \
+     (event, round_number, player, points, matches) \
+     SELECT %(event)s, %(round)s, player, points, matches \
+     FROM computedRoundStandings(%(event)s, %(round)s)")
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+#
+# tournament_simulation.py -- Monte Carlo simulator of Swiss-system events
+#
+# Plays thousands of full tournaments in memory to decide how many rounds
+# an event needs and to compare pairing strategies. Players have Elo
+# strengths kept in NumPy arrays, every round is paired with the same
+# rules as tournament.swiss_pairings and all its results are sampled at
+# once. Requires NumPy:
+#
+#   pip install numpy
+#
+# Usage:
+#   python tournament_simulation.py --players 64 --rounds 4,5,6,7
+
+import argparse
+import multiprocessing
+
+import numpy
+
+from tournament_pairing import (BYE_POINTS, STRATEGIES, played_pairs,
+                                split_bye)
+
+
+# Statistics returned for every simulated tournament, see simulate
+STATISTICS = ("winner", "unique_winner", "spearman", "rematches",
+              "repeat_byes")
+
+# Number of tasks the simulations are split into
+CHUNKS = 64
+
+
+def win_probabilities(strengths_one, strengths_two):
+    """Returns the Elo expected score of the first players of each pair.
+
+    Args:
+      strengths_one: array with the Elo rating of the first players.
+      strengths_two: array with the Elo rating of the second players.
+    """
+    return 1.0 / (1.0 + 10.0 ** ((strengths_two - strengths_one) / 400.0))
+
+
+def _average_ranks(values):
+    """Ranks of an array, tied values get the average of their ranks."""
+    order = numpy.argsort(values, kind="mergesort")
+    ranks = numpy.empty(len(values))
+    ranks[order] = numpy.arange(len(values))
+    _, inverse, counts = numpy.unique(values, return_inverse=True,
+                                      return_counts=True)
+    sums = numpy.bincount(inverse, weights=ranks)
+    return sums[inverse] / counts[inverse]
+
+
+def spearman(values_one, values_two):
+    """Spearman rank correlation of two arrays, 0.0 if one is constant."""
+    ranks_one = _average_ranks(values_one)
+    ranks_two = _average_ranks(values_two)
+    ranks_one -= ranks_one.mean()
+    ranks_two -= ranks_two.mean()
+    norm = numpy.sqrt((ranks_one ** 2).sum() * (ranks_two ** 2).sum())
+    return float((ranks_one * ranks_two).sum() / norm) if norm else 0.0
+
+
+def simulate(strengths, rounds, rng, strategy="greedy", draw_rate=0.0):
+    """Plays a whole Swiss tournament.
+
+    Every round the standings are sorted like the standings() SQL function,
+    by points and then by name, and paired like swiss_pairings: the bye
+    goes to the lowest ranked player without one, the others are paired
+    by the strategy.
+
+    Args:
+      strengths: array with the Elo rating of every player.
+      rounds: number of rounds to play.
+      rng: numpy.random.Generator sampling the results.
+      strategy: pairing strategy, see tournament_pairing.STRATEGIES.
+      draw_rate: probability of a draw, scored half a point each.
+    Returns:
+      A dict with the statistics named in STATISTICS:
+        winner: 1.0 if the strongest player tops the final standings
+        unique_winner: 1.0 if nobody else has the points of the first one
+        spearman: rank correlation of the final points with the strengths
+        rematches: number of pairs that had already played
+        repeat_byes: number of players that got the bye more than once
+    """
+    players_number = len(strengths)
+    names = ["Player{:06d}".format(k) for k in range(players_number)]
+    # Names sort like the positions, so standings order by points and then
+    # by position
+    positions = numpy.arange(players_number)
+
+    points = numpy.zeros(players_number)
+    matches = numpy.zeros(players_number, dtype=int)
+    byes = numpy.zeros(players_number, dtype=int)
+    history = []
+    rematches = 0
+    for _ in range(rounds):
+        order = numpy.lexsort((positions, -points))
+        standings = [(int(k), names[k], points[k], matches[k])
+                     for k in order]
+        standings, bye = split_bye(standings, set(numpy.flatnonzero(byes)))
+        if bye is not None:
+            points[bye[0]] += BYE_POINTS
+            matches[bye[0]] += 1
+            byes[bye[0]] += 1
+        played = played_pairs(history)
+        pairs = STRATEGIES[strategy](standings, played)
+        one = numpy.array([row1[0] for row1, _ in pairs], dtype=int)
+        two = numpy.array([row2[0] for _, row2 in pairs], dtype=int)
+        rematches += sum(1 for row1, row2 in pairs
+                         if (row1[0], row2[0]) in played)
+
+        expected = win_probabilities(strengths[one], strengths[two])
+        draws = rng.random(len(pairs)) < draw_rate
+        wins = rng.random(len(pairs)) < expected
+        scores = numpy.where(draws, 0.5, wins.astype(float))
+        points[one] += scores
+        points[two] += 1.0 - scores
+        matches[one] += 1
+        matches[two] += 1
+        history.extend((row1[0], row2[0]) for row1, row2 in pairs)
+
+    final = numpy.lexsort((positions, -points))
+    top = points.max()
+    return {
+        "winner": float(final[0] == numpy.argmax(strengths)),
+        "unique_winner": float((points == top).sum() == 1),
+        "spearman": spearman(points, strengths),
+        "rematches": float(rematches),
+        "repeat_byes": float((byes > 1).sum()),
+    }
+
+
+def _simulate_many(task):
+    """Runs a chunk of simulations in a worker and sums their statistics."""
+    (players_number, rounds, simulations, strategy, draw_rate, spread,
+     seed) = task
+    rng = numpy.random.default_rng(seed)
+    totals = dict((name, 0.0) for name in STATISTICS)
+    for _ in range(simulations):
+        strengths = rng.normal(1500.0, spread, players_number)
+        for name, value in simulate(strengths, rounds, rng, strategy,
+                                    draw_rate).items():
+            totals[name] += value
+    return totals
+
+
+def run_simulations(players_number, rounds, simulations, strategy="greedy",
+                    draw_rate=0.0, spread=200.0, seed=None, processes=None):
+    """Simulates many independent tournaments across a process pool.
+
+    Args:
+      players_number: number of players of every tournament.
+      rounds: number of rounds of every tournament.
+      simulations: number of tournaments to play.
+      strategy: pairing strategy, see tournament_pairing.STRATEGIES.
+      draw_rate: probability of a draw.
+      spread: standard deviation of the Elo ratings, drawn around 1500.
+      seed: seed of the simulations, random if None.
+      processes: size of the pool, by default the number of CPUs. With 1
+                 the simulations run in this process.
+    Returns:
+      A dict with the mean over the tournaments of every statistic of
+      simulate, plus 'simulations'
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    # The chunks do not depend on the pool size, so a seed gives the same
+    # statistics whatever the number of processes
+    chunks = max(1, min(simulations, CHUNKS))
+    seeds = numpy.random.SeedSequence(seed).spawn(chunks)
+    tasks = [(players_number, rounds,
+              simulations // chunks + (1 if k < simulations % chunks else 0),
+              strategy, draw_rate, spread, seeds[k]) for k in range(chunks)]
+    if processes == 1:
+        results = [_simulate_many(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_simulate_many, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    means = dict((name, sum(result[name] for result in results) /
+                  simulations) for name in STATISTICS)
+    means["simulations"] = simulations
+    return means
+
+
+def rounds_needed(players_number, target=0.9, max_rounds=None, **options):
+    """Returns the fewest rounds for which the strongest player wins the
+    event at least a target fraction of the simulations.
+
+    Args:
+      players_number: number of players of the event.
+      target: wanted fraction of simulations won by the strongest player.
+      max_rounds: rounds tried at most, by default players_number - 1.
+      options: other arguments of run_simulations.
+    Returns:
+      A tuple (rounds, statistics), rounds is None if the target is never
+      reached
+    """
+    if max_rounds is None:
+        max_rounds = players_number - 1
+    statistics = None
+    for rounds in range(1, max_rounds + 1):
+        statistics = run_simulations(players_number, rounds, **options)
+        if statistics["winner"] >= target:
+            return rounds, statistics
+    return None, statistics
+
+
+def _parse_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Monte Carlo simulation of Swiss-system tournaments")
+    parser.add_argument("--players", type=_parse_list, default=[64])
+    parser.add_argument("--rounds", type=_parse_list, default=[4, 5, 6, 7])
+    parser.add_argument("--simulations", type=int, default=1000)
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES),
+                        default="greedy")
+    parser.add_argument("--draw-rate", type=float, default=0.0)
+    parser.add_argument("--spread", type=float, default=200.0,
+                        help="standard deviation of the Elo ratings")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    print ("{:>7} {:>6} {:>7} {:>7} {:>8} {:>9} {:>11}".format(
+        "players", "rounds", "winner", "unique", "spearman", "rematches",
+        "repeat byes"))
+    for players_number in args.players:
+        for rounds in args.rounds:
+            statistics = run_simulations(
+                players_number, rounds, args.simulations, args.strategy,
+                args.draw_rate, args.spread, args.seed, args.processes)
+            print ("{:>7} {:>6} {:>7.3f} {:>7.3f} {:>8.3f} {:>9.3f} "
+                   "{:>11.3f}".format(players_number, rounds,
+                                      statistics["winner"],
+                                      statistics["unique_winner"],
+                                      statistics["spearman"],
+                                      statistics["rematches"],
+                                      statistics["repeat_byes"]))
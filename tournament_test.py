@@ -1,8 +1,35 @@
 #!/usr/bin/env python
 #
 # Test cases for tournament.py
+#
+# The same cases run against every backend of tournament_backend:
+#   python tournament_test.py                           (PostgreSQL)
+#   TOURNAMENT_BACKEND=memory python tournament_test.py (in memory)
+
+import os
+
+from tournament_backend import API, load_backend
+from tournament_pairing import (PlayedMatrix, pair_round, pair_round_matching,
+                                played_pairs)
+
+try:
+    long
+except NameError:
+    long = int
+
+BACKEND = os.environ.get("TOURNAMENT_BACKEND", "postgres")
+globals().update((name, getattr(load_backend(BACKEND), name)) for name in API)
 
-from tournament import *
+
+def postgres_only(test):
+    """Skips a test case that checks PostgreSQL specific behaviour."""
+    def run(test_num):
+        if BACKEND != "postgres":
+            print ("{}. Skipped, it needs the postgres backend."
+                   .format(test_num))
+            return
+        test(test_num)
+    return run
 
 
 def test_delete_all_event(test_num):
@@ -13,7 +40,7 @@ def test_delete_all_event(test_num):
             "count_events() should return long value.")
     if c != 0:
         raise ValueError("After deleting, count_events should return zero.")
-    print ("{}. All events can be deleted.").format(test_num)
+    print ("{}. All events can be deleted.".format(test_num))
 
 
 def test_delete_one_event(test_num):
@@ -27,7 +54,7 @@ def test_delete_one_event(test_num):
             "count_events() should return long value.")
     if c != 1:
         raise ValueError("After deleting, count_events should return one.")
-    print ("{}. One event can be deleted.").format(test_num)
+    print ("{}. One event can be deleted.".format(test_num))
 
         
 def test_register_event(test_num):
@@ -40,8 +67,8 @@ def test_register_event(test_num):
     if c != 1:
         raise ValueError("After one event registered, count_events should \
             return one.")
-    print ("{}. After registering an event, count_events() returns 1.")\
-            .format(test_num)
+    print ("{}. After registering an event, count_events() returns 1."
+           .format(test_num))
 
 
 def test_delete_players(test_num):
@@ -53,7 +80,7 @@ def test_delete_players(test_num):
             "count_players() should return long value.")
     if c != 0:
         raise ValueError("After deleting, count_players should return zero.")
-    print ("{}. All players can be deleted.").format(test_num)
+    print ("{}. All players can be deleted.".format(test_num))
 
 
 def test_register_player(test_num):
@@ -67,8 +94,8 @@ def test_register_player(test_num):
     if c != 1:
         raise ValueError(
             "After one player registers, count_players() should be 1.")
-    print ("{}. After registering a player, count_players() returns 1.")\
-            .format(test_num)
+    print ("{}. After registering a player, count_players() returns 1."
+           .format(test_num))
 
 
 def test_add_player_to_event(test_num):
@@ -84,8 +111,8 @@ def test_add_player_to_event(test_num):
     if c != 1:
         raise ValueError(
             "After one player adds to an event, count_players_in_event() should be 1.")
-    print ("{}. After adding a player, count_players_in_event() returns 1.")\
-            .format(test_num)
+    print ("{}. After adding a player, count_players_in_event() returns 1."
+           .format(test_num))
 
 
 def test_remove_player_from_event(test_num):
@@ -102,21 +129,21 @@ def test_remove_player_from_event(test_num):
     if c != 0:
         raise ValueError(
             "count_players_in_event() should be 0.")
-    print ("{}. After removing a player, count_players_in_event() returns 0.")\
-            .format(test_num)
+    print ("{}. After removing a player, count_players_in_event() returns 0."
+           .format(test_num))
 
 
 def test_delete_all_matches(test_num):
     delete_all_events()
     delete_all_matches()
-    print ("{}. All matches can be deleted.").format(test_num)
+    print ("{}. All matches can be deleted.".format(test_num))
 
 
 def test_delete_matches_from_event(test_num):
     delete_all_events()
     event_id = register_event("Blitz Tournament", "2015/12/30")
     delete_matches_from_event(event_id)
-    print ("{}. All matches from event can be deleted.").format(test_num)
+    print ("{}. All matches from event can be deleted.".format(test_num))
 
 
 def test_register_count_delete(test_num):
@@ -135,7 +162,7 @@ def test_register_count_delete(test_num):
     c = count_players()
     if c != 0:
         raise ValueError("After deleting, count_players should return zero.")
-    print ("{}. Players can be registered and deleted.").format(test_num)
+    print ("{}. Players can be registered and deleted.".format(test_num))
 
 
 def test_standings_before_matches(test_num):
@@ -164,8 +191,8 @@ def test_standings_before_matches(test_num):
     if set([name1, name2]) != set(["Melpomene Murray", "Gary Nunez"]):
         raise ValueError("Registered players' names should appear in standings, "
                          "even if they have no matches played.")
-    print ("{}. Newly registered players appear in the standings with no matches.")\
-            .format(test_num)
+    print ("{}. Newly registered players appear in the standings with no matches."
+           .format(test_num))
 
 
 def test_report_matches(test_num):
@@ -193,8 +220,8 @@ def test_report_matches(test_num):
             raise ValueError("Each match winner should have one win recorded.")
         elif i in (id2, id3) and w > 0:
             raise ValueError("Each match loser should have zero wins recorded.")
-    print ("{}. After a match, players have updated standings.")\
-            .format(test_num)
+    print ("{}. After a match, players have updated standings."
+           .format(test_num))
 
 
 def test_pairings(test_num):
@@ -224,8 +251,8 @@ def test_pairings(test_num):
     if correct_pairs != actual_pairs:
         raise ValueError(
             "After one match, players with one win should be paired.")
-    print ("{}. After one match, players with one win are paired.")\
-            .format(test_num)
+    print ("{}. After one match, players with one win are paired."
+           .format(test_num))
 
 
 def test_tournament (test_num):
@@ -300,8 +327,7 @@ def test_tournament (test_num):
         raise ValueError("In this case winner must have 4 points")
     if p16 > 0.0:
         raise ValueError("In this case the last player must have 0 points")
-    print ("{}. After 4 rounds we have a winner")\
-            .format(test_num)
+    print ("{}. After 4 rounds we have a winner".format(test_num))
 
 
 def test_prevent_rematches (test_num):
@@ -344,8 +370,7 @@ def test_prevent_rematches (test_num):
     if round_one == round_two:
         raise ValueError(
             "After one match players do not rematch.")
-    print ("{}. Preventing rematches between players")\
-            .format(test_num)
+    print ("{}. Preventing rematches between players".format(test_num))
 
 
 def test_odd_players (test_num):
@@ -359,19 +384,959 @@ def test_odd_players (test_num):
     add_player_to_event(event_id, player1_id)
     add_player_to_event(event_id, player2_id)
     add_player_to_event(event_id, player3_id)
-    standings = player_standings(event_id)
     pairings = swiss_pairings(event_id, 1)
-    #print ("\n{}\n".format(pairings))
     standings = player_standings(event_id)
-    #print ("\n{}\n".format(standings))
-    if len(standings) < 4:
-        raise ValueError("In this case there must be 4 players")
-    print ("{}. Player Bye Added when odd number of players")\
-            .format(test_num)   
+    if len(standings) != 3 or count_players_in_event(event_id) != 3:
+        raise ValueError("The bye should not be a player of the event.")
+    byes = [id1 for (id1, name1, id2, name2) in pairings if id2 is None]
+    if len(pairings) != 2 or len(byes) != 1:
+        raise ValueError("One player should get the bye.")
+    if [(p, m) for (i, n, p, m) in standings if i == byes[0]] != [(1.0, 1)]:
+        raise ValueError("The bye should be worth one point.")
+    [(id1, name1, id2, name2), bye] = swiss_pairings(event_id, 1)
+    if player_standings(event_id) != standings:
+        raise ValueError("Pairing a round again should replace its bye.")
+    report_round(event_id, 1, [(id1, 1.0, id2, 0.0)])
+    second = [id1 for (id1, name1, id2, name2)
+              in swiss_pairings(event_id, 2) if id2 is None]
+    if second == byes:
+        raise ValueError("A player should not get the bye twice.")
+    print ("{}. Bye given when odd number of players".format(test_num))
+
+
+def test_transaction(test_num):
+    delete_all_events()
+    delete_players()
+    with transaction():
+        event_id = register_event("Blitz Tournament", "2015/12/30")
+        player_id = register_player("Aristoteles", "Nunez")
+        add_player_to_event(event_id, player_id)
+    if count_players_in_event(event_id) != 1:
+        raise ValueError("Operations in a transaction should be committed.")
+    try:
+        with transaction():
+            register_player("Gary", "Nunez")
+            raise RuntimeError("abort")
+    except RuntimeError:
+        pass
+    if count_players() != 1:
+        raise ValueError("A failed transaction should be rolled back.")
+    report_match(event_id, 1, player_id, 1.0, None, None)
+    standings = [tuple(row) for row in player_standings(event_id)]
+    if standings[0][2:] != (1.0, 1):
+        raise ValueError("A bye should be reported without second player.")
+    try:
+        with transaction():
+            gary_id = register_player("Gary", "Nunez")
+            add_player_to_event(event_id, gary_id)
+            report_match(event_id, 2, player_id, 0.0, gary_id, 1.0)
+            raise RuntimeError("abort")
+    except RuntimeError:
+        pass
+    if count_players() != 1 or \
+            [tuple(row) for row in player_standings(event_id)] != standings:
+        raise ValueError("A failed transaction should undo every write.")
+    print ("{}. Operations can be grouped into one transaction."
+           .format(test_num))
+
+
+def test_register_players_bulk(test_num):
+    delete_all_events()
+    delete_players()
+    event_id = register_event("Blitz Tournament", "2015/12/30")
+    players = [("Twilight", "Sparkle"), ("Flutter", "Shy"),
+               ("Aristoteles", "Nunez")]
+    ids = register_players_bulk(players)
+    if len(ids) != 3:
+        raise ValueError("register_players_bulk() should return one id per "
+                         "player.")
+    add_players_to_event_bulk(event_id, ids)
+    if count_players_in_event(event_id) != 3:
+        raise ValueError(
+            "After a bulk load, count_players_in_event() should be 3.")
+    names = dict((row[0], row[1]) for row in player_standings(event_id))
+    if [names.get(player_id) for player_id in ids] != \
+            [firstname + " " + lastname for firstname, lastname in players]:
+        raise ValueError("register_players_bulk() should return the id of "
+                         "each player at its position.")
+    print ("{}. Players can be registered and added to events in bulk."
+           .format(test_num))
+
+
+def test_pair_round_avoids_rematches(test_num):
+    standings = [(1, "A", 1.0, 1), (2, "B", 1.0, 1),
+                 (3, "C", 0.0, 1), (4, "D", 0.0, 1)]
+    played = played_pairs([(1, 3), (2, 4)])
+    pairs = set(frozenset([row1[0], row2[0]])
+                for row1, row2 in pair_round(standings, played))
+    if pairs != set([frozenset([1, 2]), frozenset([3, 4])]):
+        raise ValueError("Players should be paired inside their score group.")
+    played = played_pairs([(1, 2), (3, 4)])
+    pairs = set(frozenset([row1[0], row2[0]])
+                for row1, row2 in pair_round(standings, played))
+    if frozenset([1, 2]) in pairs or frozenset([3, 4]) in pairs:
+        raise ValueError("pair_round() should avoid rematches.")
+    played = played_pairs([(3, 4)])
+    for row1, row2 in pair_round(standings, played, max_backtracks=0):
+        if (row1[0], row2[0]) in played:
+            raise ValueError("pair_round() should avoid rematches once out "
+                             "of search budget.")
+    print ("{}. The pairing engine avoids rematches in memory."
+           .format(test_num))
+
+
+def test_pair_round_matching(test_num):
+    standings = [(i, "Player{}".format(i), 0.0, 0) for i in range(1, 9)]
+    matches = []
+    for round_number in range(7):
+        played = played_pairs(matches)
+        pairs = pair_round_matching(standings, played)
+        if len(pairs) != 4:
+            raise ValueError("Every player should be paired in each round.")
+        for row1, row2 in pairs:
+            if (row1[0], row2[0]) in played:
+                raise ValueError(
+                    "Matching pairings should not rematch for 7 rounds.")
+            matches.append((row1[0], row2[0]))
+    print ("{}. Matching pairings find 7 rematch-free rounds for 8 players."
+           .format(test_num))
+
+
+def test_rebuild_standings(test_num):
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    event_id = register_event("Blitz Tournament", "2015/12/30")
+    player1_id = register_player("Twilight", "Sparkle")
+    player2_id = register_player("Flutter", "Shy")
+    add_player_to_event(event_id, player1_id)
+    add_player_to_event(event_id, player2_id)
+    report_match(event_id, 1, player1_id, 0.5, player2_id, 0.5)
+    if rebuild_standings(event_id, check_only=True):
+        raise ValueError(
+            "Stored standings should agree with the computed ones.")
+    [(id1, name1, points1, matches1), (id2, name2, points2, matches2)] = \
+        player_standings(event_id)
+    if points1 != 0.5 or points2 != 0.5 or matches1 != 1 or matches2 != 1:
+        raise ValueError("report_match() should update stored standings.")
+    print ("{}. Stored standings agree with the matches.".format(test_num))
+
+
+# Size of the history loaded by test_event_scoped_indexes
+EXPLAIN_FIXTURE_MATCHES = 1000000
+
+
+def explain(query, params):
+    """Returns the plan chosen by PostgreSQL for a query as text."""
+    with transaction() as db:
+        c = db.cursor()
+        c.execute("EXPLAIN " + query, params)
+        plan = "\n".join(row[0] for row in c.fetchall())
+        c.close()
+    return plan
+
+
+@postgres_only
+def test_event_scoped_indexes(test_num):
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    event_id = register_event("Blitz Tournament", "2015/12/30")
+    history_id = register_event("Past Tournament", "2014/12/30")
+    player_ids = register_players_bulk(
+        [("Player{}".format(i), "Nunez") for i in range(1000)])
+    add_players_to_event_bulk(event_id, player_ids[:16])
+    add_players_to_event_bulk(history_id, player_ids)
+    report_match(history_id, 1, player_ids[0], 1.0, player_ids[1], 0.0)
+    standings = dict((row[0], row[2]) for row in player_standings(event_id))
+    if standings[player_ids[0]] != 0:
+        raise ValueError("Matches of other events should not be counted.")
+    # Load a large history without firing the standings triggers
+    with transaction() as db:
+        c = db.cursor()
+        c.execute("ALTER TABLE matches DISABLE TRIGGER matchesStandings")
+        c.execute("""INSERT INTO matches (player_one, player_two,
+                     player_one_score, player_two_score, event, round_number)
+                     SELECT %(first)s + i %% 1000, %(first)s + (i + 1) %% 1000,
+                        1.0, 0.0, %(event)s, i / 500
+                     FROM generate_series(1, %(size)s) AS i""",
+                  {"first": player_ids[0], "event": history_id,
+                   "size": EXPLAIN_FIXTURE_MATCHES})
+        c.execute("ALTER TABLE matches ENABLE TRIGGER matchesStandings")
+        c.execute("ANALYZE matches")
+        c.close()
+    plans = [
+        explain("SELECT * FROM opponents(%s, %s)", [event_id, player_ids[0]]),
+        explain("SELECT * FROM computedStandings(%s)", [event_id]),
+        explain("SELECT player_one, player_two FROM matches WHERE event=%s",
+                [event_id]),
+        explain("SELECT * FROM pairings WHERE event=%s AND round_number=%s",
+                [event_id, 1]),
+    ]
+    with transaction() as db:
+        c = db.cursor()
+        c.execute("ALTER TABLE matches DISABLE TRIGGER matchesStandings")
+        c.execute("DELETE FROM matches WHERE event=%s", [history_id])
+        c.execute("ALTER TABLE matches ENABLE TRIGGER matchesStandings")
+        c.close()
+    for plan in plans:
+        if "Index" not in plan or "Seq Scan on matches" in plan:
+            raise ValueError("Event queries should use an index:\n" + plan)
+    print ("{}. Event queries use index scans over a large history."
+           .format(test_num))
+
+
+def test_report_round(test_num):
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    event_id = register_event("Blitz Tournament", "2015/12/30")
+    for firstname, lastname in [("Twilight", "Sparkle"), ("Flutter", "Shy"),
+                                ("Aristoteles", "Nunez"), ("Gary", "Nunez")]:
+        add_player_to_event(event_id, register_player(firstname, lastname))
+    [(id1, name1, id2, name2), (id3, name3, id4, name4)] = \
+        swiss_pairings(event_id, 1)
+    errors = report_round(event_id, 1, [(id1, 1.0, id3, 0.0)])
+    if len(errors) != 3:
+        raise ValueError("Unpaired boards and missing results should be "
+                         "reported as errors.")
+    if count_players_in_event(event_id) != 4 or \
+            player_standings(event_id)[0][3] != 0:
+        raise ValueError("A round with errors should not be stored.")
+    errors = report_round(event_id, 1, [(id1, 1.0, id2, 0.0),
+                                        (id4, 0.5, id3, 0.5)])
+    if errors:
+        raise ValueError("A valid round should be stored.")
+    for (i, n, p, m) in player_standings(event_id):
+        if m != 1:
+            raise ValueError("Each player should have one match recorded.")
+    if not report_round(event_id, 1, [(id1, 1.0, id2, 0.0),
+                                      (id3, 0.5, id4, 0.5)]):
+        raise ValueError("A round should not be reported twice.")
+    print ("{}. A whole round can be reported and validated at once."
+           .format(test_num))
+
+
+@postgres_only
+def test_standings_cache(test_num):
+    from tournament import cache_stats, configure_cache
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    event_id = register_event("Blitz Tournament", "2015/12/30")
+    player1_id = register_player("Twilight", "Sparkle")
+    player2_id = register_player("Flutter", "Shy")
+    add_player_to_event(event_id, player1_id)
+    add_player_to_event(event_id, player2_id)
+    configure_cache(ttl=None)
+    try:
+        player_standings(event_id)
+        hits = cache_stats()["hits"]
+        standings = player_standings(event_id)
+        if cache_stats()["hits"] != hits + 1:
+            raise ValueError(
+                "Repeated standings should be read from the cache.")
+        standings[0][2] = 10.0
+        if player_standings(event_id)[0][2] == 10.0:
+            raise ValueError("Cached standings should not be shared.")
+        report_match(event_id, 1, player1_id, 1.0, player2_id, 0.0)
+        if player_standings(event_id)[0][3] != 1:
+            raise ValueError(
+                "report_match() should invalidate cached standings.")
+    finally:
+        configure_cache(0)
+    print ("{}. Standings are cached until the next write.".format(test_num))
+
+
+def test_cache_expiry(test_num):
+    from tournament_cache import VersionedCache
+    cache = VersionedCache(ttl=60.0)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return [[1, "Twilight Sparkle", 0.0, 0]]
+    rows = cache.get("standings", 1, (), load)
+    rows[0][2] = 1.0
+    if cache.get("standings", 1, (), load) != [[1, "Twilight Sparkle",
+                                                0.0, 0]] or len(loads) != 1:
+        raise ValueError("Cached results should be copies.")
+    cache.ttl = 0.0
+    cache.get("standings", 1, (), load)
+    if len(loads) != 2:
+        raise ValueError("Expired results should be read again.")
+    if VersionedCache(0).get("standings", 1, (), load) is None or \
+            len(loads) != 3:
+        raise ValueError("A disabled cache should always read.")
+    print ("{}. Cached results expire and are not shared.".format(test_num))
+
+
+def test_tiebreaks(test_num):
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    event_id = register_event("Blitz Tournament", "2015/12/30")
+    [a, b, c, d] = [register_player("Player", name)
+                    for name in ["A", "B", "C", "D"]]
+    for player_id in [a, b, c, d]:
+        add_player_to_event(event_id, player_id)
+    report_match(event_id, 1, a, 1.0, b, 0.0)
+    report_match(event_id, 1, c, 1.0, d, 0.0)
+    report_match(event_id, 2, a, 0.0, c, 1.0)
+    report_match(event_id, 2, b, 1.0, d, 0.0)
+    standings = player_standings(event_id, tiebreaks=["buchholz", "omw"])
+    if [row[0] for row in standings] != [c, a, b, d]:
+        raise ValueError("Players tied on points should be ranked by "
+                         "their tiebreaks.")
+    [row_c, row_a, row_b, row_d] = standings
+    if len(row_a) != 6 or row_a[4] != 3.0 or row_b[4] != 1.0:
+        raise ValueError("Buchholz should add the points of the opponents.")
+    if abs(row_d[5] - 0.75) > 1e-9 or abs(row_c[5] - 5.0 / 12) > 1e-9:
+        raise ValueError("OMW should average the opponents' win rate, "
+                         "never less than one third.")
+    [row_c] = [row for row in player_standings(
+        event_id, tiebreaks=["sonneborn_berger"]) if row[0] == c]
+    if row_c[4] != 1.0:
+        raise ValueError("Sonneborn-Berger should add the points of the "
+                         "beaten opponents.")
+    print ("{}. Standings can be ranked by OMW, Buchholz and "
+           "Sonneborn-Berger.".format(test_num))
+
+
+def test_simulation(test_num):
+    try:
+        from tournament_simulation import run_simulations
+    except ImportError:
+        print ("{}. Skipped, it needs numpy.".format(test_num))
+        return
+    weak = run_simulations(9, 2, 200, seed=2015, processes=1)
+    strong = run_simulations(9, 6, 200, seed=2015, processes=1)
+    if weak["simulations"] != 200 or strong["rematches"] != 0 or \
+            strong["repeat_byes"] != 0:
+        raise ValueError("Simulated events should avoid rematches and "
+                         "repeated byes.")
+    if not weak["spearman"] < strong["spearman"] or \
+            not weak["winner"] < strong["winner"]:
+        raise ValueError("More rounds should rank the players better.")
+    print ("{}. Tournaments can be simulated to choose the number of "
+           "rounds.".format(test_num))
+
+
+@postgres_only
+def test_export(test_num):
+    import csv
+    import tempfile
+    from tournament_export import export, iter_batches
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    event_id = register_event("Blitz Tournament", "2015/12/30")
+    for firstname, lastname in [("Twilight", "Sparkle"), ("Flutter", "Shy"),
+                                ("Aristoteles", "Nunez"), ("Gary", "Nunez")]:
+        add_player_to_event(event_id, register_player(firstname, lastname))
+    for round_number in [1, 2]:
+        pairings = swiss_pairings(event_id, round_number)
+        report_round(event_id, round_number,
+                     [(id1, 1.0, id2, 0.0) for id1, _, id2, _ in pairings])
+    if [len(rows) for rows in iter_batches("matches", event_id, 3)] != \
+            [3, 1]:
+        raise ValueError("Rows should be read in batches.")
+    path = tempfile.mktemp(suffix=".csv")
+    try:
+        if export("standings", path, event_id=event_id) != 8:
+            raise ValueError("Every player should have standings for every "
+                             "round.")
+        with open(path) as f:
+            rows = list(csv.reader(f))
+    finally:
+        os.remove(path)
+    if rows[0] != ["event", "round_number", "player", "name", "points",
+                   "matches"] or [row[1] for row in rows[1:]] != \
+            ["1"] * 4 + ["2"] * 4:
+        raise ValueError("Standings should be exported round by round.")
+    if float(rows[5][4]) != 2.0 or rows[5][5] != "2":
+        raise ValueError("Exported standings should be cumulative.")
+    print ("{}. Matches, pairings and standings can be exported."
+           .format(test_num))
+
+
+def test_standings_snapshots(test_num):
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    event_id = register_event("Blitz Tournament", "2015/12/30")
+    for firstname, lastname in [("Twilight", "Sparkle"), ("Flutter", "Shy"),
+                                ("Aristoteles", "Nunez"), ("Gary", "Nunez")]:
+        add_player_to_event(event_id, register_player(firstname, lastname))
+    pairings = swiss_pairings(event_id, 1)
+    report_round(event_id, 1, [(id1, 1.0, id2, 0.0)
+                               for id1, _, id2, _ in pairings])
+    after_first = player_standings(event_id)
+    for id1, _, id2, _ in swiss_pairings(event_id, 2):
+        report_match(event_id, 2, id1, 1.0, id2, 0.0)
+    after_second = player_standings(event_id)
+    if player_standings(event_id, round_number=2) != after_second:
+        raise ValueError("A round without snapshot should be computed from "
+                         "its matches.")
+    pairings = swiss_pairings(event_id, 3)
+    if backfill_snapshots(event_id) != []:
+        raise ValueError("Pairing a round should finalize the previous one.")
+    report_round(event_id, 3, [(id1, 0.5, id2, 0.5)
+                               for id1, _, id2, _ in pairings])
+    if player_standings(event_id, round_number=1) != after_first or \
+            player_standings(event_id, round_number=2) != after_second or \
+            player_standings(event_id, round_number=3) != \
+            player_standings(event_id):
+        raise ValueError("Reported rounds should be finalized with a "
+                         "snapshot of their standings.")
+    # A result of round 2 reported after it was finalized
+    report_match(event_id, 2, pairings[0][0], 1.0, pairings[0][2], 0.0)
+    if player_standings(event_id, round_number=2) == after_second or \
+            player_standings(event_id, round_number=3) != \
+            player_standings(event_id):
+        raise ValueError("A snapshot should not hide later results.")
+    if backfill_snapshots(event_id) != [(event_id, 2), (event_id, 3)] or \
+            player_standings(event_id, round_number=3) != \
+            player_standings(event_id):
+        raise ValueError("Missing snapshots should be backfilled.")
+    if player_standings(event_id, round_number=1) != after_first:
+        raise ValueError("Later rounds should not change a snapshot.")
+    print ("{}. Standings of past rounds are read from snapshots."
+           .format(test_num))
+
+
+def test_metrics(test_num):
+    import tournament_metrics
+    observed = []
+    tournament_metrics.enable(lambda *args: observed.append(args))
+    try:
+        @tournament_metrics.instrumented
+        def timed_twice(value):
+            return value * 2
+        if timed_twice(21) != 42 or \
+                [args[:2] for args in observed] != \
+                [("tournament_function_seconds", "timed_twice")]:
+            raise ValueError("Instrumented calls should be recorded.")
+        event_id = register_event("Blitz Tournament", "2015/12/30")
+        player_standings(event_id)
+        text = tournament_metrics.render()
+        if 'tournament_function_seconds_count{function="timed_twice"} 1' \
+                not in text:
+            raise ValueError("Metrics should be rendered as Prometheus "
+                             "text.")
+        if BACKEND == "postgres" and \
+                'tournament_query_seconds_count{query="INSERT events"}' \
+                not in text:
+            raise ValueError("Every statement should be timed.")
+    finally:
+        tournament_metrics.disable()
+    if tournament_metrics.render() or timed_twice(1) != 2:
+        raise ValueError("Disabled metrics should record nothing.")
+    print ("{}. Functions and queries can be timed.".format(test_num))
+
+
+@postgres_only
+def test_concurrent_pairings(test_num):
+    import threading
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    event_id = register_event("Blitz Tournament", "2015/12/30")
+    add_players_to_event_bulk(event_id, register_players_bulk(
+        [("Player{}".format(i), "Concurrent") for i in range(33)]))
+    errors = []
+
+    def pair():
+        try:
+            swiss_pairings(event_id, 1)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=pair) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise ValueError("Concurrent pairings should not fail: {}"
+                         .format(errors[0]))
+    pairings = round_pairings(event_id, 1)
+    if len(pairings) != 17 or \
+            len([p for p in pairings if p[2] is None]) != 1 or \
+            sum(m for (i, n, p, m) in player_standings(event_id)) != 1:
+        raise ValueError("Concurrent pairings of a round should leave a "
+                         "single pairing and bye.")
+    print ("{}. Concurrent pairings of an event are serialized."
+           .format(test_num))
+
+
+def test_pair_events(test_num):
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    players = register_players_bulk(
+        [("Player{}".format(i), "Festival") for i in range(12)])
+    open_id = register_event("Open", "2015/12/30")
+    add_players_to_event_bulk(open_id, players[:8])
+    junior_id = register_event("Junior", "2015/12/30")
+    add_players_to_event_bulk(junior_id, players[8:])
+    missing_id = max(open_id, junior_id) + 1
+    results = pair_events([(open_id, 1), (missing_id, 1), (junior_id, 1)])
+    if [(e, r) for (e, r, p, s, error) in results] != \
+            [(open_id, 1), (missing_id, 1), (junior_id, 1)]:
+        raise ValueError("Results should follow the order of the requests.")
+    [opened, missing, junior] = results
+    if opened[4] is not None or len(opened[2]) != 4 or \
+            junior[4] is not None or len(junior[2]) != 2:
+        raise ValueError("Every valid event should be paired.")
+    if missing[2] is not None or not isinstance(missing[4], ValueError):
+        raise ValueError("A failing event should be reported.")
+    if [tuple(row) for row in round_pairings(junior_id, 1)] != junior[2]:
+        raise ValueError("Pairings of every event should be stored.")
+    print ("{}. Rounds of many events can be paired at once."
+           .format(test_num))
+
+
+@postgres_only
+def test_pair_events_busy_pool(test_num):
+    import tournament
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    players = register_players_bulk(
+        [("Player{}".format(i), "Busy") for i in range(16)])
+    events = []
+    for k in range(4):
+        event_id = register_event("Section {}".format(k), "2015/12/30")
+        add_players_to_event_bulk(event_id, players[4 * k:4 * k + 4])
+        events.append(event_id)
+    db = tournament.get_db()
+    tournament.configure(db.dsn, maxconn=2, replica_dsn=db.replica_dsn,
+                         read_your_writes=db.read_your_writes)
+    try:
+        # The calling thread holds one of the two connections meanwhile
+        with transaction():
+            results = pair_events([(event_id, 1) for event_id in events],
+                                  workers=2)
+    finally:
+        tournament.configure(db.dsn, maxconn=db.maxconn,
+                             replica_dsn=db.replica_dsn,
+                             read_your_writes=db.read_your_writes,
+                             pool_timeout=db.pool_timeout)
+    if [result[4] for result in results] != [None] * 4 or \
+            [len(result[2]) for result in results] != [2] * 4:
+        raise ValueError("Workers should wait for a free connection "
+                         "instead of failing.")
+    print ("{}. Events are paired while the pool is busy.".format(test_num))
+
+
+def test_search_players(test_num):
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    [twilight, flutter, aristoteles, gary] = register_players_bulk(
+        [("Twilight", "Sparkle"), ("Flutter", "Shy"),
+         ("Aristoteles", "Nunez"), ("Gary", "Nunez")])
+    if [row[0] for row in search_players("nunez", "exact")] != \
+            [aristoteles, gary] or \
+            search_players("GARY", "exact") != [(gary, "Gary", "Nunez")] or \
+            search_players("gary nunez", "exact") != \
+            [(gary, "Gary", "Nunez")]:
+        raise ValueError("Exact search should match any name, ignoring "
+                         "case.")
+    if [row[0] for row in search_players("nu", "prefix")] != \
+            [aristoteles, gary] or \
+            [row[0] for row in search_players("Flutter S")] != [flutter]:
+        raise ValueError("Prefix search should match the start of names.")
+    if [row[0] for row in search_players("nu", limit=1, offset=1)] != \
+            [gary]:
+        raise ValueError("Search results should be paginated.")
+    if [row[0] for row in search_players("Gari Nunes", "fuzzy")][:1] != \
+            [gary]:
+        raise ValueError("Fuzzy search should find misspelled names.")
+    if search_players("100%", "prefix") or \
+            lookup_player("Twilight", "Shy") != -1:
+        raise ValueError("Unknown names should not be found.")
+    if lookup_player("Twilight", "Sparkle") != twilight or \
+            lookup_player("Twilight", "Sparkle") != twilight:
+        raise ValueError("Players should be found by their name.")
+    delete_players()
+    if lookup_player("Twilight", "Sparkle") != -1:
+        raise ValueError("Deleted players should not be found.")
+    print ("{}. Players can be searched by name.".format(test_num))
+
+
+def test_purge_events(test_num):
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    event_ids = [register_event("Blitz Tournament", event_date)
+                 for event_date in ["2014/06/01", "2015/06/01", "2016/06/01"]]
+    for event_id in event_ids:
+        for firstname, lastname in [("Twilight", "Sparkle"),
+                                    ("Flutter", "Shy")]:
+            add_player_to_event(event_id,
+                                register_player(firstname, lastname))
+        [(id1, name1, id2, name2)] = swiss_pairings(event_id, 1)
+        report_round(event_id, 1, [(id1, 1.0, id2, 0.0)])
+    if purge_events([event_ids[2]]) != [event_ids[2]] or \
+            count_events() != 2 or player_standings(event_ids[2]) or \
+            round_pairings(event_ids[2], 1):
+        raise ValueError("Purged events should be removed with their rows.")
+    if purge_events(before="2015/01/01", archive=True) != [event_ids[0]] or \
+            count_events() != 1 or \
+            len(player_standings(event_ids[1], round_number=1)) != 2:
+        raise ValueError("Only the events before the date should be "
+                         "archived.")
+    if BACKEND == "postgres":
+        with transaction() as db:
+            c = db.cursor()
+            c.execute("SELECT count(*) FROM archive.matches WHERE event=%s",
+                      [event_ids[0]])
+            archived = c.fetchone()[0]
+            c.close()
+        if archived != 1:
+            raise ValueError("Archived events should keep their matches.")
+    reset_database()
+    if count_events() != 0 or count_players() != 0 or \
+            register_event("Blitz Tournament", "2016/06/01") != 1:
+        raise ValueError("A reset should empty the database.")
+    print ("{}. Events can be purged, archived and reset.".format(test_num))
+
+
+@postgres_only
+def test_event_partitions(test_num):
+    import re
+    import tournament
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    tournament.create_partitions(150)
+    count = "SELECT count(*) FROM pg_inherits \
+             WHERE inhparent = 'matches'::regclass"
+    with transaction() as db:
+        c = db.cursor()
+        c.execute(count)
+        before = c.fetchone()[0]
+        event_ids = [register_event("Section {}".format(k), "2015/12/30")
+                     for k in range(150)]
+        c.execute(count)
+        after = c.fetchone()[0]
+        c.close()
+    if after != before:
+        raise ValueError("Registering an event should not create "
+                         "partitions.")
+    if tournament.create_partitions(0) != 0:
+        raise ValueError("The partitions of registered events should "
+                         "exist already.")
+    player_ids = register_players_bulk(
+        [("Twilight", "Sparkle"), ("Flutter", "Shy")])
+    for event_id in (event_ids[0], event_ids[-1]):
+        add_players_to_event_bulk(event_id, player_ids)
+        report_match(event_id, 1, player_ids[0], 1.0, player_ids[1], 0.0)
+    with transaction() as db:
+        c = db.cursor()
+        c.execute("SELECT DISTINCT tableoid::regclass::text FROM matches")
+        partitions = [row[0] for row in c.fetchall()]
+        c.close()
+    if len(partitions) != 2:
+        raise ValueError("Distant events should be stored in different "
+                         "partitions.")
+    for query in ["SELECT * FROM computedStandings(%s)",
+                  "SELECT * FROM opponents(%s, {})".format(player_ids[0])]:
+        plan = explain(query, [event_ids[-1]])
+        if len(set(re.findall(r"on (matches_\d+)", plan))) != 1:
+            raise ValueError("The queries of an event should only read "
+                             "its partition.")
+    if [row[2] for row in player_standings(event_ids[-1])] != [1.0, 0.0]:
+        raise ValueError("Standings should count the partitioned matches.")
+    print ("{}. Matches are partitioned by event.".format(test_num))
+
+
+def test_have_played(test_num):
+    matches = [(k, (k * 7 + 3) % 40) for k in range(40)] + [(5, None)]
+    played = PlayedMatrix(matches[:10])
+    played.update(matches[10:])
+    expected = played_pairs(match for match in matches if match[1] is not None)
+    if any(((i, j) in played) != ((i, j) in expected)
+           for i in range(42) for j in range(42)):
+        raise ValueError("PlayedMatrix should answer like played_pairs.")
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    event_id = register_event("Blitz Tournament", "2015/12/30")
+    player_ids = register_players_bulk(
+        [("Twilight", "Sparkle"), ("Flutter", "Shy"), ("Aristoteles", "Nunez"),
+         ("Gary", "Nunez"), ("Vladimir", "Kramnik")])
+    add_players_to_event_bulk(event_id, player_ids)
+    pairings = swiss_pairings(event_id, 1)
+    pairs = [(id1, id2) for id1, _, id2, _ in pairings if id2 is not None]
+    bye = [id1 for id1, _, id2, _ in pairings if id2 is None][0]
+    for id1, id2 in pairs:
+        if have_played(event_id, id1, id2):
+            raise ValueError("Paired players have not played yet.")
+    report_round(event_id, 1, [(id1, 1.0, id2, 0.0) for id1, id2 in pairs])
+    for id1, id2 in pairs:
+        if not have_played(event_id, id1, id2) or \
+                not have_played(event_id, id2, id1):
+            raise ValueError("Reported players should have played.")
+    if any(have_played(event_id, bye, player_id) for player_id in player_ids):
+        raise ValueError("A bye is not a match against anybody.")
+    report_match(event_id, 2, bye, 1.0, pairs[0][0], 0.0)
+    if not have_played(event_id, pairs[0][0], bye):
+        raise ValueError("A new match should be seen at once.")
+    delete_matches_from_event(event_id)
+    if have_played(event_id, pairs[0][0], pairs[0][1]):
+        raise ValueError("Deleted matches should be forgotten.")
+    print ("{}. Rematches are checked with a bit matrix.".format(test_num))
+
+
+@postgres_only
+def test_read_replica(test_num):
+    import time
+    from tournament import get_db
+    if get_db().replica_dsn is None:
+        print ("{}. Skipped, it needs TOURNAMENT_REPLICA_DSN."
+               .format(test_num))
+        return
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    event_id = register_event("Blitz Tournament", "2015/12/30")
+    player_ids = register_players_bulk(
+        [("Twilight", "Sparkle"), ("Flutter", "Shy")])
+    add_players_to_event_bulk(event_id, player_ids)
+    # The primary is read until the replica replays the writes above
+    for _ in range(100):
+        with read_only() as db:
+            c = db.cursor()
+            c.execute("SELECT pg_is_in_recovery()")
+            in_recovery = c.fetchone()[0]
+            c.close()
+        if in_recovery:
+            break
+        time.sleep(0.1)
+    if not in_recovery:
+        raise ValueError("Reads should go to the replica.")
+    for round_number in range(1, 21):
+        report_match(event_id, round_number, player_ids[0], 1.0,
+                     player_ids[1], 0.0)
+        standings = player_standings(event_id)
+        if standings[0][2] != round_number or \
+                count_players_in_event(event_id) != 2:
+            raise ValueError("Reads should see the writes just made.")
+    # The location of a write could not be read: the primary is read, and
+    # takes it again
+    get_db()._lsn_unknown = True
+    with read_only() as db:
+        c = db.cursor()
+        c.execute("SELECT pg_is_in_recovery()")
+        in_recovery = c.fetchone()[0]
+        c.close()
+    if in_recovery or get_db()._lsn_unknown:
+        raise ValueError("An unknown write location should read the "
+                         "primary.")
+    print ("{}. Reads go to the replica and see the writes made."
+           .format(test_num))
 
 
+@postgres_only
+def test_standings_feed(test_num):
+    import time
+    from tournament_notify import StandingsFeed
+
+    def caught_up(feed, event_id):
+        # Notifications arrive shortly after the commits
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            if feed.standings(event_id) == \
+                    [tuple(row) for row in player_standings(event_id)]:
+                return True
+            feed.poll(0.1)
+        return False
+
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    event_id = register_event("Blitz Tournament", "2015/12/30")
+    player_ids = register_players_bulk(
+        [("Twilight", "Sparkle"), ("Flutter", "Shy"), ("Aristoteles", "Nunez"),
+         ("Gary", "Nunez"), ("Vladimir", "Kramnik")])
+    add_players_to_event_bulk(event_id, player_ids[:4])
+    feed = StandingsFeed([event_id], reconnect_delay=0)
+    try:
+        feed.poll(0)
+        resyncs = feed.resyncs
+        pairings = swiss_pairings(event_id, 1)
+        report_match(event_id, 1, pairings[0][0], 1.0, pairings[0][2], 0.0)
+        if not caught_up(feed, event_id) or feed.resyncs != resyncs:
+            raise ValueError("Reported results should be pushed.")
+        add_player_to_event(event_id, player_ids[4])
+        if not caught_up(feed, event_id) or feed.resyncs == resyncs:
+            raise ValueError("New players should read the standings again.")
+        feed._conn.close()
+        feed.poll(0)
+        report_match(event_id, 1, pairings[1][0], 0.5, pairings[1][2], 0.5)
+        if not caught_up(feed, event_id):
+            raise ValueError("The feed should catch up after reconnecting.")
+        try:
+            import asyncio
+            import tournament_async
+        except ImportError:
+            tournament_async = None
+        if tournament_async is not None:
+            resyncs = feed.resyncs
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(tournament_async.report_match(
+                    event_id, 2, pairings[0][0], 0.0, pairings[0][2], 1.0))
+            finally:
+                loop.run_until_complete(tournament_async.close())
+                loop.close()
+            if not caught_up(feed, event_id) or feed.resyncs != resyncs:
+                raise ValueError("Results reported through tournament_async "
+                                 "should be pushed.")
+    finally:
+        feed.close()
+    print ("{}. Standings changes are pushed to subscribers.".format(test_num))
+
+
+def test_journal(test_num):
+    import shutil
+    import tempfile
+    from tournament_journal import Journal
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    event_id = register_event("Blitz Tournament", "2015/12/30")
+    player_ids = register_players_bulk(
+        [("Twilight", "Sparkle"), ("Flutter", "Shy"), ("Gary", "Nunez")])
+    add_players_to_event_bulk(event_id, player_ids)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "results.journal")
+    backend = load_backend(BACKEND)
+    try:
+        journal = Journal(path, backend)
+        key = journal.register_player("Aristoteles", "Nunez", event_id)
+        journal.report_match(event_id, 1, player_ids[0], 1.0,
+                             player_ids[1], 0.0)
+        journal.report_match(event_id, 1, key, 0.5, player_ids[2], 0.5)
+        journal.report_match(event_id + 1, 1, player_ids[0], 1.0,
+                             player_ids[1], 0.0)
+        merged = journal.player_standings(event_id)
+        if [row[2] for row in merged] != [1.0, 0.5, 0.5, 0.0] or \
+                merged[1][0] != key or count_players() != 3:
+            raise ValueError("Standings should include the pending entries "
+                             "before they are written.")
+        journal.close()
+        shutil.copy(path, path + ".copy")
+
+        # Entries are read back from the file and written once
+        journal = Journal(path, backend)
+        if len(journal.pending()) != 4 or journal.flush() != 3 or \
+                journal.pending() or len(journal.failed()) != 1:
+            raise ValueError("Pending entries should be written, the wrong "
+                             "one set aside.")
+        standings = [tuple(row) for row in player_standings(event_id)]
+        if journal.player_standings(event_id) != standings or \
+                journal.player_id(key) != standings[1][0]:
+            raise ValueError("Written entries should be in the database.")
+        journal.close()
+        # Replaying the entries, as after a crash before they were marked
+        # as written, changes nothing
+        journal = Journal(path + ".copy", backend)
+        journal.flush()
+        journal.close()
+        if [tuple(row) for row in player_standings(event_id)] != standings \
+                or count_players() != 4:
+            raise ValueError("Replayed entries should be ignored.")
+    finally:
+        shutil.rmtree(directory)
+    print ("{}. Results are journaled and written once.".format(test_num))
+
+
+@postgres_only
+def test_async_parity(test_num):
+    try:
+        import asyncio
+        import tournament_async
+    except ImportError:
+        print ("{}. Skipped, it needs psycopg 3.".format(test_num))
+        return
+    delete_all_events()
+    delete_all_matches()
+    delete_players()
+    loop = asyncio.new_event_loop()
+    run = loop.run_until_complete
+    try:
+        event_id = register_event("Blitz Tournament", "2015/12/30")
+        player_ids = [register_player("Twilight", "Sparkle"),
+                      register_player("Flutter", "Shy"),
+                      run(tournament_async.register_player("Aristoteles",
+                                                           "Nunez")),
+                      run(tournament_async.register_player("Gary", "Nunez")),
+                      run(tournament_async.register_player("Vladimir",
+                                                           "Kramnik"))]
+        if lookup_player("Gary", "Nunez") != player_ids[3] or \
+                run(tournament_async.count_players()) != count_players():
+            raise ValueError("Both APIs should register the same players.")
+        for k, player_id in enumerate(player_ids):
+            if k % 2:
+                add_player_to_event(event_id, player_id)
+            else:
+                run(tournament_async.add_player_to_event(event_id,
+                                                         player_id))
+        for round_number in (1, 2):
+            # The round is paired again by the other API, with the same
+            # standings and opponents
+            pairings = run(tournament_async.swiss_pairings(event_id,
+                                                           round_number))
+            if [tuple(row) for row in swiss_pairings(event_id, round_number)] \
+                    != pairings:
+                raise ValueError("Both APIs should pair rounds the same way.")
+            for k, (id1, _, id2, _) in enumerate(pairings):
+                if id2 is None:
+                    continue
+                if k % 2:
+                    report_match(event_id, round_number, id1, 1.0, id2, 0.0)
+                else:
+                    run(tournament_async.report_match(
+                        event_id, round_number, id1, 0.5, id2, 0.5))
+            standings = [tuple(row) for row in player_standings(event_id)]
+            if run(tournament_async.player_standings(event_id)) != \
+                    standings or \
+                    run(tournament_async.player_standings(
+                        event_id, round_number=round_number)) != standings:
+                raise ValueError("Both APIs should read the same standings.")
+        if [tuple(row) for row in player_standings(event_id, round_number=1)] \
+                != run(tournament_async.player_standings(event_id, 1)):
+            raise ValueError("Both APIs should read the same past rounds.")
+        # A result or a registration replayed by either API is ignored
+        standings = [tuple(row) for row in player_standings(event_id)]
+        report_match(event_id, 3, player_ids[0], 1.0, player_ids[1], 0.0,
+                     idempotency_key="board-1")
+        run(tournament_async.report_match(event_id, 3, player_ids[0], 1.0,
+                                          player_ids[1], 0.0,
+                                          idempotency_key="board-1"))
+        if [row[3] for row in player_standings(event_id)
+                if row[0] == player_ids[0]] != \
+                [row[3] + 1 for row in standings if row[0] == player_ids[0]]:
+            raise ValueError("Both APIs should ignore replayed results.")
+        if run(tournament_async.register_player(
+                "Magnus", "Carlsen", idempotency_key="desk-1")) != \
+                register_player("Magnus", "Carlsen", idempotency_key="desk-1"):
+            raise ValueError("Both APIs should ignore replayed "
+                             "registrations.")
+    finally:
+        run(tournament_async.close())
+        loop.close()
+    print ("{}. The asyncio interface returns the same results."
+           .format(test_num))
+
 
 if __name__ == '__main__':
+    if BACKEND == "postgres":
+        # The partitions of the events registered by the tests
+        load_backend(BACKEND).create_partitions()
     test_delete_all_event(1)
     test_delete_one_event(2)
     test_register_event(3)
@@ -388,5 +1353,30 @@ if __name__ == '__main__':
     test_tournament (14)
     test_prevent_rematches(15)
     test_odd_players(16)
+    test_transaction(17)
+    test_register_players_bulk(18)
+    test_pair_round_avoids_rematches(19)
+    test_pair_round_matching(20)
+    test_rebuild_standings(21)
+    test_event_scoped_indexes(22)
+    test_report_round(23)
+    test_standings_cache(24)
+    test_tiebreaks(25)
+    test_simulation(26)
+    test_export(27)
+    test_standings_snapshots(28)
+    test_metrics(29)
+    test_concurrent_pairings(30)
+    test_pair_events(31)
+    test_search_players(32)
+    test_purge_events(33)
+    test_event_partitions(34)
+    test_have_played(35)
+    test_read_replica(36)
+    test_standings_feed(37)
+    test_journal(38)
+    test_cache_expiry(39)
+    test_async_parity(40)
+    test_pair_events_busy_pool(41)
     print ("Success!  All tests pass!")
 
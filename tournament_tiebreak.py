@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+#
+# tournament_tiebreak.py -- tiebreak scores of the Swiss standings
+#
+# Every tiebreak is computed in a single pass over the matches of the
+# event, using arrays with the score of every player, so the cost is
+# O(players + matches) whatever the number of tiebreaks.
+
+
+# Tiebreaks accepted by player_standings, in the order they can be asked
+TIEBREAKS = ("omw", "buchholz", "sonneborn_berger")
+
+# Lowest match-win percentage counted for an opponent in OMW
+OMW_FLOOR = 1.0 / 3.0
+
+
+def compute_tiebreaks(standings, matches, tiebreaks):
+    """Adds tiebreak scores to the standings and sorts them accordingly.
+
+    Supported tiebreaks:
+      omw: Opponents' Match-Win percentage, the average over the opponents
+           of their points per match played, never less than one third.
+      buchholz: sum of the points of the opponents.
+      sonneborn_berger: sum over the matches of the points obtained times
+                        the points of the opponent.
+
+    Args:
+      standings: list of (id, name, points, matches) rows.
+      matches: iterable of (player_one, player_one_score, player_two,
+               player_two_score) tuples of the event.
+      tiebreaks: list of tiebreak names, applied in order.
+    Returns:
+      A list of tuples (id, name, points, matches, tiebreak1, ...) sorted by
+      points, then by each tiebreak, highest first, and then by name
+    """
+    for tiebreak in tiebreaks:
+        if tiebreak not in TIEBREAKS:
+            raise ValueError("Unknown tiebreak {}, expected one of: {}"
+                             .format(tiebreak, ", ".join(TIEBREAKS)))
+    n = len(standings)
+    index = dict((row[0], k) for k, row in enumerate(standings))
+    points = [row[2] or 0.0 for row in standings]
+    win_rate = [max(OMW_FLOOR, (row[2] or 0.0) / row[3]) if row[3]
+                else OMW_FLOOR for row in standings]
+
+    opponents = [0] * n
+    opponents_rate = [0.0] * n
+    buchholz = [0.0] * n
+    sonneborn_berger = [0.0] * n
+    for player_one, player_one_score, player_two, player_two_score \
+            in matches:
+        i = index.get(player_one)
+        j = index.get(player_two)
+        if i is None or j is None:
+            continue
+        opponents[i] += 1
+        opponents[j] += 1
+        opponents_rate[i] += win_rate[j]
+        opponents_rate[j] += win_rate[i]
+        buchholz[i] += points[j]
+        buchholz[j] += points[i]
+        sonneborn_berger[i] += (player_one_score or 0.0) * points[j]
+        sonneborn_berger[j] += (player_two_score or 0.0) * points[i]
+
+    scores = {
+        "omw": [opponents_rate[k] / opponents[k] if opponents[k] else 0.0
+                for k in range(n)],
+        "buchholz": buchholz,
+        "sonneborn_berger": sonneborn_berger,
+    }
+    rows = [tuple(standings[k][:4]) +
+            tuple(scores[tiebreak][k] for tiebreak in tiebreaks)
+            for k in range(n)]
+    rows.sort(key=lambda row: (-(row[2] or 0.0),) +
+              tuple(-score for score in row[4:]) + (row[1],))
+    return rows